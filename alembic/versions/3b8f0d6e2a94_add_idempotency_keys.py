@@ -0,0 +1,52 @@
+"""Add idempotency_keys
+
+Revision ID: 3b8f0d6e2a94
+Revises: a96d4e2c1b73
+Create Date: 2026-10-19 20:31:55.910284
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8f0d6e2a94'
+down_revision: Union[str, None] = 'a96d4e2c1b73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('idempotency_keys',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('key', sa.String(length=255), nullable=False),
+                    sa.Column('method', sa.String(length=10), nullable=False),
+                    sa.Column('path', sa.String(length=255), nullable=False),
+                    sa.Column('fingerprint', sa.String(
+                        length=64), nullable=False),
+                    sa.Column('status', sa.String(length=20), nullable=False),
+                    sa.Column('response_status', sa.Integer(), nullable=True),
+                    sa.Column('response_headers', sa.Text(), nullable=True),
+                    sa.Column('response_body', sa.LargeBinary(), nullable=True),
+                    sa.Column('created_at', sa.DateTime(), nullable=True),
+                    sa.Column('expires_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('key', 'method', 'path',
+                                        name='uq_idempotency_keys_key_request')
+                    )
+    op.create_index(op.f('ix_idempotency_keys_id'),
+                    'idempotency_keys', ['id'], unique=False)
+    op.create_index(op.f('ix_idempotency_keys_expires_at'),
+                    'idempotency_keys', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_idempotency_keys_expires_at'),
+                  table_name='idempotency_keys')
+    op.drop_index(op.f('ix_idempotency_keys_id'),
+                  table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,40 @@
+"""Persist retention executor activities
+
+Revision ID: 4b7e2c91d0a3
+Revises: ce004d55b6b4
+Create Date: 2026-10-19 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b7e2c91d0a3'
+down_revision: Union[str, None] = 'ce004d55b6b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('activities', sa.Column(
+        'kind', sa.String(length=30), nullable=True))
+    op.execute("UPDATE activities SET kind = 'activity_complete' WHERE kind IS NULL")
+    op.alter_column('activities', 'kind', nullable=False)
+    op.add_column('activities', sa.Column(
+        'merchant_id', sa.String(length=50), nullable=True))
+    op.add_column('activities', sa.Column('details', sa.Text(), nullable=True))
+    op.create_index('ix_activities_kind_merchant_created', 'activities',
+                    ['kind', 'merchant_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_activities_kind_merchant_created',
+                  table_name='activities')
+    op.drop_column('activities', 'details')
+    op.drop_column('activities', 'merchant_id')
+    op.drop_column('activities', 'kind')
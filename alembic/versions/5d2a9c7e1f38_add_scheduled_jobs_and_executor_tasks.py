@@ -0,0 +1,60 @@
+"""Add scheduled_jobs and executor_tasks
+
+Revision ID: 5d2a9c7e1f38
+Revises: 8c1e5a7d4f26
+Create Date: 2026-10-19 23:12:05.406217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2a9c7e1f38'
+down_revision: Union[str, None] = '8c1e5a7d4f26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('scheduled_jobs',
+                    sa.Column('name', sa.String(length=100), nullable=False),
+                    sa.Column('interval_seconds', sa.Integer(), nullable=False),
+                    sa.Column('next_run_at', sa.DateTime(), nullable=False),
+                    sa.Column('lease_owner', sa.String(length=100), nullable=True),
+                    sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+                    sa.Column('last_started_at', sa.DateTime(), nullable=True),
+                    sa.Column('last_finished_at', sa.DateTime(), nullable=True),
+                    sa.Column('last_status', sa.String(length=20), nullable=True),
+                    sa.Column('last_error', sa.Text(), nullable=True),
+                    sa.Column('run_count', sa.Integer(), nullable=False),
+                    sa.PrimaryKeyConstraint('name')
+                    )
+    op.create_table('executor_tasks',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('executor_id', sa.String(length=100), nullable=False),
+                    sa.Column('day', sa.Date(), nullable=False),
+                    sa.Column('kind', sa.String(length=20), nullable=False),
+                    sa.Column('item_key', sa.String(length=100), nullable=False),
+                    sa.Column('title', sa.String(length=200), nullable=False),
+                    sa.Column('merchant_id', sa.String(length=50), nullable=True),
+                    sa.Column('priority', sa.String(length=10), nullable=False),
+                    sa.Column('due_at', sa.DateTime(), nullable=True),
+                    sa.Column('source_activity_id', sa.Integer(), nullable=True),
+                    sa.Column('computed_at', sa.DateTime(), nullable=False),
+                    sa.ForeignKeyConstraint(['source_activity_id'], ['activities.id'], ),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('executor_id', 'day', 'kind', 'item_key',
+                                        name='uq_executor_tasks_item')
+                    )
+    op.create_index(op.f('ix_executor_tasks_id'), 'executor_tasks', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_executor_tasks_id'), table_name='executor_tasks')
+    op.drop_table('executor_tasks')
+    op.drop_table('scheduled_jobs')
@@ -0,0 +1,48 @@
+"""Add export_jobs for background report exports
+
+Revision ID: 5f2d8b3e6a17
+Revises: e1a5c07b9f24
+Create Date: 2026-10-19 14:02:41.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f2d8b3e6a17'
+down_revision: Union[str, None] = 'e1a5c07b9f24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('export_jobs',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('report_type', sa.String(
+                        length=30), nullable=False),
+                    sa.Column('format', sa.String(length=10), nullable=False),
+                    sa.Column('filters', sa.Text(), nullable=True),
+                    sa.Column('title', sa.String(length=200), nullable=True),
+                    sa.Column('summary', sa.Text(), nullable=True),
+                    sa.Column('file_name', sa.String(
+                        length=200), nullable=True),
+                    sa.Column('status', sa.String(length=20), nullable=False),
+                    sa.Column('row_count', sa.Integer(), nullable=True),
+                    sa.Column('error', sa.String(length=500), nullable=True),
+                    sa.Column('created_at', sa.DateTime(), nullable=True),
+                    sa.Column('started_at', sa.DateTime(), nullable=True),
+                    sa.Column('finished_at', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index(op.f('ix_export_jobs_id'),
+                    'export_jobs', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_export_jobs_id'), table_name='export_jobs')
+    op.drop_table('export_jobs')
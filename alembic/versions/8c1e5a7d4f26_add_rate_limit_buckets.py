@@ -0,0 +1,37 @@
+"""Add rate_limit_buckets
+
+Revision ID: 8c1e5a7d4f26
+Revises: 3b8f0d6e2a94
+Create Date: 2026-10-19 21:47:30.118642
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1e5a7d4f26'
+down_revision: Union[str, None] = '3b8f0d6e2a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('rate_limit_buckets',
+                    sa.Column('key', sa.String(length=150), nullable=False),
+                    sa.Column('tokens', sa.Float(), nullable=False),
+                    sa.Column('capacity', sa.Float(), nullable=False),
+                    sa.Column('rate', sa.Float(), nullable=False),
+                    sa.Column('cost', sa.Float(), nullable=False),
+                    sa.Column('allowed', sa.Boolean(), nullable=False),
+                    sa.Column('updated_at', sa.Float(), nullable=False),
+                    sa.PrimaryKeyConstraint('key')
+                    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('rate_limit_buckets')
@@ -0,0 +1,33 @@
+"""Add client_id idempotency key to activities
+
+Revision ID: 9d3f61a8c2e5
+Revises: 4b7e2c91d0a3
+Create Date: 2026-10-19 11:03:17.284960
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d3f61a8c2e5'
+down_revision: Union[str, None] = '4b7e2c91d0a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('activities', sa.Column(
+        'client_id', sa.String(length=64), nullable=True))
+    op.create_unique_constraint(
+        'uq_activities_client_id', 'activities', ['client_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_activities_client_id',
+                       'activities', type_='unique')
+    op.drop_column('activities', 'client_id')
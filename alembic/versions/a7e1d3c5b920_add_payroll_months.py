@@ -0,0 +1,32 @@
+"""Add payroll_months lock rows for payroll runs
+
+Revision ID: a7e1d3c5b920
+Revises: f4c2a8d6e913
+Create Date: 2026-10-19 21:42:51.104862
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7e1d3c5b920'
+down_revision: Union[str, None] = 'f4c2a8d6e913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('payroll_months',
+                    sa.Column('month', sa.String(length=7), nullable=False),
+                    sa.Column('created_at', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('month')
+                    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('payroll_months')
@@ -0,0 +1,83 @@
+"""Add leave ledger, balance heads and leave application versioning
+
+Revision ID: a96d4e2c1b73
+Revises: e7c3a915b0d2
+Create Date: 2026-10-19 19:12:06.483190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a96d4e2c1b73'
+down_revision: Union[str, None] = 'e7c3a915b0d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('leave_applications', sa.Column(
+        'version', sa.Integer(), nullable=False, server_default='1'))
+    op.create_index('ix_leave_applications_employee_dates', 'leave_applications',
+                    ['employee_id', 'from_date', 'to_date'], unique=False)
+    op.create_table('leave_balances',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('employee_id', sa.String(
+                        length=50), nullable=False),
+                    sa.Column('leave_type', sa.String(
+                        length=50), nullable=False),
+                    sa.Column('balance', sa.Integer(), nullable=False),
+                    sa.Column('reserved', sa.Integer(), nullable=False),
+                    sa.Column('last_entry_id', sa.Integer(), nullable=True),
+                    sa.Column('version', sa.Integer(), nullable=False),
+                    sa.Column('updated_at', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint(
+                        'employee_id', 'leave_type', name='uq_leave_balances_employee_type')
+                    )
+    op.create_index(op.f('ix_leave_balances_id'),
+                    'leave_balances', ['id'], unique=False)
+    op.create_table('leave_ledger',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('employee_id', sa.String(
+                        length=50), nullable=False),
+                    sa.Column('leave_type', sa.String(
+                        length=50), nullable=False),
+                    sa.Column('entry_type', sa.String(
+                        length=20), nullable=False),
+                    sa.Column('days', sa.Integer(), nullable=False),
+                    sa.Column('balance_after', sa.Integer(), nullable=False),
+                    sa.Column('leave_application_id',
+                              sa.Integer(), nullable=True),
+                    sa.Column('note', sa.String(length=500), nullable=True),
+                    sa.Column('created_by', sa.String(
+                        length=100), nullable=True),
+                    sa.Column('created_at', sa.DateTime(), nullable=True),
+                    sa.ForeignKeyConstraint(['leave_application_id'], [
+                                            'leave_applications.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index(op.f('ix_leave_ledger_id'),
+                    'leave_ledger', ['id'], unique=False)
+    op.create_index(op.f('ix_leave_ledger_leave_application_id'),
+                    'leave_ledger', ['leave_application_id'], unique=False)
+    op.create_index('ix_leave_ledger_employee_type', 'leave_ledger',
+                    ['employee_id', 'leave_type', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_leave_ledger_employee_type', table_name='leave_ledger')
+    op.drop_index(op.f('ix_leave_ledger_leave_application_id'),
+                  table_name='leave_ledger')
+    op.drop_index(op.f('ix_leave_ledger_id'), table_name='leave_ledger')
+    op.drop_table('leave_ledger')
+    op.drop_index(op.f('ix_leave_balances_id'), table_name='leave_balances')
+    op.drop_table('leave_balances')
+    op.drop_index('ix_leave_applications_employee_dates',
+                  table_name='leave_applications')
+    op.drop_column('leave_applications', 'version')
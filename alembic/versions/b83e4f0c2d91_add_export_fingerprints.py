@@ -0,0 +1,37 @@
+"""Add export fingerprints and updated_at data versions
+
+Revision ID: b83e4f0c2d91
+Revises: 5f2d8b3e6a17
+Create Date: 2026-10-19 15:10:27.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b83e4f0c2d91'
+down_revision: Union[str, None] = '5f2d8b3e6a17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('export_jobs', sa.Column(
+        'fingerprint', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_export_jobs_fingerprint'),
+                    'export_jobs', ['fingerprint'], unique=False)
+    for table in ('attendance_records', 'payslips', 'sales_records'):
+        op.add_column(table, sa.Column(
+            'updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ('attendance_records', 'payslips', 'sales_records'):
+        op.drop_column(table, 'updated_at')
+    op.drop_index(op.f('ix_export_jobs_fingerprint'), table_name='export_jobs')
+    op.drop_column('export_jobs', 'fingerprint')
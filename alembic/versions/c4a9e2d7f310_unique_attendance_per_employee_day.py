@@ -0,0 +1,33 @@
+"""One attendance_records row per employee and day
+
+Revision ID: c4a9e2d7f310
+Revises: b83e4f0c2d91
+Create Date: 2026-10-19 16:04:52.117930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4a9e2d7f310'
+down_revision: Union[str, None] = 'b83e4f0c2d91'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # keep the latest row where seed data has several for the same day
+    op.execute(
+        "DELETE FROM attendance_records WHERE id NOT IN "
+        "(SELECT keep_id FROM (SELECT MAX(id) AS keep_id FROM attendance_records GROUP BY employee_id, date) AS latest)")
+    op.create_unique_constraint('uq_attendance_employee_date',
+                                'attendance_records', ['employee_id', 'date'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_attendance_employee_date',
+                       'attendance_records', type_='unique')
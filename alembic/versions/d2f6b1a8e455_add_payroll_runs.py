@@ -0,0 +1,63 @@
+"""Add payroll_runs and computed payslip amounts
+
+Revision ID: d2f6b1a8e455
+Revises: c4a9e2d7f310
+Create Date: 2026-10-19 16:48:13.502871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f6b1a8e455'
+down_revision: Union[str, None] = 'c4a9e2d7f310'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('payroll_runs',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('month', sa.String(length=7), nullable=False),
+                    sa.Column('dry_run', sa.Boolean(), nullable=False),
+                    sa.Column('status', sa.String(length=20), nullable=False),
+                    sa.Column('employee_count', sa.Integer(), nullable=True),
+                    sa.Column('total_gross', sa.Integer(), nullable=True),
+                    sa.Column('total_deductions',
+                              sa.Integer(), nullable=True),
+                    sa.Column('total_net', sa.Integer(), nullable=True),
+                    sa.Column('created_at', sa.DateTime(), nullable=True),
+                    sa.Column('finished_at', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index(op.f('ix_payroll_runs_id'),
+                    'payroll_runs', ['id'], unique=False)
+    op.create_index(op.f('ix_payroll_runs_month'),
+                    'payroll_runs', ['month'], unique=False)
+    op.add_column('payslips', sa.Column(
+        'payroll_run_id', sa.Integer(), nullable=True))
+    op.add_column('payslips', sa.Column(
+        'gross_amount', sa.Integer(), nullable=True))
+    op.add_column('payslips', sa.Column(
+        'deductions', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_payslips_payroll_run_id'),
+                    'payslips', ['payroll_run_id'], unique=False)
+    op.create_foreign_key('fk_payslips_payroll_run_id', 'payslips',
+                          'payroll_runs', ['payroll_run_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('fk_payslips_payroll_run_id',
+                       'payslips', type_='foreignkey')
+    op.drop_index(op.f('ix_payslips_payroll_run_id'), table_name='payslips')
+    op.drop_column('payslips', 'deductions')
+    op.drop_column('payslips', 'gross_amount')
+    op.drop_column('payslips', 'payroll_run_id')
+    op.drop_index(op.f('ix_payroll_runs_month'), table_name='payroll_runs')
+    op.drop_index(op.f('ix_payroll_runs_id'), table_name='payroll_runs')
+    op.drop_table('payroll_runs')
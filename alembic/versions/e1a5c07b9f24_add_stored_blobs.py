@@ -0,0 +1,43 @@
+"""Add stored_blobs for content-addressed uploads
+
+Revision ID: e1a5c07b9f24
+Revises: 9d3f61a8c2e5
+Create Date: 2026-10-19 12:26:05.771942
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a5c07b9f24'
+down_revision: Union[str, None] = '9d3f61a8c2e5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stored_blobs',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('sha256', sa.String(length=64), nullable=False),
+                    sa.Column('size_bytes', sa.Integer(), nullable=False),
+                    sa.Column('content_type', sa.String(
+                        length=100), nullable=True),
+                    sa.Column('ref_count', sa.Integer(), nullable=False),
+                    sa.Column('created_at', sa.DateTime(), nullable=True),
+                    sa.Column('last_referenced_at',
+                              sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('sha256')
+                    )
+    op.create_index(op.f('ix_stored_blobs_id'),
+                    'stored_blobs', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_stored_blobs_id'), table_name='stored_blobs')
+    op.drop_table('stored_blobs')
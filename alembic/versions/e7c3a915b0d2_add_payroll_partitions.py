@@ -0,0 +1,59 @@
+"""Add payroll_partitions for partitioned payroll runs
+
+Revision ID: e7c3a915b0d2
+Revises: d2f6b1a8e455
+Create Date: 2026-10-19 18:05:41.227310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7c3a915b0d2'
+down_revision: Union[str, None] = 'd2f6b1a8e455'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('payroll_runs', sa.Column(
+        'partition_by', sa.String(length=20), nullable=True))
+    op.add_column('payroll_runs', sa.Column(
+        'error', sa.Text(), nullable=True))
+    op.create_table('payroll_partitions',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('run_id', sa.Integer(), nullable=False),
+                    sa.Column('key', sa.String(length=100), nullable=True),
+                    sa.Column('status', sa.String(length=20), nullable=False),
+                    sa.Column('attempts', sa.Integer(), nullable=False),
+                    sa.Column('employee_count', sa.Integer(), nullable=True),
+                    sa.Column('total_gross', sa.Integer(), nullable=True),
+                    sa.Column('total_deductions',
+                              sa.Integer(), nullable=True),
+                    sa.Column('total_net', sa.Integer(), nullable=True),
+                    sa.Column('error', sa.Text(), nullable=True),
+                    sa.Column('started_at', sa.DateTime(), nullable=True),
+                    sa.Column('finished_at', sa.DateTime(), nullable=True),
+                    sa.ForeignKeyConstraint(
+                        ['run_id'], ['payroll_runs.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index(op.f('ix_payroll_partitions_id'),
+                    'payroll_partitions', ['id'], unique=False)
+    op.create_index(op.f('ix_payroll_partitions_run_id'),
+                    'payroll_partitions', ['run_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_payroll_partitions_run_id'),
+                  table_name='payroll_partitions')
+    op.drop_index(op.f('ix_payroll_partitions_id'),
+                  table_name='payroll_partitions')
+    op.drop_table('payroll_partitions')
+    op.drop_column('payroll_runs', 'error')
+    op.drop_column('payroll_runs', 'partition_by')
@@ -0,0 +1,29 @@
+"""Add payroll_partitions.heartbeat_at for stale partition recovery
+
+Revision ID: f4c2a8d6e913
+Revises: 5d2a9c7e1f38
+Create Date: 2026-10-19 21:14:08.530117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c2a8d6e913'
+down_revision: Union[str, None] = '5d2a9c7e1f38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('payroll_partitions', sa.Column(
+        'heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('payroll_partitions', 'heartbeat_at')
@@ -0,0 +1,506 @@
+"""Shared cache for handler results.
+
+Read-mostly handlers (menu trees, employee status, sales summaries) are
+decorated with cached(), which keys the result on the request path plus the
+query parameters the handler declares, sorted and with empty values dropped
+(so ?role=a&company_type=b, ?company_type=b&role=a&_=123 share an entry):
+
+    @app.get("/api/leave/balance")
+    @cache.cached(ttl=60, tags=("employee:{employee_id}",))
+    def get_leave_balance(employee_id: str = Query(...), db: Session = Depends(get_db)): ...
+
+Tags are formatted from the handler's arguments; a call whose tags cannot be
+filled in (e.g. no employee_id) is not cached. invalidate("employee:E1") bumps
+the tag's version, and entries written under an older version are misses from
+then on, including entries whose computation was already running when the
+data changed. Call it after the commit that changes the data; writers that
+touch employee rows (leave, punches, imports) invalidate "employee:<id>".
+
+Only successful results are stored: 2xx responses, and dicts whose "status"
+is not "error". Identical concurrent requests are coalesced (SingleFlight):
+one computes while the others in the process wait for its result, whether or
+not it gets cached, so a wave of requests for the same menu costs one query.
+Across processes a miss's leader holds a short lock entry and the other
+workers poll for the result (up to CACHE_LOCK_TIMEOUT, then compute
+themselves). Reads that must stay fresh can be coalesced without caching:
+
+    @app.get("/api/attendance/history")
+    @cache.coalesced()
+    def get_attendance_history(employee_id: str = Query(None), db: Session = Depends(get_db)): ...
+
+Handlers must be sync (they run in the threadpool, as FastAPI runs sync
+handlers) and must not depend on headers or the body, which are not part of
+the key.
+
+Backends: "memory://" is a per-process LRU; "redis://host:port/db" is any
+server speaking the Redis protocol (Redis, Valkey, KeyDB, ...) and is shared
+by every worker and host pointed at it. If the backend is unreachable handlers
+run uncached (the backend is not retried for BACKEND_RETRY_SECONDS).
+
+Settings (environment variables):
+- CACHE_ENABLED: default true
+- CACHE_URL: memory:// (default) or redis://[:password@]host[:port][/db]
+- CACHE_TTL: default entry lifetime in seconds (default 60)
+- CACHE_MAX_ENTRIES: memory backend size (default 10000)
+- CACHE_LOCK_TIMEOUT: seconds a request waits for an identical one's result (default 5)
+- CACHE_KEY_PREFIX: namespace for shared backends (default "hr:")
+"""
+import base64
+import functools
+import inspect
+import json
+import logging
+import os
+import socket
+import string
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlencode, urlsplit
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+CACHE_URL = os.getenv("CACHE_URL", "memory://")
+DEFAULT_TTL = float(os.getenv("CACHE_TTL", "60"))
+MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", "5"))
+KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "hr:")
+BACKEND_RETRY_SECONDS = 30
+POLL_INTERVAL = 0.05
+SOCKET_TIMEOUT = 1.0
+# response headers that make a response per-client
+UNCACHEABLE_HEADERS = {b"set-cookie"}
+
+
+class CacheError(Exception):
+    pass
+
+
+class MemoryBackend:
+    """Per-process LRU with expiry. Tag versions are kept apart and never evicted."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str, now: float) -> Optional[bytes]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        if item[0] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return item[1]
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        now = time.monotonic()
+        with self._lock:
+            return [str(self._counters[key]).encode() if key in self._counters else self._live(key, now)
+                    for key in keys]
+
+    def _store(self, key: str, value: bytes, ttl: float, now: float):
+        self._entries[key] = (now + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._store(key, value, ttl, time.monotonic())
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._store(key, value, ttl, now)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr_many(self, keys: Sequence[str]) -> List[int]:
+        with self._lock:
+            for key in keys:
+                self._counters[key] = self._counters.get(key, 0) + 1
+            return [self._counters[key] for key in keys]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class RedisBackend:
+    """Minimal Redis protocol (RESP2) client: one connection per thread, pipelined commands."""
+
+    def __init__(self, url: str, timeout: float = SOCKET_TIMEOUT):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.strip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock, self._local.reader = sock, sock.makefile("rb")
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            self._pipeline(setup)
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = self._local.reader = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _encode(command: Iterable) -> bytes:
+        parts = [arg if isinstance(arg, bytes) else str(arg).encode() for arg in command]
+        out = [b"*%d\r\n" % len(parts)]
+        for part in parts:
+            out.append(b"$%d\r\n%s\r\n" % (len(part), part))
+        return b"".join(out)
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by cache server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return CacheError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._local.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection closed by cache server")
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise CacheError(f"Unexpected reply from cache server: {line[:50]!r}")
+
+    def _pipeline(self, commands: List[tuple]) -> list:
+        if getattr(self._local, "sock", None) is None:
+            self._connect()
+        try:
+            self._local.sock.sendall(b"".join(self._encode(c) for c in commands))
+            replies = [self._read_reply() for _ in commands]
+        except (OSError, ValueError):
+            self._close()
+            raise
+        error = next((r for r in replies if isinstance(r, CacheError)), None)
+        if error is not None:
+            raise error
+        return replies
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return self._pipeline([("MGET", *keys)])[0]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._pipeline([("SET", key, value, "PX", max(1, int(ttl * 1000)))])
+
+    def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return self._pipeline([("SET", key, value, "PX", max(1, int(ttl * 1000)), "NX")])[0] == "OK"
+
+    def delete(self, key: str):
+        self._pipeline([("DEL", key)])
+
+    def incr_many(self, keys: Sequence[str]) -> List[int]:
+        return self._pipeline([("INCR", key) for key in keys])
+
+
+def backend_from_url(url: str):
+    scheme = urlsplit(url).scheme
+    if scheme == "memory":
+        return MemoryBackend()
+    if scheme == "redis":
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported CACHE_URL scheme: {scheme!r}")
+
+
+def _encode_result(result) -> Optional[dict]:
+    """JSON-safe copy of a handler result, or None when it cannot be replayed."""
+    if isinstance(result, Response):
+        if (getattr(result, "body", None) is None
+                or any(k in UNCACHEABLE_HEADERS for k, _ in result.raw_headers)):
+            return None  # streamed / file responses, per-client responses
+        return {"response": {
+            "status": result.status_code,
+            "headers": [[k.decode("latin-1"), v.decode("latin-1")] for k, v in result.raw_headers
+                        if k != b"content-length"],
+            "body": base64.b64encode(result.body).decode(),
+        }}
+    return {"json": jsonable_encoder(result)}
+
+
+def _storable(payload: dict) -> bool:
+    if "response" in payload:
+        return 200 <= payload["response"]["status"] < 300
+    data = payload["json"]
+    return not (isinstance(data, dict) and data.get("status") == "error")
+
+
+def _decode_result(payload: dict):
+    if "json" in payload:
+        return payload["json"]
+    response = Response(content=base64.b64decode(payload["response"]["body"]),
+                        status_code=payload["response"]["status"])
+    response.raw_headers[:] = [(k.encode("latin-1"), v.encode("latin-1"))
+                               for k, v in payload["response"]["headers"]]
+    response.raw_headers.append((b"content-length", str(len(response.body)).encode()))
+    return response
+
+
+def normalized_key(path: str, query_items: Iterable[Tuple[str, str]], names: Iterable[str]) -> str:
+    """path?query with only the named parameters, sorted, empty values dropped."""
+    wanted = set(names)
+    params = sorted((k, v) for k, v in query_items if k in wanted and v != "")
+    return f"{path}?{urlencode(params)}" if params else path
+
+
+def _format_tags(templates: Sequence[str], arguments: dict) -> Optional[List[str]]:
+    tags = []
+    for template in templates:
+        fields = [name for _, name, _, _ in string.Formatter().parse(template) if name]
+        if any(arguments.get(name) in (None, "") for name in fields):
+            return None
+        tags.append(template.format(**arguments))
+    return tags
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.followers = 0
+        self.payload: Optional[dict] = None
+
+
+class SingleFlight:
+    """Concurrent calls for the same key (in this process) share one computation.
+
+    The first caller computes; callers arriving while it runs wait (up to
+    timeout) and get a copy of its result, errors included. If it raises or
+    its result cannot be copied, they compute for themselves.
+    """
+
+    def __init__(self, timeout: float = LOCK_TIMEOUT):
+        self.timeout = timeout
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, compute: Callable):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.followers += 1
+        if not leader:
+            if flight.done.wait(self.timeout) and flight.payload is not None:
+                return _decode_result(flight.payload)
+            return compute()
+        try:
+            result = compute()
+        except BaseException:
+            self._land(key, flight)
+            raise
+        self._land(key, flight, result)
+        return result
+
+    def _land(self, key: str, flight: _Flight, *result):
+        with self._lock:
+            del self._flights[key]
+        try:
+            # nobody can join once the flight is out of the table
+            if result and flight.followers:
+                flight.payload = _encode_result(result[0])
+        except Exception as e:
+            logger.warning("Could not share result for %s: %s", key, e)
+        finally:
+            flight.done.set()
+
+
+def _wrap_handler(func, run: Callable):
+    """Wrap a sync handler so that run(key, call, arguments) makes the call.
+
+    The wrapper asks FastAPI for the Request (unless the handler already takes
+    one) to build the key from the path and the handler's declared parameters.
+    """
+    if inspect.iscoroutinefunction(func):
+        raise TypeError("cached() / coalesced() support sync handlers only")
+    signature = inspect.signature(func)
+    request_param = next((p.name for p in signature.parameters.values() if p.annotation is Request), None)
+    injected = request_param is None
+    parameters = list(signature.parameters.values())
+    if injected:
+        request_param = "_cache_request"
+        parameters.append(inspect.Parameter(request_param, inspect.Parameter.KEYWORD_ONLY, annotation=Request))
+    names = [p.name for p in signature.parameters.values()]
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        request = kwargs.pop(request_param) if injected else kwargs[request_param]
+        key = normalized_key(request.url.path, request.query_params.multi_items(), names)
+        return run(key, functools.partial(func, *args, **kwargs), kwargs)
+
+    wrapper.__signature__ = signature.replace(parameters=parameters)
+    return wrapper
+
+
+class Cache:
+    def __init__(self, backend=None, prefix: str = KEY_PREFIX):
+        self._backend = backend
+        self.prefix = prefix
+        self._down_until = 0.0
+        self.flights = SingleFlight()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = backend_from_url(CACHE_URL)
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        self._backend = backend
+        self._down_until = 0.0
+
+    def _call(self, method: str, *args):
+        """Run a backend call; raises CacheError (and backs off) when the backend fails."""
+        if time.monotonic() < self._down_until:
+            raise CacheError("cache backend unavailable")
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            self._down_until = time.monotonic() + BACKEND_RETRY_SECONDS
+            logger.warning("Cache backend unavailable, not caching for %ds: %s", BACKEND_RETRY_SECONDS, e)
+            raise CacheError(str(e)) from e
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}tag:{tag}"
+
+    def _read(self, key: str, tags: List[str]) -> Tuple[Optional[dict], Dict[str, Optional[str]]]:
+        """(cached payload if fresh, current tag versions) in one round trip."""
+        raw, *versions = self._call("get_many", [self.prefix + key] + [self._tag_key(t) for t in tags])
+        current = {tag: v.decode() if v is not None else None for tag, v in zip(tags, versions)}
+        if raw is None:
+            return None, current
+        entry = json.loads(raw)
+        return (entry["payload"] if entry["tags"] == current else None), current
+
+    def invalidate(self, *tags: str):
+        """Expire every entry cached under any of tags."""
+        if not tags:
+            return
+        try:
+            self._call("incr_many", [self._tag_key(tag) for tag in tags])
+        except CacheError:
+            logger.warning("Could not invalidate %d cache tag(s) (%s, ...); entries expire with their TTL",
+                           len(tags), tags[0])
+
+    def get_or_compute(self, key: str, compute: Callable, ttl: float = None, tags: Sequence[str] = ()):
+        ttl = DEFAULT_TTL if ttl is None else ttl
+        return self.flights.do(key, lambda: self._get_or_compute(key, compute, ttl, list(tags)))
+
+    def _get_or_compute(self, key: str, compute: Callable, ttl: float, tags: List[str]):
+        try:
+            payload, versions = self._read(key, tags)
+        except CacheError:
+            return compute()
+        if payload is not None:
+            return _decode_result(payload)
+        return self._lead(key, compute, ttl, tags, versions)
+
+    def _lead(self, key: str, compute: Callable, ttl: float, tags: List[str], versions: dict):
+        """Compute and store key once across processes sharing the backend."""
+        lock_key = f"{self.prefix}lock:{key}"
+        try:
+            locked = self._call("add", lock_key, b"1", LOCK_TIMEOUT)
+        except CacheError:
+            return compute()
+        if not locked:
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                try:
+                    payload, versions = self._read(key, tags)
+                except CacheError:
+                    break
+                if payload is not None:
+                    return _decode_result(payload)
+        try:
+            result = compute()
+            payload = _encode_result(result)
+            if payload is not None and _storable(payload):
+                entry = json.dumps({"tags": versions, "payload": payload}, separators=(",", ":"))
+                self._call("set", self.prefix + key, entry.encode(), ttl)
+            return result
+        except CacheError:
+            return result
+        finally:
+            if locked:
+                try:
+                    self._call("delete", lock_key)
+                except CacheError:
+                    pass
+
+    def cached(self, ttl: float = None, tags: Sequence[str] = ()):
+        """Decorator caching a sync FastAPI handler's result (see module docstring)."""
+        def run(key, call, arguments):
+            tag_names = _format_tags(tags, arguments)
+            if not ENABLED or tag_names is None:
+                return self.flights.do(key, call)
+            return self.get_or_compute(key, call, ttl, tag_names)
+        return lambda func: _wrap_handler(func, run)
+
+    def coalesced(self):
+        """Decorator sharing one in-flight call among identical concurrent requests, without caching."""
+        return lambda func: _wrap_handler(func, lambda key, call, arguments: self.flights.do(key, call))
+
+
+_default = Cache()
+
+
+def cached(ttl: float = None, tags: Sequence[str] = ()):
+    return _default.cached(ttl, tags)
+
+
+def coalesced():
+    return _default.coalesced()
+
+
+def invalidate(*tags: str):
+    _default.invalidate(*tags)
+
+
+def use_backend(backend):
+    """Swap the shared cache's backend (tests, or wiring one up by hand)."""
+    _default.backend = backend
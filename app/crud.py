@@ -1,3 +1,7 @@
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app import models, schemas
 
@@ -18,3 +22,42 @@ def get_merchant_sales_weekly(db: Session, merchant_id: int):
 
 def get_retention_activities(db: Session):
     return db.query(models.Activity).all()
+
+
+def get_recent_activities(db: Session, kind: str, merchant_id: str = None, limit: int = 20):
+    query = db.query(models.Activity).filter(models.Activity.kind == kind)
+    if merchant_id:
+        query = query.filter(models.Activity.merchant_id == merchant_id)
+    return query.order_by(models.Activity.created_at.desc(), models.Activity.id.desc()).limit(limit).all()
+
+
+def get_activities_by_client_ids(db: Session, client_ids):
+    if not client_ids:
+        return []
+    return db.query(models.Activity).filter(models.Activity.client_id.in_(client_ids)).all()
+
+
+def add_blob_reference(db: Session, sha256: str, size_bytes: int, content_type: str = None):
+    """Count one more reference to a stored blob, creating its row on first use (caller commits)."""
+    blob = models.StoredBlob.__table__
+    bump = update(blob).where(blob.c.sha256 == sha256).values(
+        ref_count=blob.c.ref_count + 1, last_referenced_at=datetime.utcnow())
+    if db.execute(bump).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.add(models.StoredBlob(sha256=sha256, size_bytes=size_bytes,
+                                     content_type=content_type, ref_count=1))
+    except IntegrityError:
+        # another request created the row first
+        db.execute(bump)
+
+
+def get_blob_content_type(db: Session, sha256: str):
+    return db.query(models.StoredBlob.content_type).filter(models.StoredBlob.sha256 == sha256).scalar()
+
+
+def release_blob_reference(db: Session, sha256: str):
+    blob = models.StoredBlob.__table__
+    db.execute(update(blob).where(blob.c.sha256 == sha256, blob.c.ref_count > 0).values(
+        ref_count=blob.c.ref_count - 1))
@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -46,3 +47,14 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# dialects whose INSERT supports ON CONFLICT DO UPDATE
+UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def upsert_insert(table, dialect_name: str):
+    """INSERT into table with .on_conflict_do_update(); NotImplementedError on other dialects."""
+    if dialect_name not in UPSERT_DIALECTS:
+        raise NotImplementedError(f"Upserts are not implemented for {dialect_name}")
+    return UPSERT_DIALECTS[dialect_name](table)
@@ -0,0 +1,257 @@
+"""Bulk employee import (POST /api/employees/bulk).
+
+The request body (CSV with a header row, or NDJSON - one object per line) is
+spooled to a temporary file as it arrives, then read back one row at a time:
+each row is validated, rows that pass are collected into batches of
+EMPLOYEE_IMPORT_BATCH_ROWS and loaded with COPY on PostgreSQL (a multi-row
+executemany insert elsewhere). Invalid rows, duplicate employee_ids and ids
+that already exist are reported per line instead of failing the import.
+The whole import is one transaction.
+
+Settings (environment variables):
+- EMPLOYEE_IMPORT_MAX_BYTES: largest accepted body (default 100MB)
+- EMPLOYEE_IMPORT_BATCH_ROWS: rows per COPY / insert (default 5000)
+- EMPLOYEE_IMPORT_MAX_ERRORS: row errors returned in the report (default 1000)
+"""
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+from datetime import date, datetime
+from typing import IO, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from app import cache, models
+
+MAX_IMPORT_BYTES = int(os.getenv("EMPLOYEE_IMPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+BATCH_ROWS = int(os.getenv("EMPLOYEE_IMPORT_BATCH_ROWS", "5000"))
+MAX_REPORTED_ERRORS = int(os.getenv("EMPLOYEE_IMPORT_MAX_ERRORS", "1000"))
+# spooled in memory up to this size, then on disk
+SPOOL_BYTES = 8 * 1024 * 1024
+# keeps IN (...) lists under SQLite's bound-parameter limit
+EXISTING_ID_CHUNK = 500
+
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+EMPLOYMENT_TYPES = {"Full-time", "Part-time", "Contract"}
+EMPLOYMENT_STATUSES = {"Active", "Inactive", "Terminated"}
+DATE_FIELDS = ("hire_date", "probation_end_date", "last_promotion_date")
+REQUIRED = ("employee_id", "employee_name", "email", "department",
+            "position", "employment_type", "hire_date")
+# importable columns and their maximum lengths (dates have none)
+FIELDS = {
+    "employee_id": 50, "employee_name": 100, "email": 100, "phone": 20, "department": 50,
+    "position": 100, "employment_type": 20, "employment_status": 20, "hire_date": None,
+    "reporting_manager": 100, "office_location": 100, "salary_grade": 10,
+    "probation_end_date": None, "last_promotion_date": None,
+}
+COLUMNS = list(FIELDS) + ["created_at"]
+
+
+class EmployeeImportError(Exception):
+    """The upload as a whole cannot be imported."""
+    status_code = 400
+
+
+class ImportTooLarge(EmployeeImportError):
+    status_code = 413
+
+
+async def spool_body(request) -> IO[bytes]:
+    """Copy the request body to a temporary file, enforcing MAX_IMPORT_BYTES."""
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > MAX_IMPORT_BYTES:
+        raise ImportTooLarge(f"Upload exceeds {MAX_IMPORT_BYTES} bytes")
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > MAX_IMPORT_BYTES:
+                raise ImportTooLarge(f"Upload exceeds {MAX_IMPORT_BYTES} bytes")
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def detect_format(content_type: str, fmt: Optional[str]) -> str:
+    fmt = (fmt or "").lower()
+    if not fmt:
+        content_type = (content_type or "").lower()
+        fmt = "ndjson" if "ndjson" in content_type or "jsonl" in content_type else "csv"
+    if fmt not in ("csv", "ndjson"):
+        raise EmployeeImportError("format must be csv or ndjson")
+    return fmt
+
+
+def _read_rows(text: IO[str], fmt: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Yield (line number, raw row, parse error) one row at a time."""
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        header = [h.strip() for h in (reader.fieldnames or [])]
+        unknown = [h for h in header if h not in FIELDS]
+        missing = [f for f in REQUIRED if f not in header]
+        if unknown or missing:
+            raise EmployeeImportError(
+                f"CSV header: unknown columns {unknown}, missing columns {missing}")
+        reader.fieldnames = header
+        for raw in reader:
+            if None in raw:
+                yield reader.line_num, None, "Too many fields"
+            else:
+                yield reader.line_num, raw, None
+        return
+    for line_num, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            raw = json.loads(line)
+        except ValueError as e:
+            yield line_num, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(raw, dict):
+            yield line_num, None, "Expected a JSON object"
+            continue
+        yield line_num, raw, None
+
+
+def validate_row(raw: dict) -> Tuple[Optional[dict], List[str]]:
+    """Return (row ready for insert, []) or (None, errors)."""
+    errors = []
+    unknown = sorted(set(raw) - set(FIELDS))
+    if unknown:
+        errors.append(f"Unknown fields: {unknown}")
+    row = {}
+    for field, max_len in FIELDS.items():
+        value = raw.get(field)
+        if value is not None and not isinstance(value, str):
+            value = str(value)
+        value = value.strip() if value else None
+        if not value:
+            if field in REQUIRED:
+                errors.append(f"{field} is required")
+            row[field] = None
+            continue
+        if field in DATE_FIELDS:
+            try:
+                value = date.fromisoformat(value)
+            except ValueError:
+                errors.append(f"{field} must be YYYY-MM-DD")
+        elif len(value) > max_len:
+            errors.append(f"{field} is longer than {max_len} characters")
+        row[field] = value
+    if row["email"] and not EMAIL_RE.fullmatch(row["email"]):
+        errors.append("email is not a valid address")
+    if row["employment_type"] and row["employment_type"] not in EMPLOYMENT_TYPES:
+        errors.append(
+            f"employment_type must be one of {sorted(EMPLOYMENT_TYPES)}")
+    row["employment_status"] = row["employment_status"] or "Active"
+    if row["employment_status"] not in EMPLOYMENT_STATUSES:
+        errors.append(
+            f"employment_status must be one of {sorted(EMPLOYMENT_STATUSES)}")
+    return (None, errors) if errors else (row, [])
+
+
+def _existing_ids(db: Session, employee_ids: List[str]) -> set:
+    existing = set()
+    for i in range(0, len(employee_ids), EXISTING_ID_CHUNK):
+        chunk = employee_ids[i:i + EXISTING_ID_CHUNK]
+        existing.update(db.execute(select(models.Employee.employee_id).where(
+            models.Employee.employee_id.in_(chunk))).scalars())
+    return existing
+
+
+def _copy_rows(db: Session, rows: List[dict]):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([row[c] for c in COLUMNS])
+    buf.seek(0)
+    # raw psycopg2 connection inside the session's transaction
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY employees ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf)
+    finally:
+        cursor.close()
+
+
+def _load_batch(db: Session, batch: List[Tuple[int, dict]], report) -> List[str]:
+    """Insert the rows whose employee_id is new; returns the inserted ids."""
+    existing = _existing_ids(db, [row["employee_id"] for _, row in batch])
+    rows = []
+    for line, row in batch:
+        if row["employee_id"] in existing:
+            report(line, row["employee_id"], ["employee_id already exists"])
+        else:
+            rows.append(row)
+    if not rows:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        _copy_rows(db, rows)
+    else:
+        db.execute(insert(models.Employee.__table__), rows)
+    return [row["employee_id"] for row in rows]
+
+
+def import_employees(db: Session, body: IO[bytes], fmt: str) -> dict:
+    """Validate and load every row of body; commits once at the end.
+
+    Raises EmployeeImportError for unreadable uploads (the transaction is rolled back).
+    """
+    errors = []
+    counts = {"received": 0, "inserted": 0, "failed": 0}
+
+    def report(line, employee_id, messages):
+        counts["failed"] += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line, "employee_id": employee_id, "errors": messages})
+
+    seen = set()
+    batch = []
+    inserted = []
+    now = datetime.utcnow()
+    text = io.TextIOWrapper(body, encoding="utf-8-sig", newline="")
+    try:
+        for line, raw, parse_error in _read_rows(text, fmt):
+            counts["received"] += 1
+            if parse_error:
+                report(line, None, [parse_error])
+                continue
+            row, row_errors = validate_row(raw)
+            if row_errors:
+                report(line, raw.get("employee_id"), row_errors)
+                continue
+            if row["employee_id"] in seen:
+                report(line, row["employee_id"], ["Duplicate employee_id in upload"])
+                continue
+            seen.add(row["employee_id"])
+            row["created_at"] = now
+            batch.append((line, row))
+            if len(batch) >= BATCH_ROWS:
+                inserted += _load_batch(db, batch, report)
+                batch = []
+        if batch:
+            inserted += _load_batch(db, batch, report)
+        db.commit()
+    except UnicodeDecodeError:
+        db.rollback()
+        raise EmployeeImportError("Upload must be UTF-8 encoded")
+    except (EmployeeImportError, csv.Error) as e:
+        db.rollback()
+        raise EmployeeImportError(str(e))
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        text.detach()
+    counts["inserted"] = len(inserted)
+    # status looked up before the import may be cached
+    cache.invalidate(*(f"employee:{employee_id}" for employee_id in inserted))
+    return {**counts, "errors": errors, "errors_truncated": counts["failed"] > len(errors)}
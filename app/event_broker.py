@@ -0,0 +1,92 @@
+"""In-process pub/sub broker for per-merchant notification streams.
+
+Subscribers (one per SSE connection) get a bounded asyncio queue bound to the
+event loop that created it. publish() may be called from any thread - sync
+handlers run in the threadpool - and hands events to each subscriber's loop
+with call_soon_threadsafe. When a subscriber falls behind, its oldest event
+is dropped so a stalled connection can never grow memory without bound.
+
+Settings (environment variables):
+- SSE_QUEUE_SIZE: events buffered per connection (default 100)
+- SSE_HEARTBEAT_SECONDS: idle interval before a heartbeat frame (default 15)
+"""
+import asyncio
+import itertools
+import json
+import os
+import threading
+from typing import Any, Dict
+
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+
+class Subscription:
+    def __init__(self, merchant_id: str, maxsize: int):
+        self.merchant_id = merchant_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def _offer(self, event: Dict[str, Any]):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float):
+        """Next event, or None if nothing arrived within timeout."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broker:
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, merchant_id: str, maxsize: int = None) -> Subscription:
+        """Create a subscription; must be called from inside the event loop."""
+        sub = Subscription(merchant_id, maxsize or SSE_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(merchant_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            subs = self._subscribers.get(sub.merchant_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.merchant_id]
+
+    def subscriber_count(self, merchant_id: str) -> int:
+        with self._lock:
+            return len(self._subscribers.get(merchant_id, ()))
+
+    def publish(self, merchant_id: str, event_type: str, data: Any) -> int:
+        """Deliver an event to every subscriber of merchant_id; returns how many."""
+        with self._lock:
+            subs = list(self._subscribers.get(merchant_id, ()))
+        event = {"id": next(self._ids), "event": event_type, "data": data}
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub._offer, event)
+            except RuntimeError:
+                # loop already closed; the connection is going away
+                self.unsubscribe(sub)
+        return len(subs)
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Serialize an event as a Server-Sent Events frame."""
+    payload = json.dumps(event["data"], ensure_ascii=False, default=str)
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {payload}\n\n"
+
+
+HEARTBEAT_FRAME = ": heartbeat\n\n"
+
+broker = Broker()
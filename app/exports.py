@@ -0,0 +1,379 @@
+"""Excel / PDF report exports, built by background jobs.
+
+queue_job() adds an export_jobs row; once the session commits, a small worker
+pool builds the file and moves it into DOWNLOAD_DIR, where download_file
+serves it. Rows are read with yield_per and written as they arrive - openpyxl
+in write-only mode, and reportlab's canvas page by page rather than a platypus
+story - so memory stays flat as the row count grows (reportlab still keeps the
+compressed page streams until save).
+
+Settings (environment variables):
+- EXPORT_WORKERS: concurrent export jobs (default 2)
+- EXPORT_BATCH_ROWS: rows fetched per database round trip (default 1000)
+- DOWNLOADS_MAX_BYTES: size budget for DOWNLOAD_DIR (default 2GiB)
+- DOWNLOADS_MAX_AGE_DAYS: files older than this are removed (default 7)
+
+After each job the oldest files are pruned until DOWNLOAD_DIR fits both limits;
+jobs whose file was removed report status "expired".
+
+Each job is fingerprinted from its report, format, filters and the version of
+the rows it covers (count, max id and max updated_at). Asking for the same
+export again while nothing changed returns the finished (or in-flight) job
+instead of building the file a second time.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+from openpyxl import Workbook
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+from sqlalchemy import event, func
+from sqlalchemy.orm import Query, Session
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_DIR = Path(os.path.join(os.getcwd(), 'downloads'))
+DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))
+DOWNLOADS_MAX_BYTES = int(os.getenv("DOWNLOADS_MAX_BYTES", str(2 * 1024 ** 3)))
+DOWNLOADS_MAX_AGE_DAYS = float(os.getenv("DOWNLOADS_MAX_AGE_DAYS", "7"))
+
+# in-flight jobs older than this are assumed lost (e.g. a restart) and not reused
+IN_FLIGHT_REUSE_SECONDS = 3600
+
+_pool = ThreadPoolExecutor(max_workers=EXPORT_WORKERS,
+                           thread_name_prefix="export")
+
+
+class Report:
+    def __init__(self, title: str, columns: Sequence[str], filters: Sequence[str],
+                 query: Callable[[Session, dict], Query], row: Callable[[object], tuple]):
+        self.title = title
+        self.columns = list(columns)
+        self.filters = set(filters)
+        self.query = query
+        self.row = row
+
+
+def _date_filter(filters: dict, key: str) -> Optional[date]:
+    value = filters.get(key)
+    return date.fromisoformat(value) if value else None
+
+
+def _attendance_query(db: Session, filters: dict) -> Query:
+    A = models.AttendanceRecord
+    q = db.query(A)
+    if filters.get("employee_id"):
+        q = q.filter(A.employee_id == filters["employee_id"])
+    if _date_filter(filters, "date_from"):
+        q = q.filter(A.date >= _date_filter(filters, "date_from"))
+    if _date_filter(filters, "date_to"):
+        q = q.filter(A.date <= _date_filter(filters, "date_to"))
+    return q.order_by(A.date, A.employee_id, A.id)
+
+
+def _payslip_query(db: Session, filters: dict) -> Query:
+    P = models.Payslip
+    q = db.query(P)
+    if filters.get("employee_id"):
+        q = q.filter(P.employee_id == filters["employee_id"])
+    if filters.get("month"):
+        q = q.filter(P.month == filters["month"])
+    return q.order_by(P.employee_id, P.id)
+
+
+def _sales_query(db: Session, filters: dict) -> Query:
+    S = models.SalesRecord
+    q = db.query(S)
+    if filters.get("merchant_id"):
+        q = q.filter(S.merchant_id == int(filters["merchant_id"]))
+    if _date_filter(filters, "date_from"):
+        q = q.filter(S.date >= _date_filter(filters, "date_from"))
+    if _date_filter(filters, "date_to"):
+        q = q.filter(S.date <= _date_filter(filters, "date_to"))
+    return q.order_by(S.date, S.id)
+
+
+def _retention_query(db: Session, filters: dict) -> Query:
+    A = models.Activity
+    q = db.query(A)
+    for key in ("kind", "merchant_id", "assigned_to"):
+        if filters.get(key):
+            q = q.filter(getattr(A, key) == filters[key])
+    if _date_filter(filters, "date_from"):
+        q = q.filter(A.created_at >= datetime.combine(
+            _date_filter(filters, "date_from"), datetime.min.time()))
+    if _date_filter(filters, "date_to"):
+        q = q.filter(A.created_at <= datetime.combine(
+            _date_filter(filters, "date_to"), datetime.max.time()))
+    return q.order_by(A.created_at, A.id)
+
+
+REPORTS = {
+    "attendance": Report(
+        "Attendance Report",
+        ["Employee ID", "Employee", "Date", "Check In",
+            "Check Out", "Working Hours", "Status", "Location"],
+        ["employee_id", "date_from", "date_to"], _attendance_query,
+        lambda r: (r.employee_id, r.employee_name, r.date, r.check_in_time, r.check_out_time, r.working_hours, r.status, r.location)),
+    "payslips": Report(
+        "Payslips Report",
+        ["Employee ID", "Employee", "Month", "Amount", "Status"],
+        ["employee_id", "month"], _payslip_query,
+        lambda r: (r.employee_id, r.employee_name, r.month, r.amount, r.status)),
+    "sales": Report(
+        "Sales Report",
+        ["Date", "Merchant ID", "Amount"],
+        ["merchant_id", "date_from", "date_to"], _sales_query,
+        lambda r: (r.date, r.merchant_id, r.amount)),
+    "retention": Report(
+        "Retention Activity Report",
+        ["Activity", "Type", "Merchant ID", "Executor", "Status", "Recorded At"],
+        ["kind", "merchant_id", "assigned_to", "date_from", "date_to"], _retention_query,
+        lambda r: (r.name, r.kind, r.merchant_id, r.assigned_to, r.status, r.created_at)),
+}
+
+
+def write_xlsx(path: Path, title: str, summary: List[Tuple[str, str]], columns: List[str], rows: Iterable[tuple]) -> int:
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=title[:31])
+    ws.append([title])
+    for label, value in summary:
+        ws.append([label, value])
+    ws.append([])
+    ws.append(columns)
+    count = 0
+    for row in rows:
+        ws.append(list(row))
+        count += 1
+    wb.save(path)
+    return count
+
+
+def write_pdf(path: Path, title: str, summary: List[Tuple[str, str]], columns: List[str], rows: Iterable[tuple]) -> int:
+    width, height = landscape(A4)
+    margin, line_height, font_size = 15 * mm, 12, 8
+    col_width = (width - 2 * margin) / len(columns)
+    max_chars = max(4, int(col_width / (font_size * 0.55)))
+    c = canvas.Canvas(str(path), pagesize=(width, height), pageCompression=1)
+    c.setTitle(title)
+
+    def cells(values, y, bold=False):
+        c.setFont("Helvetica-Bold" if bold else "Helvetica", font_size)
+        for i, value in enumerate(values):
+            text = "" if value is None else str(value)
+            if len(text) > max_chars:
+                text = text[:max_chars - 1] + "…"
+            c.drawString(margin + i * col_width, y, text)
+
+    def start_page(page):
+        c.setFont("Helvetica-Bold", 12)
+        c.drawString(margin, height - margin, title)
+        c.setFont("Helvetica", font_size)
+        c.drawRightString(width - margin, height - margin, f"Page {page}")
+        return height - margin - 2 * line_height
+
+    page = 1
+    y = start_page(page)
+    for label, value in summary:
+        c.setFont("Helvetica", 9)
+        c.drawString(margin, y, f"{label}: {value}")
+        y -= line_height
+    y -= line_height
+    cells(columns, y, bold=True)
+    y -= line_height
+
+    count = 0
+    for row in rows:
+        if y < margin:
+            c.showPage()
+            page += 1
+            y = start_page(page)
+            cells(columns, y, bold=True)
+            y -= line_height
+        cells(row, y)
+        y -= line_height
+        count += 1
+    c.save()
+    return count
+
+
+WRITERS = {"xlsx": write_xlsx, "pdf": write_pdf}
+
+
+def prune_downloads(keep: Iterable[str] = (), now: float = None) -> List[str]:
+    """Remove expired files, then the oldest ones until DOWNLOAD_DIR fits DOWNLOADS_MAX_BYTES.
+
+    Returns the removed file names. In-progress temp files count towards the
+    budget but are only removed once they are past the age limit.
+    """
+    now = now or time.time()
+    cutoff = now - DOWNLOADS_MAX_AGE_DAYS * 86400
+    keep = set(keep)
+    files = []
+    total = 0
+    for entry in os.scandir(DOWNLOAD_DIR):
+        if not entry.is_file():
+            continue
+        st = entry.stat()
+        total += st.st_size
+        if entry.name not in keep and (not entry.name.startswith(".") or st.st_mtime < cutoff):
+            files.append((st.st_mtime, st.st_size, entry.name))
+
+    removed = []
+    for mtime, size, name in sorted(files):
+        if mtime >= cutoff and total <= DOWNLOADS_MAX_BYTES:
+            break
+        try:
+            os.unlink(DOWNLOAD_DIR / name)
+        except FileNotFoundError:
+            pass
+        total -= size
+        if not name.startswith("."):
+            removed.append(name)
+    return removed
+
+
+def data_version(db: Session, report: Report, filters: dict) -> list:
+    """Cheap summary of the rows an export covers; changes whenever they do."""
+    query = report.query(db, filters).order_by(None)
+    model = query.column_descriptions[0]["entity"]
+    version_column = getattr(model, "updated_at", None) or model.created_at
+    count, max_id, max_version = query.with_entities(
+        func.count(model.id), func.max(model.id), func.max(version_column)).one()
+    return [count, max_id, max_version]
+
+
+def fingerprint(report_type: str, fmt: str, filters: dict, title: str, summary, version: list) -> str:
+    payload = json.dumps([report_type, fmt, {k: str(v) for k, v in filters.items()}, title, summary, version],
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def find_reusable_job(db: Session, fp: str) -> Optional[models.ExportJob]:
+    J = models.ExportJob
+    for job in db.query(J).filter(J.fingerprint == fp, J.status.in_(("queued", "running", "done"))).order_by(J.id.desc()):
+        if job.status == "done":
+            if (DOWNLOAD_DIR / job.file_name).is_file():
+                return job
+            job.status = "expired"
+        elif (datetime.utcnow() - job.created_at).total_seconds() < IN_FLIGHT_REUSE_SECONDS:
+            return job
+    return None
+
+
+def queue_job(db: Session, report_type: str, fmt: str, filters: dict = None, title: str = None,
+              summary: List[Tuple[str, str]] = None, file_name: str = None) -> models.ExportJob:
+    """Add an export job to the session; it starts once the session commits.
+
+    Without an explicit file_name, an existing job for the same fingerprint is
+    returned instead when its file is still current. Raises ValueError for an
+    unknown report/format or invalid filters.
+    """
+    report = REPORTS.get(report_type)
+    if report is None:
+        raise ValueError(
+            f"Unknown report type '{report_type}'; expected one of {sorted(REPORTS)}")
+    if fmt not in WRITERS:
+        raise ValueError(
+            f"Unknown format '{fmt}'; expected one of {sorted(WRITERS)}")
+    filters = {k: v for k, v in (filters or {}).items() if v not in (None, "")}
+    unknown = set(filters) - report.filters
+    if unknown:
+        raise ValueError(
+            f"Unsupported filters for {report_type}: {sorted(unknown)}")
+    # bad filter values fail here rather than in the worker
+    title = title or report.title
+    summary = summary or []
+    fp = None
+    if file_name is None:
+        fp = fingerprint(report_type, fmt, filters, title, summary,
+                         data_version(db, report, filters))
+        cached = find_reusable_job(db, fp)
+        if cached is not None:
+            return cached
+    else:
+        report.query(db, filters)
+
+    job = models.ExportJob(report_type=report_type, format=fmt, filters=json.dumps(filters), title=title,
+                           summary=json.dumps(summary), fingerprint=fp, status="queued")
+    db.add(job)
+    db.flush()
+    job.file_name = file_name or f"{report_type}_{job.id}.{fmt}"
+    bind, job_id = db.get_bind(), job.id
+    event.listen(db, "after_commit", lambda session: submit(
+        bind, job_id), once=True)
+    return job
+
+
+def submit(bind, job_id: int) -> Future:
+    return _pool.submit(run_job, bind, job_id)
+
+
+def run_job(bind, job_id: int):
+    with Session(bind=bind) as db:
+        job = db.get(models.ExportJob, job_id)
+        if job is None or job.status != "queued":
+            return
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        db.commit()
+
+        tmp = DOWNLOAD_DIR / f".{uuid.uuid4().hex}.tmp"
+        try:
+            report = REPORTS[job.report_type]
+            filters = json.loads(job.filters or "{}")
+            rows = (report.row(r) for r in report.query(
+                db, filters).yield_per(EXPORT_BATCH_ROWS))
+            summary = [tuple(line) for line in json.loads(job.summary or "[]")]
+            job.row_count = WRITERS[job.format](
+                tmp, job.title, summary, report.columns, rows)
+            os.replace(tmp, DOWNLOAD_DIR / job.file_name)
+            job.status = "done"
+        except Exception as e:
+            db.rollback()
+            tmp.unlink(missing_ok=True)
+            logger.error("Export job %s (%s) failed: %s",
+                         job_id, job.report_type, e)
+            job.status = "failed"
+            job.error = str(e)[:500]
+        job.finished_at = datetime.utcnow()
+        db.commit()
+
+        try:
+            removed = prune_downloads(keep=[job.file_name])
+            if removed:
+                db.query(models.ExportJob).filter(models.ExportJob.file_name.in_(removed)).update(
+                    {"status": "expired"}, synchronize_session=False)
+                db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error("Pruning %s failed: %s", DOWNLOAD_DIR, e)
+
+
+def job_status(job: models.ExportJob) -> dict:
+    return {
+        "job_id": job.id,
+        "report_type": job.report_type,
+        "format": job.format,
+        "status": job.status,
+        "row_count": job.row_count,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "status_url": f"/api/exports/{job.id}",
+        "download_url": f"/api/downloads/{job.file_name}" if job.status == "done" else None
+    }
@@ -0,0 +1,97 @@
+"""Group-commit writer: coalesce concurrent single-row inserts into batched transactions.
+
+Handlers call submit(bind, row) and block until their row is committed. A
+background thread drains the queue, waiting up to GROUP_COMMIT_MAX_DELAY_MS
+after the first row for others to arrive (or until GROUP_COMMIT_MAX_BATCH
+rows), then writes the batch as one multi-row INSERT ... RETURNING in a single
+transaction. A burst of end-of-day submissions therefore pays one commit per
+batch instead of one per request. If a batch fails, its rows are retried one
+at a time so a bad row only fails its own submitter.
+
+Settings (environment variables):
+- GROUP_COMMIT_MAX_BATCH: rows per transaction (default 500)
+- GROUP_COMMIT_MAX_DELAY_MS: how long to wait for more rows (default 5)
+- GROUP_COMMIT_TIMEOUT: seconds a submitter waits for its commit (default 10)
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List
+
+from sqlalchemy import Table, insert
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "500"))
+MAX_DELAY = float(os.getenv("GROUP_COMMIT_MAX_DELAY_MS", "5")) / 1000
+SUBMIT_TIMEOUT = float(os.getenv("GROUP_COMMIT_TIMEOUT", "10"))
+
+
+class GroupCommitWriter:
+    def __init__(self, table: Table, max_batch: int = None, max_delay: float = None):
+        self.table = table
+        self.max_batch = max_batch or MAX_BATCH
+        self.max_delay = MAX_DELAY if max_delay is None else max_delay
+        self.batches = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, bind, row: Dict[str, Any], timeout: float = None) -> int:
+        """Queue a row for insertion into `table` on `bind`; returns its primary key once committed."""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((bind, row, future))
+        return future.result(timeout or SUBMIT_TIMEOUT)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"group-commit-{self.table.name}", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        by_bind = {}
+        for item in batch:
+            by_bind.setdefault(item[0], []).append(item)
+        for bind, items in by_bind.items():
+            try:
+                ids = self._insert(bind, [row for _, row, _ in items])
+            except Exception as e:
+                logger.warning("Group commit of %d %s rows failed, retrying individually: %s",
+                               len(items), self.table.name, e)
+                for _, row, future in items:
+                    try:
+                        future.set_result(self._insert(bind, [row])[0])
+                    except Exception as row_error:
+                        future.set_exception(row_error)
+                continue
+            for (_, _, future), row_id in zip(items, ids):
+                future.set_result(row_id)
+
+    def _insert(self, bind, rows: List[Dict[str, Any]]) -> List[int]:
+        self.batches += 1
+        stmt = insert(self.table).returning(
+            self.table.c.id, sort_by_parameter_order=True)
+        with bind.begin() as conn:
+            return list(conn.execute(stmt, rows).scalars())
@@ -0,0 +1,247 @@
+"""Idempotency-Key support for mutating requests.
+
+A POST or PATCH carrying an Idempotency-Key header is claimed in the
+idempotency_keys table (unique per key, method and path) before the handler
+runs, and the first 2xx response is stored with it. Retries with the same key
+get the stored response back (with Idempotent-Replayed: true) instead of
+running the handler again, so double taps and network retries do not create
+duplicate leave applications, tickets or activities. While the first request
+is still running a retry gets 409; reusing a key for a different body gets
+422. Responses that are not 2xx, and JSON bodies with "status": "error" (how
+most handlers here report a failure, with 200), are not stored: the key is
+released and the request may be retried.
+
+This is a plain ASGI middleware (the body has to be read before the handler
+sees it). Bodies over IDEMPOTENCY_MAX_BODY_BYTES and responses over
+IDEMPOTENCY_MAX_RESPONSE_BYTES pass through without idempotency. The table is
+reached through get_db (dependency overrides included), like the endpoints.
+Keys expire after IDEMPOTENCY_TTL_HOURS; expired rows are purged at most once
+a minute by whichever request comes along.
+
+Settings (environment variables):
+- IDEMPOTENCY_TTL_HOURS: how long a key is remembered (default 24)
+- IDEMPOTENCY_MAX_BODY_BYTES: largest request body keyed (default 1MB)
+- IDEMPOTENCY_MAX_RESPONSE_BYTES: largest response stored (default 1MB)
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+from app import models
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+
+HEADER = "idempotency-key"
+METHODS = ("POST", "PATCH")
+TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(1024 * 1024)))
+MAX_RESPONSE_BYTES = int(os.getenv("IDEMPOTENCY_MAX_RESPONSE_BYTES", str(1024 * 1024)))
+MAX_KEY_LENGTH = 255
+# an in-progress claim older than this belongs to a request that died
+CLAIM_TIMEOUT = timedelta(minutes=5)
+PURGE_INTERVAL = 60
+# per-response headers that must not be replayed
+SKIPPED_HEADERS = {b"date", b"server", b"x-request-id"}
+
+_last_purge = 0.0
+
+
+def _session(app):
+    factory = app.dependency_overrides.get(get_db, get_db)
+    return factory()
+
+
+def fingerprint(method: str, path: str, query: bytes, body: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in (method.encode(), path.encode(), query, body):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def purge_expired(db, now: datetime = None) -> int:
+    now = now or datetime.utcnow()
+    result = db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.expires_at < now))
+    db.commit()
+    return result.rowcount
+
+
+def claim(db, key: str, method: str, path: str, request_fingerprint: str):
+    """Claim key for this request.
+
+    Returns (record id, None) when the caller should run the request, or
+    (None, stored record) when it has been seen before.
+    """
+    global _last_purge
+    K = models.IdempotencyKey
+    now = datetime.utcnow()
+    if time.monotonic() - _last_purge > PURGE_INTERVAL:
+        _last_purge = time.monotonic()
+        purge_expired(db, now)
+    for _ in range(2):
+        record = K(key=key, method=method, path=path, fingerprint=request_fingerprint,
+                   status="in_progress", created_at=now, expires_at=now + TTL)
+        db.add(record)
+        try:
+            db.commit()
+            return record.id, None
+        except IntegrityError:
+            db.rollback()
+        existing = db.query(K).filter_by(key=key, method=method, path=path).first()
+        if existing is None:
+            continue  # released meanwhile
+        stale = existing.expires_at < now or (
+            existing.status == "in_progress" and existing.created_at < now - CLAIM_TIMEOUT)
+        if not stale:
+            return None, existing
+        db.delete(existing)
+        db.commit()
+    return None, db.query(K).filter_by(key=key, method=method, path=path).first()
+
+
+def complete(db, record_id: int, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+    record = db.get(models.IdempotencyKey, record_id)
+    if record is None:
+        return
+    record.status = "completed"
+    record.response_status = status
+    record.response_headers = json.dumps([[k.decode("latin-1"), v.decode("latin-1")] for k, v in headers
+                                          if k.lower() not in SKIPPED_HEADERS])
+    record.response_body = body
+    db.commit()
+
+
+def succeeded(status: int, headers: List[Tuple[bytes, bytes]], body: bytes) -> bool:
+    """Whether a response is the request's outcome, rather than a failure worth retrying."""
+    if not 200 <= status < 300:
+        return False
+    content_type = next((v for k, v in headers if k.lower() == b"content-type"), b"")
+    if not content_type.startswith(b"application/json"):
+        return True
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return True
+    return not (isinstance(data, dict) and data.get("status") == "error")
+
+
+def release(db, record_id: int):
+    db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.id == record_id))
+    db.commit()
+
+
+def _with_session(app, fn, *args):
+    sessions = _session(app)
+    db = next(sessions)
+    try:
+        return fn(db, *args)
+    finally:
+        sessions.close()
+
+
+def _error(status_code: int, message: str, headers: dict = None):
+    return JSONResponse(status_code=status_code, content={"status": "error", "message": message},
+                        headers=headers)
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in METHODS:
+            return await self.app(scope, receive, send)
+        key = next((v.decode("latin-1") for k, v in scope["headers"] if k == HEADER.encode()), None)
+        if key is None:
+            return await self.app(scope, receive, send)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return await _error(400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")(scope, receive, send)
+
+        chunks, size, more_body = [], 0, True
+        while more_body and size <= MAX_BODY_BYTES:
+            message = await receive()
+            if message["type"] != "http.request":
+                return  # client went away
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            more_body = message.get("more_body", False)
+        replay_receive = _replaying(chunks, more_body, receive)
+        if more_body or size > MAX_BODY_BYTES:
+            logger.info("Idempotency-Key ignored for %s %s: body over %d bytes",
+                        scope["method"], scope["path"], MAX_BODY_BYTES)
+            return await self.app(scope, replay_receive, send)
+
+        app = scope["app"]
+        request_fingerprint = fingerprint(scope["method"], scope["path"], scope.get("query_string", b""),
+                                          b"".join(chunks))
+        try:
+            record_id, seen = await run_in_threadpool(
+                _with_session, app, claim, key, scope["method"], scope["path"], request_fingerprint)
+        except Exception as e:
+            # no key store: serve the request rather than fail it
+            logger.warning("Idempotency-Key not applied to %s %s: %s", scope["method"], scope["path"], e)
+            return await self.app(scope, replay_receive, send)
+        if record_id is None:
+            return await self._answer_seen(seen, request_fingerprint, scope, receive, send)
+
+        response = {"status": None, "headers": [], "body": [], "size": 0, "storable": True}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+                if response["size"] > MAX_RESPONSE_BYTES:
+                    response["storable"], response["body"] = False, []
+                elif response["storable"]:
+                    response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture)
+        except BaseException:
+            await run_in_threadpool(_with_session, app, release, record_id)
+            raise
+        body = b"".join(response["body"])
+        if (response["status"] is not None and response["storable"]
+                and succeeded(response["status"], response["headers"], body)):
+            await run_in_threadpool(_with_session, app, complete, record_id, response["status"],
+                                    response["headers"], body)
+        else:
+            await run_in_threadpool(_with_session, app, release, record_id)
+
+    async def _answer_seen(self, seen: Optional[models.IdempotencyKey], request_fingerprint: str,
+                           scope, receive, send):
+        if seen is None or seen.status != "completed":
+            return await _error(409, "A request with this Idempotency-Key is still being processed",
+                                {"Retry-After": "1"})(scope, receive, send)
+        if seen.fingerprint != request_fingerprint:
+            return await _error(422, "Idempotency-Key was already used for a different request")(scope, receive, send)
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in json.loads(seen.response_headers or "[]")]
+        headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": seen.response_status, "headers": headers})
+        await send({"type": "http.response.body", "body": seen.response_body or b""})
+
+
+def _replaying(chunks: List[bytes], more_body: bool, receive):
+    """A receive() that hands the already-read body chunks to the app first."""
+    pending = list(chunks)
+
+    async def replay():
+        if pending:
+            body = pending.pop(0)
+            return {"type": "http.request", "body": body, "more_body": bool(pending) or more_body}
+        return await receive()
+
+    return replay
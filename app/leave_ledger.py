@@ -0,0 +1,192 @@
+"""Leave balances: an append-only ledger with one head row per employee and leave type.
+
+Every change to a balance appends a leave_ledger row carrying the running
+balance after it and updates the leave_balances row (the ledger head) in the
+same transaction, so reading a balance is a single-row lookup instead of a sum
+over history. The head is created on first use with a "grant" entry of the
+type's yearly entitlement.
+
+Applying for leave locks the employee's row in employees (SELECT ... FOR
+UPDATE), so applications for one employee are serialized whatever their leave
+type, then checks the indexed (employee_id, from_date, to_date) range for
+overlapping Pending/Approved applications and reserves the days on the head;
+pending applications count against what is available. The days are always
+the calendar days from from_date to to_date; a client-sent count that
+disagrees is rejected. Approving moves the reservation into a "debit" entry,
+rejecting releases it. Both are transitions out of Pending taken with the
+application and head rows locked (SELECT ... FOR UPDATE) and guarded by their
+version columns, so of two approvers racing (or an approve racing a reject)
+only one wins; the other gets LeaveConflict.
+
+Leave types without an entitlement (e.g. Unpaid) are not balance-tracked.
+Functions here flush but do not commit; the caller owns the transaction.
+
+Settings (environment variables):
+- LEAVE_ENTITLEMENTS: days per leave type, JSON (default
+  {"Annual": 18, "Sick": 12, "Casual": 12})
+"""
+import json
+import os
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+
+ENTITLEMENTS = json.loads(os.getenv("LEAVE_ENTITLEMENTS", "null")) or {
+    "Annual": 18, "Sick": 12, "Casual": 12,
+}
+# statuses that hold the dates they cover
+ACTIVE_STATUSES = ("Pending", "Approved")
+
+
+class LeaveError(Exception):
+    status_code = 400
+
+
+class LeaveNotFound(LeaveError):
+    status_code = 404
+
+
+class LeaveConflict(LeaveError):
+    status_code = 409
+
+
+def _lock_employee(db: Session, employee_id: str):
+    employee = db.query(models.Employee.id).filter_by(
+        employee_id=employee_id).with_for_update().first()
+    if employee is None:
+        raise LeaveNotFound(f"Employee {employee_id} not found")
+
+
+def _locked_head(db: Session, employee_id: str, leave_type: str) -> Optional[models.LeaveBalance]:
+    """The employee's head row for leave_type, locked; created with the opening grant if missing."""
+    if leave_type not in ENTITLEMENTS:
+        return None
+    query = db.query(models.LeaveBalance).filter_by(
+        employee_id=employee_id, leave_type=leave_type).with_for_update()
+    head = query.first()
+    if head is not None:
+        return head
+    try:
+        with db.begin_nested():
+            head = models.LeaveBalance(employee_id=employee_id, leave_type=leave_type,
+                                       balance=0, reserved=0)
+            db.add(head)
+            db.flush()
+            _append(db, head, "grant", ENTITLEMENTS[leave_type], note="Opening entitlement")
+    except IntegrityError:
+        # created by a concurrent request: use (and wait for) theirs
+        head = query.first()
+    return head
+
+
+def _append(db: Session, head: models.LeaveBalance, entry_type: str, days: int,
+            application_id: int = None, note: str = None, actor: str = None) -> models.LeaveLedgerEntry:
+    head.balance += days
+    entry = models.LeaveLedgerEntry(
+        employee_id=head.employee_id, leave_type=head.leave_type, entry_type=entry_type, days=days,
+        balance_after=head.balance, leave_application_id=application_id, note=note, created_by=actor)
+    db.add(entry)
+    db.flush()
+    head.last_entry_id = entry.id
+    db.flush()
+    return entry
+
+
+def find_overlap(db: Session, employee_id: str, from_date: date, to_date: date,
+                 exclude_id: int = None) -> Optional[models.LeaveApplication]:
+    L = models.LeaveApplication
+    query = db.query(L).filter(L.employee_id == employee_id, L.from_date <= to_date,
+                               L.to_date >= from_date, L.status.in_(ACTIVE_STATUSES))
+    if exclude_id is not None:
+        query = query.filter(L.id != exclude_id)
+    return query.order_by(L.from_date).first()
+
+
+def apply(db: Session, employee_id: str, employee_name: str, leave_type: str, from_date: date,
+          to_date: date, reason: str, days: int = None) -> models.LeaveApplication:
+    """Record a Pending application, reserving its days against the balance.
+
+    days, when given, must match the date range; the range is what gets reserved.
+    """
+    if to_date < from_date:
+        raise LeaveError("end_date is before start_date")
+    range_days = (to_date - from_date).days + 1
+    if days is not None and days != range_days:
+        raise LeaveError(f"days must be {range_days} for {from_date.isoformat()} to {to_date.isoformat()}")
+    days = range_days
+    _lock_employee(db, employee_id)
+    head = _locked_head(db, employee_id, leave_type)
+    overlap = find_overlap(db, employee_id, from_date, to_date)
+    if overlap is not None:
+        raise LeaveConflict(f"Overlaps {overlap.status.lower()} leave application {overlap.id} "
+                            f"({overlap.from_date.isoformat()} to {overlap.to_date.isoformat()})")
+    if head is not None:
+        available = head.balance - head.reserved
+        if days > available:
+            raise LeaveConflict(f"Insufficient {leave_type} balance: {available} days available, {days} requested")
+        head.reserved += days
+    application = models.LeaveApplication(
+        employee_id=employee_id, employee_name=employee_name or "", leave_type=leave_type,
+        from_date=from_date, to_date=to_date, total_days=days, reason=reason, status="Pending")
+    db.add(application)
+    db.flush()
+    return application
+
+
+def decide(db: Session, application_id: int, approve: bool, actor: str = None,
+           comments: str = None, expected_version: int = None) -> models.LeaveApplication:
+    """Approve or reject a Pending application (LeaveConflict if it has moved on)."""
+    application = db.query(models.LeaveApplication).filter_by(
+        id=application_id).with_for_update().first()
+    if application is None:
+        raise LeaveNotFound(f"Leave request {application_id} not found")
+    if expected_version is not None and application.version != expected_version:
+        raise LeaveConflict(f"Leave request {application_id} has changed (version {application.version})")
+    if application.status != "Pending":
+        raise LeaveConflict(f"Leave request {application_id} is already {application.status.lower()}")
+    head = _locked_head(db, application.employee_id, application.leave_type)
+    days = application.total_days
+    if head is not None:
+        head.reserved = max(0, head.reserved - days)
+        if approve:
+            if days > head.balance:
+                raise LeaveConflict(f"Insufficient {application.leave_type} balance: {head.balance} days left")
+            _append(db, head, "debit", -days, application_id=application.id, actor=actor)
+    application.status = "Approved" if approve else "Rejected"
+    application.approved_by = actor
+    application.approved_date = date.today()
+    if comments:
+        application.comments = comments
+    db.flush()
+    return application
+
+
+def balances(db: Session, employee_id: str) -> List[dict]:
+    heads = {h.leave_type: h for h in db.query(models.LeaveBalance).filter_by(employee_id=employee_id)}
+    result = []
+    for leave_type in sorted(set(ENTITLEMENTS) | set(heads)):
+        head = heads.get(leave_type)
+        balance = head.balance if head is not None else ENTITLEMENTS[leave_type]
+        reserved = head.reserved if head is not None else 0
+        result.append({"leave_type": leave_type, "entitlement": ENTITLEMENTS.get(leave_type),
+                       "balance": balance, "reserved": reserved, "available": balance - reserved})
+    return result
+
+
+def application_status(application: models.LeaveApplication) -> dict:
+    return {
+        "request_id": application.id,
+        "employee_id": application.employee_id,
+        "leave_type": application.leave_type,
+        "from_date": application.from_date.isoformat(),
+        "to_date": application.to_date.isoformat(),
+        "days": application.total_days,
+        "status": application.status,
+        "approved_by": application.approved_by,
+        "approved_date": application.approved_date.isoformat() if application.approved_date else None,
+        "version": application.version,
+    }
@@ -0,0 +1,136 @@
+"""Structured, non-blocking logging.
+
+Request threads only put records on an in-memory queue; a QueueListener
+thread formats them as JSON lines and does the actual I/O. Every record is
+stamped with the current request id and route so lines from one request can
+be correlated, and high-volume INFO/DEBUG logs can be sampled per route.
+
+Settings (environment variables):
+- LOG_LEVEL: root log level (default INFO)
+- LOG_SAMPLE_RATES: comma separated "<route>=<rate>" pairs, e.g.
+  "GET /api/menu/{company_type}=0.1". Records at INFO or below on that route
+  are kept with the given probability; WARNING and above are always kept.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import uuid
+from datetime import datetime, timezone
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_request_scope = contextvars.ContextVar("log_request_scope", default=None)
+_request_id = contextvars.ContextVar("log_request_id", default=None)
+_listener = None
+
+
+def parse_sample_rates(raw: str) -> dict:
+    """Parse LOG_SAMPLE_RATES into {route: rate}; malformed entries are skipped."""
+    rates = {}
+    for item in (raw or "").split(","):
+        route, sep, rate = item.rpartition("=")
+        if not sep or not route.strip():
+            continue
+        try:
+            rates[route.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+def current_request_id() -> str:
+    return _request_id.get()
+
+
+def current_route() -> str:
+    scope = _request_scope.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path", "")
+    return f"{scope.get('method', '')} {path}".strip()
+
+
+def bind_request(scope: dict, request_id: str = None):
+    """Bind a request to the current context; returns tokens for unbind_request."""
+    request_id = request_id or uuid.uuid4().hex
+    return _request_scope.set(scope), _request_id.set(request_id)
+
+
+def unbind_request(tokens):
+    scope_token, id_token = tokens
+    _request_scope.reset(scope_token)
+    _request_id.reset(id_token)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the request id and route of the calling context."""
+
+    def filter(self, record):
+        record.request_id = current_request_id()
+        record.route = current_route()
+        return True
+
+
+class RouteSamplingFilter(logging.Filter):
+    """Drop a share of INFO/DEBUG records on routes with a configured rate."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or not self.rates:
+            return True
+        rate = self.rates.get(getattr(record, "route", None) or current_route())
+        return rate is None or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "route": getattr(record, "route", None),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str = None, stream=None):
+    """Route all logging through a queue drained by a background listener thread."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(RouteSamplingFilter(
+        parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))))
+
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
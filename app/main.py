@@ -1,23 +1,29 @@
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app import models, schemas, crud
+from sqlalchemy.orm.exc import StaleDataError
+from app.database import get_db, engine
+from app import models, schemas, crud, query_monitor, mock_data, notifications, event_broker, group_commit, uploads, exports, file_serving, employee_import, punch_buffer, payroll, leave_ledger, idempotency, rate_limit, cache, scheduler, retention_tasks
+from app.logging_config import setup_logging, bind_request, unbind_request, current_request_id, REQUEST_ID_HEADER
 from datetime import date, timedelta, datetime
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel
 from pathlib import Path
+from urllib.parse import urlsplit
+import asyncio
 import os
 import random
 import json
-from openpyxl import Workbook
+import httpx
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (JSON lines, written off the request thread)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -66,6 +72,14 @@ def _save_json_file(path, data):
         return False
 
 
+# Replays the stored response for retried POSTs carrying an Idempotency-Key
+# (added first, so it runs inside CORS and the request-id middleware)
+app.add_middleware(idempotency.IdempotencyMiddleware)
+
+# Token buckets per merchant / employee / client IP (runs before idempotency
+# replays and request handling, inside CORS so 429s stay readable by browsers)
+app.add_middleware(rate_limit.RateLimitMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -75,6 +89,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Slow-query log and N+1 detection, attributed to the route being served
+query_monitor.install(engine)
+
+
+@app.middleware("http")
+async def monitor_queries(request: Request, call_next):
+    token = query_monitor.begin_request(request.scope)
+    try:
+        return await call_next(request)
+    finally:
+        query_monitor.end_request(token)
+
+
+@app.middleware("http")
+async def bind_request_context(request: Request, call_next):
+    """Correlate every log line of a request through a request id (echoed back)."""
+    request_id = request.headers.get(REQUEST_ID_HEADER)
+    tokens = bind_request(request.scope, request_id)
+    try:
+        response = await call_next(request)
+        response.headers[REQUEST_ID_HEADER] = current_request_id()
+        return response
+    finally:
+        unbind_request(tokens)
+
 # Static files with no cache for development
 
 
@@ -89,9 +128,8 @@ class NoCacheStaticFiles(StaticFiles):
 
 app.mount("/static", NoCacheStaticFiles(directory="static"), name="static")
 
-# Download directory setup
-DOWNLOAD_DIR = Path(os.path.join(os.getcwd(), 'downloads'))
-DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
+# Download directory setup (export jobs write here, see app/exports.py)
+DOWNLOAD_DIR = exports.DOWNLOAD_DIR
 
 # Utility functions
 
@@ -361,8 +399,20 @@ def root():
 
 
 @app.get("/api/downloads/{filename}")
-def download_file(filename: str):
-    """Serve exported files from the downloads directory securely."""
+def download_file(filename: str, request: Request, db: Session = Depends(get_db)):
+    """Serve exported files from the downloads directory securely (Range and conditional GET aware).
+
+    Names of the form <sha256>[.ext] are uploaded files from the content-addressed store. They are
+    served with the type sniffed at upload (never one derived from the requested extension), and
+    anything but an image is sent as an attachment.
+    """
+    blob = uploads.blob_for_name(filename)
+    if blob is not None:
+        sha256, path = blob
+        media_type = uploads.served_content_type(crud.get_blob_content_type(db, sha256))
+        return _serve_content_addressed(path, sha256, media_type, request,
+                                        filename=None if media_type.startswith("image/") else filename)
+
     # Protect against path traversal
     requested = (DOWNLOAD_DIR / filename).resolve()
     try:
@@ -398,12 +448,57 @@ def download_file(filename: str):
             }
         )
 
-    return FileResponse(path=str(requested), filename=filename, media_type='application/octet-stream')
+    return file_serving.serve_file(requested, request, filename=filename, accel_name=filename)
+
+
+def _serve_content_addressed(path: Path, sha256: str, media_type: str, request: Request, filename: str = None):
+    """Serve a file whose name is its content hash: cacheable forever, revalidated by ETag.
+
+    Passing filename sends it as an attachment instead of inline.
+    """
+    return file_serving.serve_file(path, request, media_type=media_type, filename=filename,
+                                   etag=f'"{sha256}"', cache_control=uploads.IMMUTABLE_CACHE_CONTROL)
+
+
+@app.get("/api/uploads/thumbnails/{filename}")
+def get_upload_thumbnail(filename: str, request: Request):
+    """Serve an upload thumbnail (404 until the background worker has rendered it)."""
+    sha256 = filename.split(".", 1)[0].lower()
+    path = uploads.thumbnail_path(sha256)
+    if not uploads.SHA256_RE.fullmatch(sha256) or not path.is_file():
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"File '{filename}' does not exist"})
+    return _serve_content_addressed(path, sha256, "image/jpeg", request)
+
+
+@app.post("/api/exports", status_code=202)
+def create_export(export: schemas.ExportRequest, db: Session = Depends(get_db)):
+    """Queue an Excel/PDF export; poll status_url until download_url is set.
+
+    An unchanged repeat of a finished export answers 200 with its download_url straight away.
+    """
+    try:
+        job = exports.queue_job(
+            db, export.report_type, export.format.lower(), export.filters)
+        db.commit()
+    except ValueError as e:
+        db.rollback()
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    return JSONResponse(status_code=200 if job.status == "done" else 202,
+                        content={"status": "success", "data": exports.job_status(job)})
+
+
+@app.get("/api/exports/{job_id}")
+def get_export(job_id: int, db: Session = Depends(get_db)):
+    job = db.get(models.ExportJob, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Export job {job_id} not found"})
+    return {"status": "success", "data": exports.job_status(job)}
 
 # Menu Management Endpoints
 
 
 @app.get("/api/chatbot/menus-with-submenus")
+@cache.cached(ttl=300, tags=("menus",))
 def get_menus_with_submenus(
     company_type: str,
     role: str,
@@ -417,7 +512,7 @@ def get_menus_with_submenus(
             models.ChatbotMenu.role == role
         ).all()
 
-        logger.debug(f"Menus retrieved: {menus}")
+        logger.debug("Menus retrieved: %s", menus)
 
         if not menus:
             # Return 404 for missing data
@@ -438,7 +533,7 @@ def get_menus_with_submenus(
                 models.ChatbotSubmenu.role == role
             ).all()
 
-            logger.debug(f"Submenus for menu {menu.id}: {submenus}")
+            logger.debug("Submenus for menu %s: %s", menu.id, submenus)
 
             results.append({
                 "menu_id": menu.id,
@@ -464,7 +559,7 @@ def get_menus_with_submenus(
         }
 
     except Exception as e:
-        logger.error(f"Error in get_menus_with_submenus: {str(e)}")
+        logger.error("Error in get_menus_with_submenus: %s", e)
         # Return mock data if database fails
         return {
             "status": "success",
@@ -474,6 +569,7 @@ def get_menus_with_submenus(
 
 
 @app.get("/api/menu/{company_type}")
+@cache.cached(ttl=300, tags=("menus",))
 def get_menus_by_company_type(company_type: str, role: Optional[str] = Query(None, description="Optional role to filter menus by"), db: Session = Depends(get_db)):
     """Get menus by company type with special handling for merchant type."""
     try:
@@ -517,8 +613,7 @@ def get_menus_by_company_type(company_type: str, role: Optional[str] = Query(Non
                 "data": generate_mock_menu_data_for_company(company_type)
             }
 
-        # Debugging: Log the retrieved menus
-        print("Retrieved menus:", menus)
+        logger.debug("Retrieved %d menus for %s", len(menus), company_type)
 
         results = []
         for menu in menus:
@@ -527,8 +622,7 @@ def get_menus_by_company_type(company_type: str, role: Optional[str] = Query(Non
                 models.ChatbotSubmenu.is_active == True
             ).all()
 
-            # Debugging: Log the retrieved submenus for each menu
-            print(f"Menu {menu.menu_key} submenus:", submenus)
+            logger.debug("Menu %s submenus: %s", menu.menu_key, submenus)
 
             results.append({
                 "menu_id": menu.id,
@@ -552,13 +646,87 @@ def get_menus_by_company_type(company_type: str, role: Optional[str] = Query(Non
         }
 
     except Exception as e:
-        logger.error(f"Error in get_menus_by_company_type: {str(e)}")
+        logger.error("Error in get_menus_by_company_type: %s", e)
         return {
             "status": "success",
             "message": f"Using mock data for {company_type} due to database issue",
             "data": generate_mock_menu_data_for_company(company_type)
         }
 
+# Batch endpoint: several submenu GETs in one round trip
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+BATCH_FORWARDED_HEADERS = ("X-Merchant-Id", "X-Request-ID", "Authorization")
+MOCK_MENU_COMPANY_TYPES = ("icp_hr", "merchant",
+                           "retail", "restaurant", "pos_youhr")
+
+
+def _batch_allowed_endpoints(db: Session) -> set:
+    """Endpoints the chatbot menus expose; only these may be batched."""
+    try:
+        rows = db.query(models.ChatbotSubmenu.api_endpoint).filter(
+            models.ChatbotSubmenu.is_active == True
+        ).distinct().all()
+        allowed = {row[0] for row in rows if row[0]}
+    except Exception as e:
+        logger.error("Error loading submenu endpoints for batch: %s", e)
+        allowed = set()
+
+    if not allowed:
+        # Menus fall back to mock data when the DB has none; allow what they expose
+        allowed = {
+            submenu["api_endpoint"]
+            for company_type in MOCK_MENU_COMPANY_TYPES
+            for menu in generate_mock_menu_data_for_company(company_type)
+            for submenu in menu["submenus"]
+        }
+    return allowed
+
+
+async def _batch_subrequest(scope, receive, send):
+    # the batch itself has been rate limited; its sub-requests are not charged again
+    scope["extensions"] = {**scope.get("extensions", {}), rate_limit.SUBREQUEST: {}}
+    await app(scope, receive, send)
+
+
+@app.post("/api/batch")
+async def batch_get(batch: schemas.BatchRequest, request: Request, db: Session = Depends(get_db)):
+    """Run several submenu GET requests in-process, concurrently, and return all results."""
+    paths = batch.paths
+    if not paths:
+        return JSONResponse(status_code=400, content={"status": "error", "message": "No paths supplied"})
+    if len(paths) > BATCH_MAX_REQUESTS:
+        return JSONResponse(status_code=400, content={"status": "error", "message": f"At most {BATCH_MAX_REQUESTS} paths per batch"})
+
+    allowed = await run_in_threadpool(_batch_allowed_endpoints, db)
+    rejected = [p for p in paths if urlsplit(p).netloc or urlsplit(
+        p).path not in allowed]
+    if rejected:
+        return JSONResponse(status_code=400, content={"status": "error", "message": "Paths not available for batching", "rejected": rejected})
+
+    forwarded = {name: request.headers[name]
+                 for name in BATCH_FORWARDED_HEADERS if name in request.headers}
+    transport = httpx.ASGITransport(app=_batch_subrequest, raise_app_exceptions=False,
+                                    client=request.client or ("unknown", 0))
+    async with httpx.AsyncClient(transport=transport, base_url="http://batch", headers=forwarded) as client:
+        responses = await asyncio.gather(*[client.get(p) for p in paths], return_exceptions=True)
+
+    results = []
+    for path, resp in zip(paths, responses):
+        if isinstance(resp, Exception):
+            logger.error("Batch sub-request %s failed: %s", path, resp)
+            results.append({"path": path, "status_code": 500,
+                           "body": {"status": "error", "message": "Request failed"}})
+            continue
+        try:
+            body = resp.json()
+        except ValueError:
+            body = resp.text
+        results.append(
+            {"path": path, "status_code": resp.status_code, "body": body})
+
+    return {"status": "success", "data": results}
+
 # HR Core Endpoints
 
 
@@ -576,7 +744,7 @@ async def get_employees(db: Session = Depends(get_db)):
             ]
         }
     except Exception as e:
-        logger.error(f"Error fetching employees: {e}")
+        logger.error("Error fetching employees: %s", e)
         return {
             "status": "error",
             "message": "Failed to fetch employee records."
@@ -599,46 +767,58 @@ async def get_attendance(db: Session = Depends(get_db)):
 
 
 @app.post("/api/leave/apply")
-def apply_leave(leave_data: schemas.LeaveApplicationRequest, db: Session = Depends(get_db)):
-    """Apply for leave. Map request schema to LeaveApplication model and save."""
+def apply_leave(leave_data: schemas.LeaveApplicationRequest, merchant_id: Optional[str] = Query(None), db: Session = Depends(get_db)):
+    """Apply for leave. Map request schema to LeaveApplication model and save.
+
+    The days from start_date to end_date are reserved against the employee's leave balance
+    (a days field that disagrees gets 400, an unknown employee 404); applications that
+    overlap a pending or approved one, or exceed the available balance, get 409.
+    When the employee's merchant_id is given, the merchant's notification stream is told about it.
+    """
     try:
-        # try to coerce date strings to date objects when possible
         try:
-            from_date = datetime.fromisoformat(
-                leave_data.start_date).date() if leave_data.start_date else None
-        except Exception:
-            from_date = leave_data.start_date
+            from_date = datetime.fromisoformat(leave_data.start_date).date()
+            to_date = datetime.fromisoformat(leave_data.end_date).date()
+        except ValueError:
+            return JSONResponse(status_code=400, content={"status": "error", "message": "start_date and end_date must be YYYY-MM-DD"})
 
         try:
-            to_date = datetime.fromisoformat(
-                leave_data.end_date).date() if leave_data.end_date else None
-        except Exception:
-            to_date = leave_data.end_date
-
-        new_leave = models.LeaveApplication(
-            employee_id=leave_data.employee_id,
-            employee_name=leave_data.employee_name or "",
-            leave_type=leave_data.leave_type,
-            from_date=from_date,
-            to_date=to_date,
-            total_days=leave_data.days or 0,
-            reason=leave_data.reason,
-            status="Pending"
-        )
-
-        db.add(new_leave)
-        db.commit()
-        db.refresh(new_leave)
+            new_leave = leave_ledger.apply(
+                db, leave_data.employee_id, leave_data.employee_name, leave_data.leave_type,
+                from_date, to_date, leave_data.reason, leave_data.days)
+            db.commit()
+        except (leave_ledger.LeaveError, StaleDataError) as e:
+            db.rollback()
+            status_code = e.status_code if isinstance(e, leave_ledger.LeaveError) else 409
+            return JSONResponse(status_code=status_code, content={"status": "error", "message": str(e)})
+        cache.invalidate(f"employee:{new_leave.employee_id}")
+        if merchant_id:
+            _publish_notification(merchant_id, "pending_leave_requests", {
+                "request_id": new_leave.id,
+                "employee_id": new_leave.employee_id,
+                "leave_type": new_leave.leave_type,
+                "days": new_leave.total_days,
+                "status": "Pending"
+            })
         return {"status": "success", "message": "Leave applied successfully.", "application_id": new_leave.id}
     except Exception as e:
-        logger.error(f"Error applying for leave: {str(e)}")
+        logger.error("Error applying for leave: %s", e)
         return {
             "status": "error",
             "message": "Failed to apply for leave."
         }
 
 
+@app.get("/api/leave/balance")
+@cache.cached(tags=("employee:{employee_id}",))
+def get_leave_balance(employee_id: str = Query(..., description="Employee ID"), db: Session = Depends(get_db)):
+    """Current balance per leave type, read from the ledger heads."""
+    return {"status": "success", "data": {"employee_id": employee_id,
+                                          "balances": leave_ledger.balances(db, employee_id)}}
+
+
 @app.get("/api/leave/applications")
+@cache.coalesced()
 def get_leave_applications(employee_id: Optional[str] = Query(None, description="Employee ID"), db: Session = Depends(get_db)):
     try:
         applications = db.execute(
@@ -663,7 +843,7 @@ def get_leave_applications(employee_id: Optional[str] = Query(None, description=
             ]
         }
     except Exception as e:
-        logger.error(f"Error fetching leave applications: {e}")
+        logger.error("Error fetching leave applications: %s", e)
         return {
             "status": "error",
             "message": "Failed to fetch leave applications."
@@ -671,6 +851,7 @@ def get_leave_applications(employee_id: Optional[str] = Query(None, description=
 
 
 @app.get("/api/payroll/payslips")
+@cache.coalesced()
 def get_payslips(employee_id: Optional[str] = Query(None, description="Employee ID"), year: Optional[int] = Query(None, description="Year"), month: Optional[int] = Query(None, description="Month"), db: Session = Depends(get_db)):
     try:
         target_year = year or date.today().year
@@ -694,11 +875,12 @@ def get_payslips(employee_id: Optional[str] = Query(None, description="Employee
             ]
         }
     except Exception as e:
-        logger.error(f"Error fetching payslips: {e}")
+        logger.error("Error fetching payslips: %s", e)
         return {"status": "error", "message": "Failed to fetch payslips."}
 
 
 @app.get("/api/employee/status")
+@cache.cached(tags=("employee:{employee_id}",))
 def get_employee_status(employee_id: Optional[str] = Query(None, description="Employee ID"), db: Session = Depends(get_db)):
     try:
         employee_data = db.execute(
@@ -742,7 +924,7 @@ def get_employee_status(employee_id: Optional[str] = Query(None, description="Em
             }
         }
     except Exception as e:
-        logger.error(f"Error fetching employee status: {e}")
+        logger.error("Error fetching employee status: %s", e)
         return {"status": "error", "message": "Failed to fetch employee status."}
 
 # (Old duplicate merchant sales endpoints removed — consolidated handlers are defined later.)
@@ -757,7 +939,7 @@ def apply_leave(leave_data: schemas.LeaveApplicationRequest, db: Session = Depen
         db.commit()
         return {"status": "success", "message": "Leave applied successfully."}
     except Exception as e:
-        logger.error(f"Error applying for leave: {e}")
+        logger.error("Error applying for leave: %s", e)
         return {
             "status": "error",
             "message": "Failed to apply for leave."
@@ -796,7 +978,7 @@ def get_leave_applications(employee_id: Optional[str] = Query(None, description=
             ]
         }
     except Exception as e:
-        logger.error(f"Error fetching leave applications: {e}")
+        logger.error("Error fetching leave applications: %s", e)
         return {
             "status": "error",
             "message": "Failed to fetch leave applications."
@@ -834,7 +1016,7 @@ def get_payslips(employee_id: Optional[str] = Query(None, description="Employee
             ]
         }
     except Exception as e:
-        logger.error(f"Error fetching payslips: {e}")
+        logger.error("Error fetching payslips: %s", e)
         return {
             "status": "error",
             "message": "Failed to fetch payslips."
@@ -897,7 +1079,7 @@ def get_employee_status(employee_id: Optional[str] = Query(None, description="Em
             ]
             return {"status": "success", "data": data}
     except Exception as e:
-        logger.error(f"Error fetching employee status: {e}")
+        logger.error("Error fetching employee status: %s", e)
         return {"status": "error", "message": "Failed to fetch employee status."}
 
 # =============================================================================
@@ -905,7 +1087,24 @@ def get_employee_status(employee_id: Optional[str] = Query(None, description="Em
 # =============================================================================
 
 
+def _attendance_row_to_dict(r) -> Dict[str, Any]:
+    """Convert an attendance_records row (column order of get_attendance_history) to JSON-ready dict."""
+    return {
+        "id": r[0],
+        "employee_id": r[1],
+        "employee_name": r[2],
+        "date": r[3].isoformat() if hasattr(r[3], "isoformat") else r[3],
+        "check_in_time": r[4].isoformat() if hasattr(r[4], "isoformat") else r[4],
+        "check_out_time": r[5].isoformat() if hasattr(r[5], "isoformat") else r[5],
+        "working_hours": r[6],
+        "status": r[7],
+        "location": r[8],
+        "created_at": r[9].isoformat() if hasattr(r[9], "isoformat") else r[9]
+    }
+
+
 @app.get("/api/attendance/history")
+@cache.coalesced()
 def get_attendance_history(employee_id: Optional[str] = Query(None, description="Employee ID"), db: Session = Depends(get_db)):
     """Retrieve attendance history; optional employee_id filter."""
     try:
@@ -919,24 +1118,11 @@ def get_attendance_history(employee_id: Optional[str] = Query(None, description=
                 "SELECT id, employee_id, employee_name, date, check_in_time, check_out_time, working_hours, status, location, created_at FROM attendance_records ORDER BY date DESC"
             ).fetchall()
 
-        history = [
-            {
-                "id": r[0],
-                "employee_id": r[1],
-                "employee_name": r[2],
-                "date": r[3].isoformat() if hasattr(r[3], "isoformat") else r[3],
-                "check_in_time": r[4].isoformat() if hasattr(r[4], "isoformat") else r[4],
-                "check_out_time": r[5].isoformat() if hasattr(r[5], "isoformat") else r[5],
-                "working_hours": r[6],
-                "status": r[7],
-                "location": r[8],
-                "created_at": r[9].isoformat() if hasattr(r[9], "isoformat") else r[9]
-            } for r in rows
-        ]
+        history = [_attendance_row_to_dict(r) for r in rows]
 
         return {"status": "success", "employee_id": employee_id, "data": history}
     except Exception as e:
-        logger.error(f"Error retrieving attendance history: {str(e)}")
+        logger.error("Error retrieving attendance history: %s", e)
         return {"status": "error", "message": "Failed to retrieve attendance history."}
 
 
@@ -973,7 +1159,7 @@ def apply_leave(leave_data: schemas.LeaveApplicationRequest, db: Session = Depen
         db.refresh(new_leave)
         return {"status": "success", "message": "Leave applied successfully.", "application_id": new_leave.id}
     except Exception as e:
-        logger.error(f"Error applying for leave: {str(e)}")
+        logger.error("Error applying for leave: %s", e)
         return {
             "status": "error",
             "message": "Failed to apply for leave."
@@ -1005,7 +1191,7 @@ def get_leave_applications(employee_id: Optional[str] = Query(None, description=
             ]
         }
     except Exception as e:
-        logger.error(f"Error fetching leave applications: {e}")
+        logger.error("Error fetching leave applications: %s", e)
         return {
             "status": "error",
             "message": "Failed to fetch leave applications."
@@ -1043,7 +1229,7 @@ def get_payslips(employee_id: Optional[str] = Query(None, description="Employee
             ]
         }
     except Exception as e:
-        logger.error(f"Error fetching payslips: {e}")
+        logger.error("Error fetching payslips: %s", e)
         return {
             "status": "error",
             "message": "Failed to fetch payslips."
@@ -1106,7 +1292,7 @@ def get_employee_status(employee_id: Optional[str] = Query(None, description="Em
             ]
             return {"status": "success", "data": data}
     except Exception as e:
-        logger.error(f"Error fetching employee status: {e}")
+        logger.error("Error fetching employee status: %s", e)
         return {"status": "error", "message": "Failed to fetch employee status."}
 
 # =============================================================================
@@ -1117,29 +1303,21 @@ def get_employee_status(employee_id: Optional[str] = Query(None, description="Em
 
 
 @app.get("/api/merchant/sales/yesterday")
+@cache.cached(tags=("merchant:{merchant_id}",))
 def get_yesterday_sales(merchant_id: str = Query(None)):
     """Get yesterday's sales data for a merchant."""
     merchant_id, headers = validate_merchant_id(merchant_id)
 
     yesterday_sales = {
         "merchant_id": merchant_id,
-        "date": (date.today() - timedelta(days=1)).isoformat(),
-        "total_sales": round(random.uniform(40000, 80000), 2),
-        "total_transactions": random.randint(60, 150),
-        "top_products": [
-            {"name": "Product A", "sales": round(
-                random.uniform(5000, 15000), 2)},
-            {"name": "Product B", "sales": round(
-                random.uniform(3000, 12000), 2)},
-            {"name": "Product C", "sales": round(
-                random.uniform(2000, 8000), 2)}
-        ]
+        **mock_data.get_section(merchant_id, "yesterday_sales")
     }
 
     return JSONResponse(content={"status": "success", "data": yesterday_sales}, headers=headers)
 
 
 @app.get("/api/merchant/sales/today")
+@cache.cached(tags=("merchant:{merchant_id}",))
 def get_today_sales(merchant_id: str = Query(None)):
     """Get today's sales data for a merchant."""
     merchant_id, headers = validate_merchant_id(merchant_id)
@@ -1151,6 +1329,7 @@ def get_today_sales(merchant_id: str = Query(None)):
 
 
 @app.get("/api/merchant/sales/weekly")
+@cache.cached(tags=("merchant:{merchant_id}",))
 def get_weekly_sales(merchant_id: str = Query(None)):
     """Get weekly sales summary for a merchant."""
     merchant_id, headers = validate_merchant_id(merchant_id)
@@ -1169,16 +1348,7 @@ def get_outstanding_payments(merchant_id: str = Query(None)):
 
     outstanding_payments = {
         "merchant_id": merchant_id,
-        "total_outstanding": round(random.uniform(5000, 25000), 2),
-        "payments": [
-            {
-                "payment_id": f"PAY{i:04d}",
-                "amount": round(random.uniform(1000, 8000), 2),
-                "due_date": (date.today() + timedelta(days=random.randint(1, 30))).isoformat(),
-                "status": random.choice(["Pending", "Overdue"])
-            }
-            for i in range(1, 6)
-        ]
+        **mock_data.get_section(merchant_id, "outstanding_payments")
     }
 
     return JSONResponse(content={"status": "success", "data": outstanding_payments}, headers=headers)
@@ -1191,17 +1361,7 @@ def get_expenses_bills(merchant_id: str = Query(None)):
 
     expenses_bills = {
         "merchant_id": merchant_id,
-        "total_expenses": round(random.uniform(10000, 30000), 2),
-        "bills": [
-            {
-                "bill_id": f"BILL{i:04d}",
-                "description": random.choice(["Electricity", "Rent", "Internet", "Supplies", "Insurance"]),
-                "amount": round(random.uniform(2000, 8000), 2),
-                "due_date": (date.today() + timedelta(days=random.randint(1, 30))).isoformat(),
-                "status": random.choice(["Paid", "Pending", "Overdue"])
-            }
-            for i in range(1, 6)
-        ]
+        **mock_data.get_section(merchant_id, "expenses_bills")
     }
 
     return JSONResponse(content={"status": "success", "data": expenses_bills}, headers=headers)
@@ -1216,17 +1376,7 @@ def get_staff_attendance(merchant_id: str = Query(None)):
 
     staff_attendance = {
         "merchant_id": merchant_id,
-        "date": date.today().isoformat(),
-        "staff": [
-            {
-                "employee_id": f"EMP{i:03d}",
-                "name": f"Staff Member {i}",
-                "status": random.choice(["Present", "Absent", "On Leave", "Late"]),
-                "check_in": f"{random.randint(8, 10)}:{random.randint(0, 59):02d} AM" if random.choice([True, False]) else None,
-                "role": random.choice(["Sales Operator", "Manager", "Cashier"])
-            }
-            for i in range(1, 8)
-        ]
+        **mock_data.get_section(merchant_id, "staff_attendance")
     }
 
     return JSONResponse(content={"status": "success", "data": staff_attendance}, headers=headers)
@@ -1239,51 +1389,49 @@ def get_staff_leave_requests(merchant_id: str = Query(None)):
 
     leave_requests = {
         "merchant_id": merchant_id,
-        "requests": [
-            {
-                "request_id": f"LR{i:04d}",
-                "employee_name": f"Staff Member {i}",
-                "leave_type": random.choice(["Sick Leave", "Casual Leave", "Annual Leave"]),
-                "from_date": (date.today() + timedelta(days=random.randint(1, 10))).isoformat(),
-                "to_date": (date.today() + timedelta(days=random.randint(11, 20))).isoformat(),
-                "status": random.choice(["Pending", "Approved", "Rejected"]),
-                "reason": "Personal work"
-            }
-            for i in range(1, 5)
-        ]
+        **mock_data.get_section(merchant_id, "staff_leave_requests")
     }
 
     return JSONResponse(content={"status": "success", "data": leave_requests}, headers=headers)
 
 
-@app.post("/api/merchant/staff/leave-requests/{request_id}/approve")
-def approve_leave_request(request_id: str, merchant_id: str = Query(None)):
-    """Approve a staff leave request."""
+def _decide_leave_request(request_id: str, approve: bool, merchant_id: Optional[str], version: Optional[int],
+                          comments: Optional[str], db: Session):
     merchant_id, headers = validate_merchant_id(merchant_id)
-
-    result = {
-        "request_id": request_id,
-        "status": "approved",
-        "approved_by": merchant_id,
-        "approved_at": datetime.now().isoformat()
-    }
-
+    if not request_id.isdecimal():
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Leave request {request_id} not found"}, headers=headers)
+    try:
+        application = leave_ledger.decide(db, int(request_id), approve, actor=merchant_id,
+                                          comments=comments, expected_version=version)
+        db.commit()
+    except (leave_ledger.LeaveError, StaleDataError) as e:
+        db.rollback()
+        status_code = e.status_code if isinstance(e, leave_ledger.LeaveError) else 409
+        return JSONResponse(status_code=status_code, content={"status": "error", "message": str(e)}, headers=headers)
+    result = leave_ledger.application_status(application)
+    cache.invalidate(f"employee:{application.employee_id}")
+    _publish_notification(merchant_id, "pending_leave_requests", {
+        "request_id": application.id,
+        "employee_id": application.employee_id,
+        "status": application.status
+    })
     return JSONResponse(content={"status": "success", "data": result}, headers=headers)
 
 
-@app.post("/api/merchant/staff/leave-requests/{request_id}/reject")
-def reject_leave_request(request_id: str, merchant_id: str = Query(None)):
-    """Reject a staff leave request."""
-    merchant_id, headers = validate_merchant_id(merchant_id)
+@app.post("/api/merchant/staff/leave-requests/{request_id}/approve")
+def approve_leave_request(request_id: str, merchant_id: str = Query(None),
+                          version: Optional[int] = Query(None, description="Fail with 409 unless the request is still at this version"),
+                          comments: Optional[str] = Query(None), db: Session = Depends(get_db)):
+    """Approve a pending staff leave request and debit the employee's leave balance."""
+    return _decide_leave_request(request_id, True, merchant_id, version, comments, db)
 
-    result = {
-        "request_id": request_id,
-        "status": "rejected",
-        "rejected_by": merchant_id,
-        "rejected_at": datetime.now().isoformat()
-    }
 
-    return JSONResponse(content={"status": "success", "data": result}, headers=headers)
+@app.post("/api/merchant/staff/leave-requests/{request_id}/reject")
+def reject_leave_request(request_id: str, merchant_id: str = Query(None),
+                         version: Optional[int] = Query(None, description="Fail with 409 unless the request is still at this version"),
+                         comments: Optional[str] = Query(None), db: Session = Depends(get_db)):
+    """Reject a pending staff leave request, releasing the days it reserved."""
+    return _decide_leave_request(request_id, False, merchant_id, version, comments, db)
 
 
 @app.get("/api/merchant/staff/messages")
@@ -1293,18 +1441,7 @@ def get_staff_messages(merchant_id: str = Query(None)):
 
     staff_messages = {
         "merchant_id": merchant_id,
-        "messages": [
-            {
-                "message_id": f"MSG{i:04d}",
-                "from": f"Staff Member {i}",
-                "role": random.choice(["Sales Operator", "Manager"]),
-                "subject": random.choice(["Daily Report", "Issue Alert", "Request"]),
-                "message": f"This is a sample message {i} from staff member.",
-                "timestamp": (datetime.now() - timedelta(hours=random.randint(1, 24))).isoformat(),
-                "status": random.choice(["Unread", "Read"])
-            }
-            for i in range(1, 6)
-        ]
+        **mock_data.get_section(merchant_id, "staff_messages")
     }
 
     return JSONResponse(content={"status": "success", "data": staff_messages}, headers=headers)
@@ -1363,16 +1500,7 @@ def get_staff_salary(merchant_id: str = Query(None)):
 
     salary_info = {
         "merchant_id": merchant_id,
-        "staff_salaries": [
-            {
-                "employee_id": f"EMP{i:03d}",
-                "name": f"Staff Member {i}",
-                "monthly_salary": round(random.uniform(15000, 50000), 2),
-                "status": random.choice(["Paid", "Pending", "Overdue"]),
-                "last_paid": (date.today() - timedelta(days=random.randint(1, 30))).isoformat()
-            }
-            for i in range(1, 6)
-        ]
+        **mock_data.get_section(merchant_id, "staff_salaries")
     }
 
     return JSONResponse(content={"status": "success", "data": salary_info}, headers=headers)
@@ -1537,18 +1665,7 @@ def get_campaign_results(merchant_id: str = Query(None)):
 
     results = {
         "merchant_id": merchant_id,
-        "campaigns": [
-            {
-                "campaign_id": f"CAMP{i:04d}",
-                "type": random.choice(["WhatsApp", "SMS", "Email"]),
-                "sent": random.randint(100, 1000),
-                "opened": random.randint(50, 500),
-                "clicked": random.randint(10, 100),
-                "conversion_rate": f"{random.randint(5, 25)}%",
-                "created_at": (datetime.now() - timedelta(days=random.randint(1, 30))).isoformat()
-            }
-            for i in range(1, 4)
-        ]
+        **mock_data.get_section(merchant_id, "campaign_results")
     }
 
     return JSONResponse(content={"status": "success", "data": results}, headers=headers)
@@ -1572,25 +1689,57 @@ def marketing_create_campaign(payload: dict, merchant_id: str = Query(None), db:
     return JSONResponse(content={"status": "success", "message": "Campaign created", "data": camp}, headers=headers)
 
 
+# Notification sources (aggregated by /api/merchant/notifications)
+@notifications.source("pending_leave_requests", ttl=30)
+def _pending_leave_notifications(merchant_id: str):
+    return [{"request_id": "LR001", "employee_id": "EMP002", "days": 2, "status": "Pending"}]
+
+
+@notifications.source("pending_shift_changes", ttl=30)
+def _pending_shift_notifications(merchant_id: str):
+    return [{"request_id": "SR001", "employee_id": "EMP005",
+             "from_shift": "09:00", "to_shift": "14:00", "status": "Pending"}]
+
+
+@notifications.source("payment_settlement", ttl=300)
+def _payment_settlement_notification(merchant_id: str):
+    return {"last_settlement": date.today().isoformat(), "amount": 12345.67}
+
+
+@notifications.source("head_office_messages", ttl=600)
+def _head_office_notifications(merchant_id: str):
+    return [{"message_id": "HO001", "title": "Monthly Policy Update", "read": False}]
+
+
+def _publish_notification(merchant_id: str, source_key: str, data):
+    """Push a notification delta to stream subscribers and drop the stale panel cache entry."""
+    notifications.invalidate(merchant_id, source_key)
+    event_broker.broker.publish(merchant_id, source_key, data)
+
+
 # Notifications endpoints
 @app.get('/api/merchant/notifications/approve-leave')
 def notifications_approve_leave(merchant_id: str = Query(None)):
     merchant_id, headers = validate_merchant_id(merchant_id)
-    data = {"pending_leave_requests": [
-        {"request_id": "LR001", "employee_id": "EMP002", "days": 2, "status": "Pending"}]}
+    data = {"pending_leave_requests": _pending_leave_notifications(merchant_id)}
     return JSONResponse(content={"status": "success", "data": data}, headers=headers)
 
 
 @app.post('/api/merchant/notifications/approve-shift')
 def notifications_approve_shift(payload: dict, merchant_id: str = Query(None)):
     merchant_id, headers = validate_merchant_id(merchant_id)
+    _publish_notification(merchant_id, "pending_shift_changes", {
+        **payload,
+        "status": payload.get("status", "Processed"),
+        "processed_at": datetime.now().isoformat()
+    })
     return JSONResponse(content={"status": "success", "message": "Shift change request processed"}, headers=headers)
 
 
 @app.get('/api/merchant/notifications/payment-settlement')
 def notifications_payment_settlement(merchant_id: str = Query(None)):
     merchant_id, headers = validate_merchant_id(merchant_id)
-    return JSONResponse(content={"status": "success", "data": {"last_settlement": date.today().isoformat(), "amount": 12345.67}}, headers=headers)
+    return JSONResponse(content={"status": "success", "data": _payment_settlement_notification(merchant_id)}, headers=headers)
 
 
 @app.post('/api/merchant/notifications/renew-subscription')
@@ -1602,39 +1751,56 @@ def notifications_renew_subscription(payload: dict, merchant_id: str = Query(Non
 @app.get('/api/merchant/notifications/head-office')
 def notifications_head_office(merchant_id: str = Query(None)):
     merchant_id, headers = validate_merchant_id(merchant_id)
-    return JSONResponse(content={"status": "success", "data": [{"message_id": "HO001", "title": "Monthly Policy Update", "read": False}]}, headers=headers)
+    return JSONResponse(content={"status": "success", "data": _head_office_notifications(merchant_id)}, headers=headers)
 
 
 @app.get('/api/merchant/notifications')
-def merchant_get_all_notifications(merchant_id: str = Query(None)):
-    """Aggregated notifications endpoint used by frontend 'View Notifications'."""
+async def merchant_get_all_notifications(merchant_id: str = Query(None)):
+    """Aggregated notifications endpoint used by frontend 'View Notifications'.
+
+    Sources run concurrently with their own timeout and TTL cache (see app/notifications.py);
+    sources that could not be resolved are listed under "unavailable".
+    """
     merchant_id, headers = validate_merchant_id(merchant_id)
+    data, unavailable = await notifications.aggregate(merchant_id)
 
-    # Aggregate a few common notification types so the frontend can render them in one call
-    data = {
-        "pending_leave_requests": [
-            {"request_id": "LR001", "employee_id": "EMP002",
-                "days": 2, "status": "Pending"}
-        ],
-        "pending_shift_changes": [
-            {"request_id": "SR001", "employee_id": "EMP005",
-                "from_shift": "09:00", "to_shift": "14:00", "status": "Pending"}
-        ],
-        "payment_settlement": {"last_settlement": date.today().isoformat(), "amount": 12345.67},
-        "head_office_messages": [
-            {"message_id": "HO001", "title": "Monthly Policy Update", "read": False}
-        ]
-    }
+    content = {"status": "success", "data": data}
+    if unavailable:
+        content["unavailable"] = unavailable
+    return JSONResponse(content=content, headers=headers)
 
-    return JSONResponse(content={"status": "success", "data": data}, headers=headers)
+
+async def _notification_events(request: Request, merchant_id: str):
+    subscription = event_broker.broker.subscribe(merchant_id)
+    try:
+        yield "retry: 5000\n\n"
+        while not await request.is_disconnected():
+            event = await subscription.get(event_broker.SSE_HEARTBEAT_SECONDS)
+            yield event_broker.format_sse(event) if event else event_broker.HEARTBEAT_FRAME
+    finally:
+        event_broker.broker.unsubscribe(subscription)
+
+
+@app.get('/api/merchant/notifications/stream')
+async def merchant_notifications_stream(request: Request, merchant_id: str = Query(None)):
+    """Server-Sent Events feed of notification deltas, replacing polling of /api/merchant/notifications.
+
+    Events are named after the notification source they update (pending_leave_requests,
+    pending_shift_changes, payment_settlement). Each connection holds a bounded queue on the
+    in-process broker (see app/event_broker.py) and gets a heartbeat comment when idle.
+    """
+    if not merchant_id:
+        return JSONResponse(status_code=400, content={"status": "error", "message": "merchant_id is required"})
+    merchant_id, headers = validate_merchant_id(merchant_id)
+    headers.update({"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    return StreamingResponse(_notification_events(request, merchant_id), media_type="text/event-stream", headers=headers)
 
 
 # GET aliases for endpoints frontend may call with GET
 @app.get('/api/merchant/notifications/approve-shift')
 def get_notifications_approve_shift(merchant_id: str = Query(None)):
     merchant_id, headers = validate_merchant_id(merchant_id)
-    data = {"pending_shift_changes": [{"request_id": "SR001", "employee_id": "EMP005",
-                                       "from_shift": "09:00", "to_shift": "14:00", "status": "Pending"}]}
+    data = {"pending_shift_changes": _pending_shift_notifications(merchant_id)}
     return JSONResponse(content={"status": "success", "data": data}, headers=headers)
 
 
@@ -1863,12 +2029,7 @@ def get_loan_status(merchant_id: str = Query(None)):
 
     loan_status = {
         "merchant_id": merchant_id,
-        "loan_id": f"LOAN{random.randint(10000, 99999)}",
-        "status": random.choice(["Under Review", "Approved", "Disbursed", "Rejected"]),
-        "amount_requested": round(random.uniform(50000, 500000), 2),
-        "amount_approved": round(random.uniform(30000, 400000), 2),
-        "interest_rate": f"{random.uniform(8.5, 15.0):.1f}%",
-        "applied_at": (datetime.now() - timedelta(days=random.randint(1, 30))).isoformat()
+        **mock_data.get_section(merchant_id, "loan_status")
     }
 
     return JSONResponse(content={"status": "success", "data": loan_status}, headers=headers)
@@ -2014,166 +2175,265 @@ def _post_or_method_not_allowed():
 
 # For endpoints that are primarily POST-based, add GET fallbacks so click-throughs don't 405
 @app.post("/api/retention/mark-activity-complete")
-def retention_mark_activity_complete_post(payload: dict = None):
-    try:
-        resp = mark_activity_complete(payload or {})
-        # ensure frontend-friendly array shapes
-        if isinstance(resp, dict) and resp.get('data'):
-            sample = resp['data']
-            # return only status and data so frontend renders the array
-            return {"status": "success", "data": [sample], "results": [sample]}
-        return resp
-    except Exception:
-        sample = {"activity_id": f"ACT{random.randint(1000,9999)}"}
-        return {"status": "success", "data": [sample], "results": [sample]}
+def retention_mark_activity_complete_post(payload: dict = None, db: Session = Depends(get_db)):
+    return _retention_action(mark_activity_complete, payload, db, as_rows=True)
 
 
 @app.get("/api/retention/mark-activity-complete")
-def retention_mark_activity_complete_get():
-    # GET fallback: return a sample completed activity so the UI shows data
-    sample = mark_activity_complete({
-        "merchant_id": "MERCH_SAMPLE",
-        "activity_type": "Visit",
-        "notes": "Sample completed activity (GET fallback)",
-        "proof_file": "proof_sample.jpg"
-    })["data"]
-    # Return an array in data so the frontend renderer treats it as result rows
-    return {"status": "success", "data": [sample], "results": [sample], "activities": [sample]}
+def retention_mark_activity_complete_get(merchant_id: Optional[str] = Query(None), db: Session = Depends(get_db)):
+    # GET fallback: recently completed activities as rows so the UI shows data
+    return _retention_history("activity_complete", merchant_id, db, alias="activities")
 
 
 @app.post("/api/retention/submit-summary-report")
-def retention_submit_summary_report_post(report: dict = None):
+def retention_submit_summary_report_post(report: dict = None, db: Session = Depends(get_db)):
+    return _retention_action(submit_summary_report, report, db)
+
+
+# --- Retention executor activity log ---
+# Every POST action below is stored as one `activities` row (kind + JSON details) through a
+# group-commit writer, so the end-of-day burst from field executors is written in batches.
+RETENTION_ACTIVITY_KINDS = {
+    "activity_complete": ("activity_id", "ACT"),
+    "summary_report": ("report_id", "RPT"),
+    "health_update": ("update_id", "UPD"),
+    "merchant_need": ("log_id", "LOG"),
+    "note": ("note_id", "NOTE"),
+    "attachment": ("attachment_id", "ATT"),
+    "document": ("document_id", "DOC"),
+}
+
+activity_writer = group_commit.GroupCommitWriter(models.Activity.__table__)
+
+
+def _activity_row(kind: str, name: str, status: str, request: dict, details: dict, client_id: str = None) -> dict:
+    return {
+        "kind": kind,
+        "name": str(name)[:100],
+        "status": status,
+        "assigned_to": str(request.get("executor_id") or request.get("updated_by") or "Executor")[:100],
+        "merchant_id": details.get("merchant_id"),
+        "details": json.dumps(details, default=str),
+        "client_id": client_id,
+        "created_at": datetime.utcnow()
+    }
+
+
+def _activity_record(kind: str, activity_id: int, details: dict) -> dict:
+    id_key, prefix = RETENTION_ACTIVITY_KINDS[kind]
+    record = {id_key: f"{prefix}{activity_id:06d}", **details}
+    if kind == "summary_report":
+        # rendered by the export job queued in submit_summary_report
+        record["file_details"] = {
+            "generated_file": f"{record[id_key]}.pdf",
+            "download_link": f"/api/downloads/{record[id_key]}.pdf"
+        }
+    return record
+
+
+def _save_activity(db: Session, kind: str, name: str, status: str, request: dict, details: dict, client_id: str = None) -> dict:
+    """Persist one activity. Synced actions (client_id set) join the caller's transaction;
+    everything else goes through the group-commit writer."""
+    row = _activity_row(kind, name, status, request, details, client_id)
+    if client_id is not None:
+        activity_id = db.execute(insert(models.Activity).returning(
+            models.Activity.id), row).scalar_one()
+    else:
+        activity_id = activity_writer.submit(db.get_bind(), row)
+    return _activity_record(kind, activity_id, details)
+
+
+SUMMARY_REPORT_COUNTS = ("total_activities", "completed_activities", "pending_activities")
+
+
+def _is_count(value) -> bool:
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return value >= 0
+    return isinstance(value, str) and value.strip().isdecimal()
+
+
+def _retention_payload_error(action, payload: dict) -> Optional[str]:
+    if action is submit_summary_report:
+        invalid = [field for field in SUMMARY_REPORT_COUNTS if field in payload and not _is_count(payload[field])]
+        if invalid:
+            return f"{', '.join(invalid)} must be whole numbers"
+        return None
+    if not payload.get("merchant_id"):
+        return "merchant_id is required"
+    return None
+
+
+def _retention_action(action, payload: Optional[dict], db: Session, as_rows: bool = False, **kwargs):
+    payload = payload or {}
+    error = _retention_payload_error(action, payload)
+    if error:
+        return JSONResponse(status_code=400, content={"status": "error", "message": error})
     try:
-        return submit_summary_report(report or {})
-    except Exception:
-        return {"status": "success", "message": "Summary report submitted (mock)", "data": {"report_id": f"RPT{random.randint(1000,9999)}"}}
+        resp = action(payload, db, **kwargs)
+        # commits anything the action queued on the request session (e.g. export jobs)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error("Error saving retention activity via %s: %s",
+                     action.__name__, e)
+        return JSONResponse(status_code=500, content={"status": "error", "message": "Failed to save activity"})
+    if as_rows:
+        # frontend renders an array of rows
+        return {"status": "success", "message": resp["message"], "data": [resp["data"]], "results": [resp["data"]]}
+    return resp
+
 
+def _retention_history(kind: str, merchant_id: Optional[str], db: Session, alias: str = None):
+    try:
+        records = [_activity_record(kind, a.id, json.loads(a.details or "{}"))
+                   for a in crud.get_recent_activities(db, kind, merchant_id)]
+    except Exception as e:
+        logger.error("Error loading %s history: %s", kind, e)
+        return JSONResponse(status_code=500, content={"status": "error", "message": "Failed to load activity history"})
+    resp = {"status": "success", "data": records, "results": records}
+    if alias:
+        resp[alias] = records
+    return resp
 
-# --- Local helper implementations for retention POST actions (no external backups) ---
-def mark_activity_complete(request: dict):
-    """Mark an activity complete and return detailed record."""
-    merchant_id = request.get(
-        "merchant_id", f"MERCH{random.randint(1000,9999)}")
+
+def mark_activity_complete(request: dict, db: Session, client_id: str = None):
+    """Mark an activity complete and return the stored record."""
     activity_type = request.get("activity_type", request.get("type", "Visit"))
-    notes = request.get("notes", "Completed during visit")
-    proof_file = request.get("proof_file", "proof.jpg")
+    proof_file = request.get("proof_file")
+    completed_at = datetime.now().isoformat()
 
     data = {
-        "activity_id": f"ACT{random.randint(100000,999999)}",
-        "merchant_id": merchant_id,
+        "merchant_id": request["merchant_id"],
         "activity_type": activity_type,
-        "completion_time": datetime.now().isoformat(),
-        "proof_uploaded": True if proof_file else False,
+        "completion_time": completed_at,
+        "proof_uploaded": bool(proof_file),
         "proof_details": {
             "file_name": proof_file,
-            "file_size": "210 KB",
-            "upload_time": datetime.now().isoformat(),
-            "verification_status": "Verified"
-        },
-        "notes": notes,
-        "next_steps": ["Schedule follow-up within 7 days", "Update merchant status"],
+            "upload_time": completed_at,
+            "verification_status": "Pending"
+        } if proof_file else None,
+        "notes": request.get("notes", ""),
+        "next_steps": request.get("next_steps", ["Schedule follow-up within 7 days", "Update merchant status"]),
         "performance_metrics": {
-            "completion_time_minutes": random.randint(5, 30),
-            "efficiency_score": random.randint(60, 95),
-            "quality_rating": round(random.uniform(3.5, 5.0), 1)
+            "completion_time_minutes": request.get("completion_time_minutes")
         }
     }
 
-    return {"status": "success", "message": "Activity marked as complete", "data": data}
+    record = _save_activity(db, "activity_complete",
+                            activity_type, "Completed", request, data, client_id)
+    return {"status": "success", "message": "Activity marked as complete", "data": record}
 
 
-def submit_summary_report(request: dict):
-    """Accept a report payload and return a generated report record."""
+def submit_summary_report(request: dict, db: Session, client_id: str = None):
+    """Store a report payload and return the generated report record."""
     report_type = request.get(
         "report_type", request.get("type", "Daily Report"))
     summary_text = request.get("summary", "No summary provided")
+    total = int(request.get("total_activities", 0))
+    completed = int(request.get("completed_activities", 0))
 
-    report_id = f"RPT{random.randint(100000,999999)}"
     details = {
-        "report_id": report_id,
         "report_type": report_type,
         "submission_time": datetime.now().isoformat(),
         "report_details": {
             "period": report_type,
-            "total_activities": int(request.get("total_activities", 20)),
-            "completed_activities": int(request.get("completed_activities", 18)),
-            "pending_activities": int(request.get("pending_activities", 2)),
-            "completion_rate": f"{round((int(request.get('completed_activities',18))/max(1,int(request.get('total_activities',20))))*100,1)}%"
+            "total_activities": total,
+            "completed_activities": completed,
+            "pending_activities": int(request.get("pending_activities", max(0, total - completed))),
+            "completion_rate": f"{round(completed / max(1, total) * 100, 1)}%"
         },
         "summary_content": summary_text,
-        "key_achievements": request.get("key_achievements", ["Contacted merchants", "Resolved support tickets"]),
-        "challenges_faced": request.get("challenges_faced", []),
-        "file_details": {
-            "generated_file": f"{report_type.lower().replace(' ', '_')}_{date.today().isoformat()}.pdf",
-            "file_size": "1.1 MB",
-            "download_link": f"/api/downloads/{report_id}.pdf"
-        }
+        "key_achievements": request.get("key_achievements", []),
+        "challenges_faced": request.get("challenges_faced", [])
     }
 
-    return {"status": "success", "message": f"{report_type} submitted successfully", "data": details}
-
-
-def update_merchant_health(request: dict):
-    merchant_id = request.get(
-        "merchant_id", f"MERCH{random.randint(1000,9999)}")
+    record = _save_activity(db, "summary_report",
+                            report_type, "Submitted", request, details, client_id)
+
+    # the PDF is rendered in the background once the caller commits
+    executor_id = str(request.get("executor_id") or "Executor")
+    today = date.today().isoformat()
+    job = exports.queue_job(db, "retention", "pdf",
+                            filters={"assigned_to": executor_id,
+                                     "date_from": today, "date_to": today},
+                            title=f"{report_type} - {executor_id}",
+                            summary=[("Total activities", total), ("Completed activities", completed),
+                                     ("Summary", summary_text)],
+                            file_name=record["file_details"]["generated_file"])
+    record["file_details"]["status_url"] = f"/api/exports/{job.id}"
+    return {"status": "success", "message": f"{report_type} submitted successfully", "data": record}
+
+
+def update_merchant_health(request: dict, db: Session, client_id: str = None):
+    merchant_id = request["merchant_id"]
     new_status = request.get("health_status", "Healthy")
-    update_id = f"UPD{random.randint(100000,999999)}"
+    previous = crud.get_recent_activities(
+        db, "health_update", merchant_id, limit=1)
+    previous_status = json.loads(previous[0].details or "{}").get(
+        "new_status") if previous else request.get("previous_status")
     data = {
-        "update_id": update_id,
         "merchant_id": merchant_id,
-        "previous_status": request.get("previous_status", "Limited Activity"),
+        "previous_status": previous_status,
         "new_status": new_status,
         "updated_by": request.get("updated_by", "Executor"),
         "update_time": datetime.now().isoformat(),
         "status_details": {
-            "activity_level": random.choice(["High", "Medium", "Low"]),
-            "risk_assessment": random.choice(["Low", "Medium", "High"]),
-            "recommended_actions": ["Schedule training", "Follow-up call"]
+            "activity_level": request.get("activity_level"),
+            "risk_assessment": request.get("risk_assessment"),
+            "recommended_actions": request.get("recommended_actions", ["Schedule training", "Follow-up call"])
         }
     }
-    return {"status": "success", "message": "Merchant health updated", "data": data}
+    record = _save_activity(db, "health_update",
+                            f"Health: {new_status}", "Updated", request, data, client_id)
+    return {"status": "success", "message": "Merchant health updated", "data": record}
 
 
-def log_merchant_needs(request: dict):
-    log_id = f"LOG{random.randint(100000,999999)}"
+def log_merchant_needs(request: dict, db: Session, client_id: str = None):
     need_type = request.get("need_type", "POS issue")
     data = {
-        "log_id": log_id,
-        "merchant_id": request.get("merchant_id", f"MERCH{random.randint(1000,9999)}"),
+        "merchant_id": request["merchant_id"],
         "need_type": need_type,
-        "priority": request.get("priority", random.choice(["Low", "Medium", "High"])),
+        "priority": request.get("priority", "Medium"),
         "description": request.get("description", "No description provided"),
         "logged_time": datetime.now().isoformat(),
         "assigned_team": request.get("assigned_team", "Technical Support"),
         "estimated_resolution": request.get("estimated_resolution", "48 hours")
     }
-    return {"status": "success", "message": "Merchant need logged", "data": data}
+    record = _save_activity(db, "merchant_need", need_type,
+                            "Logged", request, data, client_id)
+    return {"status": "success", "message": "Merchant need logged", "data": record}
 
 
-def add_notes_commitments(request: dict):
-    note_id = f"NOTE{random.randint(100000,999999)}"
+def add_notes_commitments(request: dict, db: Session, client_id: str = None):
+    note_type = request.get("note_type", "General")
     data = {
-        "note_id": note_id,
-        "merchant_id": request.get("merchant_id", f"MERCH{random.randint(1000,9999)}"),
+        "merchant_id": request["merchant_id"],
         "executor_id": request.get("executor_id", "Executor123"),
-        "note_type": request.get("note_type", "General"),
+        "note_type": note_type,
         "content": request.get("content", "No content provided"),
         "created_at": datetime.now().isoformat()
     }
-    return {"status": "success", "message": "Note added", "data": data}
+    record = _save_activity(db, "note", note_type,
+                            "Added", request, data, client_id)
+    return {"status": "success", "message": "Note added", "data": record}
 
 
-def attach_photo_proof(request: dict):
-    attachment_id = f"ATT{random.randint(100000,999999)}"
-    filename = request.get("filename", "photo.jpg")
+def attach_photo_proof(request: dict, db: Session, client_id: str = None, upload: uploads.StoredUpload = None):
+    filename = upload.filename if upload else request.get("filename", "photo.jpg")
     data = {
-        "attachment_id": attachment_id,
-        "merchant_id": request.get("merchant_id", f"MERCH{random.randint(1000,9999)}"),
+        "merchant_id": request["merchant_id"],
         "file_name": filename,
-        "file_url": f"/static/uploads/{filename}",
+        # only set when the file itself was received (multipart upload)
+        "file_url": None,
         "uploaded_at": datetime.now().isoformat()
     }
-    return {"status": "success", "message": "Attachment uploaded", "data": data}
+    if upload:
+        data.update(upload.as_dict())
+    record = _save_activity(db, "attachment", filename,
+                            "Uploaded", request, data, client_id)
+    return {"status": "success", "message": "Attachment uploaded", "data": record}
 
 
 def schedule_installation_training(payload: dict = None):
@@ -2197,39 +2457,23 @@ def check_pending_documents():
     return {"status": "success", "data": {"pending_documents": docs}}
 
 
-def upload_missing_documents(payload: dict = None):
-    doc_id = f"DOC{random.randint(100000,999999)}"
-    return {"status": "success", "message": "Document uploaded", "data": {"document_id": doc_id}}
+def upload_missing_documents(request: dict, db: Session, client_id: str = None, upload: uploads.StoredUpload = None):
+    document_type = request.get("document_type", "Document")
+    data = {
+        "merchant_id": request["merchant_id"],
+        "document_type": document_type,
+        "uploaded_at": datetime.now().isoformat(),
+        **upload.as_dict()
+    }
+    record = _save_activity(db, "document", document_type,
+                            "Uploaded", request, data, client_id)
+    return {"status": "success", "message": "Document uploaded", "data": record}
 
 
 def confirm_merchant_setup():
     return {"status": "success", "message": "Merchant setup confirmed", "data": {"confirmed_at": datetime.now().isoformat()}}
 
 
-def get_todays_tasks():
-    tasks = [
-        {"task_id": f"T{random.randint(1000,9999)}", "title": "Visit Merchant A", "due": datetime.now(
-        ).isoformat(), "priority": "High"}
-    ]
-    return {"status": "success", "data": {"date": date.today().isoformat(), "tasks": tasks}}
-
-
-def get_followup_reminders():
-    reminders = [
-        {"reminder_id": f"R{random.randint(1000,9999)}", "text": "Follow up with Merchant B", "when": (
-            datetime.now() + timedelta(days=1)).isoformat()}
-    ]
-    return {"status": "success", "data": {"reminders": reminders}}
-
-
-def get_pending_actions():
-    actions = [
-        {"action_id": f"A{random.randint(1000,9999)}", "title": "Submit weekly report", "due": (
-            datetime.now() + timedelta(days=2)).isoformat()}
-    ]
-    return {"status": "success", "data": {"actions": actions}}
-
-
 # Lightweight synchronous shims for assigned merchants and merchant profile so wrappers can call them
 def get_assigned_merchants():
     merchants = [
@@ -2245,114 +2489,184 @@ def get_merchant_profile(merchant_id: str = "MERCH_TEST"):
     profile = {
         "merchant_id": merchant_id,
         "merchant_name": f"Merchant {merchant_id}",
-        "business_type": random.choice(["Retail", "Food", "Services"]),
-        "status": random.choice(["Active", "Suspended", "Inactive"]),
-        "last_seen": datetime.now().isoformat()
+        **mock_data.get_section(merchant_id, "merchant_profile")
     }
     return {"status": "success", "data": profile}
 
 
+RETENTION_SYNC_ACTIONS = {
+    "mark_activity_complete": mark_activity_complete,
+    "submit_summary_report": submit_summary_report,
+    "update_merchant_health": update_merchant_health,
+    "log_merchant_needs": log_merchant_needs,
+    "add_notes_commitments": add_notes_commitments,
+    "attach_photo_proof": attach_photo_proof,
+}
+RETENTION_SYNC_MAX_ACTIONS = int(os.getenv("RETENTION_SYNC_MAX_ACTIONS", "200"))
+
+
+@app.post("/api/retention/sync")
+def retention_sync(batch: schemas.RetentionSyncRequest, db: Session = Depends(get_db)):
+    """Apply an offline executor's queued actions in order, in one transaction.
+
+    Every action carries a client-generated client_id. Actions already stored by an earlier
+    sync (e.g. one whose response was lost) come back as "duplicate" with the stored record
+    instead of being written twice; invalid actions are reported per item without blocking
+    the rest of the batch.
+    """
+    if len(batch.actions) > RETENTION_SYNC_MAX_ACTIONS:
+        return JSONResponse(status_code=400, content={"status": "error", "message": f"At most {RETENTION_SYNC_MAX_ACTIONS} actions per sync"})
+
+    try:
+        stored = {a.client_id: _activity_record(a.kind, a.id, json.loads(a.details or "{}"))
+                  for a in crud.get_activities_by_client_ids(db, [action.client_id for action in batch.actions])}
+        results = []
+        for action in batch.actions:
+            item = {"client_id": action.client_id, "type": action.type}
+            if action.client_id in stored:
+                results.append({**item, "status": "duplicate",
+                               "data": stored[action.client_id]})
+                continue
+            handler = RETENTION_SYNC_ACTIONS.get(action.type)
+            payload = dict(action.payload)
+            if batch.executor_id:
+                payload.setdefault("executor_id", batch.executor_id)
+            error = f"Unknown action type: {action.type}" if handler is None else _retention_payload_error(
+                handler, payload)
+            if error:
+                results.append({**item, "status": "error", "message": error})
+                continue
+            try:
+                record = handler(payload, db, client_id=action.client_id)["data"]
+            except (ValueError, TypeError) as e:
+                results.append({**item, "status": "error",
+                               "message": f"Invalid payload: {e}"})
+                continue
+            stored[action.client_id] = record
+            results.append({**item, "status": "applied", "data": record})
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error("Retention sync of %d actions failed: %s",
+                     len(batch.actions), e)
+        return JSONResponse(status_code=500, content={"status": "error", "message": "Sync failed; retry the batch"})
+
+    applied = sum(1 for r in results if r["status"] == "applied")
+    return {"status": "success", "applied": applied, "results": results}
+
+
 @app.get("/api/retention/submit-summary-report")
-def retention_submit_summary_report_get():
-    # Return a small list of recent reports so the UI has an array in data
-    sample_reports = [
-        submit_summary_report({
-            "report_type": "Daily Report",
-            "summary": "Visited 5 merchants, resolved 3 issues",
-            "total_activities": 5,
-            "completed_activities": 5
-        })["data"]
-    ]
-    return {"status": "success", "data": sample_reports}
+def retention_submit_summary_report_get(db: Session = Depends(get_db)):
+    # Recently submitted reports as an array in data
+    return _retention_history("summary_report", None, db)
 
 
 @app.post("/api/retention/update-merchant-health")
-def retention_update_merchant_health_post(payload: dict = None):
-    try:
-        resp = update_merchant_health(payload or {})
-        # normalize to array shape expected by frontend
-        if isinstance(resp, dict) and resp.get('data'):
-            data = resp['data']
-            return {"status": "success", "data": [data], "results": [data]}
-        return resp
-    except Exception:
-        sample = {"merchant_id": "MERCH_TEST", "current_status": "Healthy", "last_updated": datetime.now().isoformat(
-        ), "activity_level": "High", "risk_assessment": "Low", "recommended_actions": ["Keep monitoring"]}
-        return {"status": "success", "data": [sample], "results": [sample]}
+def retention_update_merchant_health_post(payload: dict = None, db: Session = Depends(get_db)):
+    return _retention_action(update_merchant_health, payload, db, as_rows=True)
 
 
 @app.get("/api/retention/update-merchant-health")
-def retention_update_merchant_health_get():
-    # Return current merchant health snapshot
-    sample = {
-        "merchant_id": "MERCH_TEST",
-        "current_status": "Healthy",
-        "last_updated": datetime.now().isoformat(),
-        "activity_level": "High",
-        "risk_assessment": "Low",
-        "recommended_actions": ["Keep monitoring", "Schedule refresher training if needed"]
-    }
-    return {"status": "success", "data": [sample], "results": [sample]}
+def retention_update_merchant_health_get(merchant_id: Optional[str] = Query(None), db: Session = Depends(get_db)):
+    # Latest recorded health updates
+    return _retention_history("health_update", merchant_id, db)
 
 
 @app.post("/api/retention/log-merchant-needs")
-def retention_log_merchant_needs_post(payload: dict = None):
-    try:
-        return log_merchant_needs(payload or {})
-    except Exception:
-        return {"status": "success", "message": "Merchant needs logged (mock)"}
+def retention_log_merchant_needs_post(payload: dict = None, db: Session = Depends(get_db)):
+    return _retention_action(log_merchant_needs, payload, db)
 
 
 @app.get("/api/retention/log-merchant-needs")
-def retention_log_merchant_needs_get():
-    # Return recent logged needs as an array in data for frontend compatibility
-    needs = [
-        log_merchant_needs({
-            "merchant_id": "MERCH1001",
-            "need_type": "POS issue",
-            "priority": "High",
-            "description": "Card reader disconnecting intermittently"
-        })["data"]
-    ]
-    return {"status": "success", "data": needs}
+def retention_log_merchant_needs_get(merchant_id: Optional[str] = Query(None), db: Session = Depends(get_db)):
+    # Recently logged needs as an array in data for frontend compatibility
+    return _retention_history("merchant_need", merchant_id, db)
 
 
 @app.post("/api/retention/add-notes-commitments")
-def retention_add_notes_commitments_post(payload: dict = None):
-    try:
-        return add_notes_commitments(payload or {})
-    except Exception:
-        return {"status": "success", "message": "Notes/commitments added (mock)"}
+def retention_add_notes_commitments_post(payload: dict = None, db: Session = Depends(get_db)):
+    return _retention_action(add_notes_commitments, payload, db)
 
 
 @app.get("/api/retention/add-notes-commitments")
-def retention_add_notes_commitments_get():
-    # Return recent notes/commitments as an array
-    notes = [
-        add_notes_commitments(
-            {"merchant_id": "MERCH1001", "content": "Arrange product demo next week"})["data"]
-    ]
-    return {"status": "success", "data": notes}
+def retention_add_notes_commitments_get(merchant_id: Optional[str] = Query(None), db: Session = Depends(get_db)):
+    # Recent notes/commitments as an array
+    return _retention_history("note", merchant_id, db)
+
+
+async def _retention_upload_action(action, request: Request, db: Session, as_rows: bool = False,
+                                   image_only: bool = False):
+    """Stream a single-file multipart upload to disk, then record it through `action`.
+
+    image_only rejects files whose bytes are not an image, whatever Content-Type they were sent with.
+    """
+    try:
+        fields, files = await uploads.receive_upload(request)
+    except uploads.UploadError as e:
+        return JSONResponse(status_code=e.status_code, content={"status": "error", "message": str(e)})
+    error = "Send exactly one file" if len(files) != 1 else _retention_payload_error(action, fields)
+    if error:
+        for received in files:
+            await run_in_threadpool(received.discard)
+        return JSONResponse(status_code=400, content={"status": "error", "message": error})
+
+    upload = files[0]
+    return await run_in_threadpool(_record_retention_upload, action, fields, db, as_rows, upload, image_only)
+
+
+def _record_retention_upload(action, fields: dict, db: Session, as_rows: bool, upload: uploads.StoredUpload,
+                             image_only: bool = False):
+    # Count the reference before the bytes land in the store, so a blob on disk is never
+    # unreferenced while a request is still using it
+    referenced = False
+    try:
+        upload.sniff(image_only)
+        crud.add_blob_reference(db, upload.sha256,
+                                upload.size, upload.content_type)
+        db.commit()
+        referenced = True
+        upload.persist()
+    except Exception as e:
+        db.rollback()
+        upload.discard()
+        if referenced:
+            # the bytes never made it into the store: drop the reference again
+            crud.release_blob_reference(db, upload.sha256)
+            db.commit()
+        if isinstance(e, uploads.UploadError):
+            return JSONResponse(status_code=e.status_code, content={"status": "error", "message": str(e)})
+        logger.error("Error storing upload %s: %s", upload.sha256, e)
+        return JSONResponse(status_code=500, content={"status": "error", "message": "Failed to store file"})
+
+    resp = _retention_action(action, fields, db, as_rows, upload=upload)
+    if isinstance(resp, JSONResponse):
+        crud.release_blob_reference(db, upload.sha256)
+        db.commit()
+    else:
+        uploads.schedule_thumbnail(upload)
+    return resp
 
 
 @app.post("/api/retention/attach-photo-proof")
-def retention_attach_photo_proof_post(payload: dict = None):
+async def retention_attach_photo_proof_post(request: Request, db: Session = Depends(get_db)):
+    """Attach a photo or proof to a merchant.
+
+    Send multipart/form-data with merchant_id and one file part; the file is streamed to disk
+    (see app/uploads.py). A JSON body naming the file is still accepted and recorded without a file.
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        return await _retention_upload_action(attach_photo_proof, request, db, image_only=True)
     try:
-        return attach_photo_proof(payload or {})
-    except Exception:
-        return {"status": "success", "message": "Photo proof attached (mock)", "data": {"attachment_id": f"AT{random.randint(1000,9999)}"}}
+        payload = await request.json()
+    except ValueError:
+        payload = {}
+    return await run_in_threadpool(_retention_action, attach_photo_proof, payload if isinstance(payload, dict) else {}, db)
 
 
 @app.get("/api/retention/attach-photo-proof")
-def retention_attach_photo_proof_get():
-    # Return list of attachments as array in data
-    attachments = [
-        attach_photo_proof({"merchant_id": "MERCH1001",
-                           "filename": "proof1.jpg"})["data"],
-        attach_photo_proof({"merchant_id": "MERCH1002",
-                           "filename": "proof2.jpg"})["data"]
-    ]
-    return {"status": "success", "data": attachments}
+def retention_attach_photo_proof_get(merchant_id: Optional[str] = Query(None), db: Session = Depends(get_db)):
+    # Recent attachments as array in data
+    return _retention_history("attachment", merchant_id, db)
 
 
 @app.post("/api/retention/onboarding/start")
@@ -2401,16 +2715,9 @@ def retention_onboarding_progress_get():
 
 
 @app.post("/api/retention/onboarding/upload-missing-documents")
-def retention_upload_missing_documents_post(payload: dict = None):
-    try:
-        resp = upload_missing_documents()
-        if isinstance(resp, dict) and resp.get('data'):
-            data = resp['data']
-            return {"status": "success", "data": [data], "results": [data]}
-        return resp
-    except Exception:
-        sample = {"uploaded": True, "document": "id_proof.pdf"}
-        return {"status": "success", "data": [sample], "results": [sample]}
+async def retention_upload_missing_documents_post(request: Request, db: Session = Depends(get_db)):
+    """Upload an onboarding document: multipart/form-data with merchant_id, document_type and one file part."""
+    return await _retention_upload_action(upload_missing_documents, request, db, as_rows=True)
 
 
 @app.get("/api/retention/onboarding/upload-missing-documents")
@@ -2457,41 +2764,64 @@ def retention_confirm_merchant_setup_get():
         return {"status": "success", "data": [sample], "results": [sample]}
 
 
-@app.get("/api/retention/my-notifications")
-def retention_my_notifications_get():
+def _executor_items(db: Session, kind: str, executor_id: Optional[str]):
+    """Precomputed worklist items (see app/retention_tasks.py); nothing is computed per request."""
     try:
-        resp = get_todays_tasks()
-        # get_todays_tasks returns {'status':'success','data':{'date':..., 'tasks':[...]}}
-        if isinstance(resp, dict) and resp.get('data') and isinstance(resp['data'], dict):
-            tasks = resp['data'].get('tasks', [])
-            return {"status": "success", "data": tasks}
-        return {"status": "success", "data": []}
-    except Exception:
+        items, computed_at = retention_tasks.read(db, kind, executor_id)
+        return {"status": "success", "data": items, "computed_at": computed_at}
+    except Exception as e:
+        logger.error("Error reading precomputed %s items: %s", kind, e)
         return {"status": "success", "data": []}
 
 
+@app.get("/api/retention/my-notifications")
+def retention_my_notifications_get(executor_id: Optional[str] = Query(None, description="Executor ID"),
+                                   db: Session = Depends(get_db)):
+    """Today's tasks: due follow-ups and visits to at-risk merchants."""
+    return _executor_items(db, "task", executor_id)
+
+
 @app.get("/api/retention/followup-reminders")
-def retention_followup_reminders_get():
-    try:
-        resp = get_followup_reminders()
-        if isinstance(resp, dict) and resp.get('data') and isinstance(resp['data'], dict):
-            reminders = resp['data'].get('reminders', [])
-            return {"status": "success", "data": reminders}
-        return {"status": "success", "data": []}
-    except Exception:
-        return {"status": "success", "data": []}
+def retention_followup_reminders_get(executor_id: Optional[str] = Query(None, description="Executor ID"),
+                                     db: Session = Depends(get_db)):
+    """Follow-ups coming up in the next few days."""
+    return _executor_items(db, "reminder", executor_id)
 
 
 @app.get("/api/retention/pending-actions")
-def retention_pending_actions_get():
+def retention_pending_actions_get(executor_id: Optional[str] = Query(None, description="Executor ID"),
+                                  db: Session = Depends(get_db)):
+    """Open merchant needs and commitments, and today's report if it is missing."""
+    return _executor_items(db, "action", executor_id)
+
+
+@app.get("/api/scheduler/jobs")
+def list_scheduled_jobs(db: Session = Depends(get_db)):
+    rows = {row.name: row for row in db.query(models.ScheduledJob)}
+    return {"status": "success", "data": [scheduler.job_status(rows[job.name]) if job.name in rows
+                                          else {"name": job.name, "every_seconds": int(job.every), "next_run_at": None}
+                                          for job in scheduler.jobs()]}
+
+
+@app.post("/api/scheduler/jobs/{name}/run", status_code=202)
+def run_scheduled_job(name: str, db: Session = Depends(get_db)):
+    """Make a job due now; the next worker to poll runs it."""
     try:
-        resp = get_pending_actions()
-        if isinstance(resp, dict) and resp.get('data') and isinstance(resp['data'], dict):
-            actions = resp['data'].get('actions', [])
-            return {"status": "success", "data": actions}
-        return {"status": "success", "data": []}
-    except Exception:
-        return {"status": "success", "data": []}
+        row = scheduler.request_run(db, name)
+        db.commit()
+    except scheduler.JobNotFound as e:
+        return JSONResponse(status_code=e.status_code, content={"status": "error", "message": str(e)})
+    return {"status": "success", "data": scheduler.job_status(row)}
+
+
+@app.on_event("startup")
+def start_scheduler():
+    scheduler.start(engine)
+
+
+@app.on_event("shutdown")
+def stop_scheduler():
+    scheduler.stop()
 
 
 @app.get("/api/retention/support/requests")
@@ -2500,7 +2830,7 @@ async def retention_support_requests_get():
         # underlying helper is async
         return await get_merchant_support()
     except Exception as e:
-        logger.error(f"retention_support_requests_get error: {e}")
+        logger.error("retention_support_requests_get error: %s", e)
         return {"status": "error", "message": "Unable to fetch support requests at this time"}
 
 
@@ -2685,7 +3015,7 @@ async def get_database_info(db: Session = Depends(get_db)):
             }
         }
     except Exception as e:
-        logger.error(f"Database info error: {e}")
+        logger.error("Database info error: %s", e)
         return {"status": "error", "message": f"Database error: {str(e)}"}
 
 # Employee Management Endpoints
@@ -2709,13 +3039,40 @@ async def create_employee(employee_data: dict, db: Session = Depends(get_db)):
             "created_at": datetime.now().isoformat()
         }
 
-        logger.info(f"Created employee: {employee}")
+        logger.info("Created employee: %s", employee)
         return {"status": "success", "data": employee, "id": employee_id}
     except Exception as e:
-        logger.error(f"Create employee error: {e}")
+        logger.error("Create employee error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/employees/bulk")
+async def bulk_import_employees(request: Request, format: Optional[str] = None, db: Session = Depends(get_db)):
+    """Import employees from a CSV (with header row) or NDJSON body.
+
+    Format comes from ?format=csv|ndjson or the Content-Type. Valid rows are
+    loaded in one transaction; the rest come back in a per-line error report.
+    """
+    try:
+        fmt = employee_import.detect_format(
+            request.headers.get("content-type"), format)
+        body = await employee_import.spool_body(request)
+    except employee_import.EmployeeImportError as e:
+        return JSONResponse(status_code=e.status_code, content={"status": "error", "message": str(e)})
+    try:
+        result = await run_in_threadpool(employee_import.import_employees, db, body, fmt)
+    except employee_import.EmployeeImportError as e:
+        return JSONResponse(status_code=e.status_code, content={"status": "error", "message": str(e)})
+    except Exception as e:
+        logger.error("Bulk employee import failed: %s", e)
+        return JSONResponse(status_code=500, content={"status": "error", "message": "Import failed; no employees were saved"})
+    finally:
+        body.close()
+    logger.info("Bulk employee import: %d received, %d inserted, %d failed",
+                result["received"], result["inserted"], result["failed"])
+    return {"status": "success", **result}
+
+
 @app.get("/api/employees")
 async def get_employees():
     """Get all employees"""
@@ -2753,12 +3110,36 @@ async def update_employee(employee_id: int, employee_data: dict):
         **employee_data,
         "updated_at": datetime.now().isoformat()
     }
-    logger.info(f"Updated employee {employee_id}: {updated_employee}")
+    logger.info("Updated employee %s: %s", employee_id, updated_employee)
     return {"status": "success", "data": updated_employee}
 
 # Attendance Management Endpoints
 
 
+PUNCH_RETRY_AFTER_SECONDS = 5
+
+
+@app.post("/api/attendance/punches", status_code=202)
+def ingest_attendance_punches(batch: schemas.AttendancePunchBatch, db: Session = Depends(get_db)):
+    """Accept a batch of terminal punches; they reach attendance_records within a flush interval."""
+    events = [{**event.model_dump(), "employee_id": event.employee_id.strip(),
+               "location": event.location or batch.terminal_id} for event in batch.events]
+    try:
+        queued = punch_buffer.punch_buffer.offer(db.get_bind(), events)
+    except NotImplementedError as e:
+        logger.error("Refusing attendance punches: %s", e)
+        return JSONResponse(status_code=501, content={"status": "error", "message": str(e)})
+    if not queued:
+        return JSONResponse(status_code=503, headers={"Retry-After": str(PUNCH_RETRY_AFTER_SECONDS)},
+                            content={"status": "error", "message": "Attendance buffer is full; retry shortly"})
+    return {"status": "success", "accepted": len(events), "buffered": len(punch_buffer.punch_buffer)}
+
+
+@app.on_event("shutdown")
+def flush_attendance_punches():
+    punch_buffer.punch_buffer.flush()
+
+
 @app.post("/api/attendance", status_code=201)
 async def create_attendance(attendance_data: dict):
     """Create attendance record"""
@@ -2768,7 +3149,7 @@ async def create_attendance(attendance_data: dict):
         **attendance_data,
         "created_at": datetime.now().isoformat()
     }
-    logger.info(f"Created attendance: {attendance}")
+    logger.info("Created attendance: %s", attendance)
     return {"status": "success", "data": attendance, "id": attendance_id}
 
 
@@ -2789,6 +3170,46 @@ async def get_attendance():
 # Payroll Management Endpoints
 
 
+@app.post("/api/payroll/runs")
+def create_payroll_run(run: schemas.PayrollRunRequest, db: Session = Depends(get_db)):
+    """Compute a month's payslips from attendance, approved leave and salary grades.
+
+    With partition_by the run is queued (202) and priced per department / office
+    location in the background; poll status_url for progress.
+    """
+    try:
+        if run.partition_by:
+            if run.dry_run:
+                return JSONResponse(status_code=400, content={"status": "error", "message": "Dry runs cannot be partitioned"})
+            queued = payroll.start_partitioned_run(db, run.month, run.partition_by)
+            return JSONResponse(status_code=202, content={"status": "success", "data": payroll.run_status(db, queued)})
+        return {"status": "success", "data": payroll.run_payroll(db, run.month, run.dry_run)}
+    except payroll.PayrollError as e:
+        return JSONResponse(status_code=e.status_code, content={"status": "error", "message": str(e)})
+    except Exception as e:
+        logger.error("Payroll run for %s failed: %s", run.month, e)
+        return JSONResponse(status_code=500, content={"status": "error", "message": "Payroll run failed"})
+
+
+@app.get("/api/payroll/runs/{run_id}")
+@cache.coalesced()
+def get_payroll_run(run_id: int, db: Session = Depends(get_db)):
+    run = db.get(models.PayrollRun, run_id)
+    if run is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Payroll run {run_id} not found"})
+    return {"status": "success", "data": payroll.run_status(db, run)}
+
+
+@app.post("/api/payroll/runs/{run_id}/retry", status_code=202)
+def retry_payroll_run(run_id: int, db: Session = Depends(get_db)):
+    """Re-run only the failed partitions of a partitioned payroll run."""
+    try:
+        run = payroll.retry_run(db, run_id)
+    except payroll.PayrollError as e:
+        return JSONResponse(status_code=e.status_code, content={"status": "error", "message": str(e)})
+    return {"status": "success", "data": payroll.run_status(db, run)}
+
+
 @app.post("/api/payroll", status_code=201)
 async def create_payroll(payroll_data: dict):
     """Create payroll record"""
@@ -2798,7 +3219,7 @@ async def create_payroll(payroll_data: dict):
         **payroll_data,
         "created_at": datetime.now().isoformat()
     }
-    logger.info(f"Created payroll: {payroll}")
+    logger.info("Created payroll: %s", payroll)
     return {"status": "success", "data": payroll, "id": payroll_id}
 
 
@@ -2828,7 +3249,14 @@ async def create_leave_request(leave_data: dict):
         **leave_data,
         "created_at": datetime.now().isoformat()
     }
-    logger.info(f"Created leave request: {leave_request}")
+    logger.info("Created leave request: %s", leave_request)
+    if leave_data.get("merchant_id"):
+        _publish_notification(leave_data["merchant_id"], "pending_leave_requests", {
+            "request_id": leave_id,
+            "employee_id": leave_data.get("employee_id"),
+            "days": leave_data.get("days"),
+            "status": "Pending"
+        })
     return {"status": "success", "data": leave_request, "id": leave_id}
 
 
@@ -2858,7 +3286,7 @@ async def create_merchant(merchant_data: dict):
         **merchant_data,
         "created_at": datetime.now().isoformat()
     }
-    logger.info(f"Created merchant: {merchant}")
+    logger.info("Created merchant: %s", merchant)
     return {"status": "success", "data": merchant, "id": merchant_id}
 
 
@@ -2897,7 +3325,7 @@ async def update_merchant(merchant_id: int, merchant_data: dict):
         **merchant_data,
         "updated_at": datetime.now().isoformat()
     }
-    logger.info(f"Updated merchant {merchant_id}: {updated_merchant}")
+    logger.info("Updated merchant %s: %s", merchant_id, updated_merchant)
     return {"status": "success", "data": updated_merchant}
 
 # Sales Management Endpoints
@@ -2912,7 +3340,7 @@ async def create_sale(sales_data: dict):
         **sales_data,
         "created_at": datetime.now().isoformat()
     }
-    logger.info(f"Created sale: {sale}")
+    logger.info("Created sale: %s", sale)
     return {"status": "success", "data": sale, "id": sale_id}
 
 
@@ -2942,7 +3370,7 @@ async def create_staff(staff_data: dict):
         **staff_data,
         "created_at": datetime.now().isoformat()
     }
-    logger.info(f"Created staff: {staff}")
+    logger.info("Created staff: %s", staff)
     return {"status": "success", "data": staff, "id": staff_id}
 
 
@@ -2972,7 +3400,13 @@ async def create_payment(payment_data: dict):
         **payment_data,
         "created_at": datetime.now().isoformat()
     }
-    logger.info(f"Created payment: {payment}")
+    logger.info("Created payment: %s", payment)
+    if payment_data.get("merchant_id"):
+        _publish_notification(payment_data["merchant_id"], "payment_settlement", {
+            "last_settlement": date.today().isoformat(),
+            "amount": payment_data.get("amount"),
+            "payment_id": payment_id
+        })
     return {"status": "success", "data": payment, "id": payment_id}
 
 
@@ -3002,7 +3436,7 @@ async def create_marketing_campaign(campaign_data: dict):
         **campaign_data,
         "created_at": datetime.now().isoformat()
     }
-    logger.info(f"Created marketing campaign: {campaign}")
+    logger.info("Created marketing campaign: %s", campaign)
     return {"status": "success", "data": campaign, "id": campaign_id}
 
 
@@ -3032,7 +3466,7 @@ async def create_retention_activity(activity_data: dict):
         **activity_data,
         "created_at": datetime.now().isoformat()
     }
-    logger.info(f"Created retention activity: {activity}")
+    logger.info("Created retention activity: %s", activity)
     return {"status": "success", "data": activity, "id": activity_id}
 
 
@@ -3060,7 +3494,7 @@ async def create_daily_followup(followup_data: dict):
         **followup_data,
         "created_at": datetime.now().isoformat()
     }
-    logger.info(f"Created daily follow-up: {followup}")
+    logger.info("Created daily follow-up: %s", followup)
     return {"status": "success", "data": followup, "id": followup_id}
 
 
@@ -3088,7 +3522,7 @@ async def create_merchant_support(support_data: dict):
         **support_data,
         "created_at": datetime.now().isoformat()
     }
-    logger.info(f"Created merchant support: {support}")
+    logger.info("Created merchant support: %s", support)
     return {"status": "success", "data": support, "id": support_id}
 
 
@@ -3116,7 +3550,7 @@ async def create_performance_metrics(metrics_data: dict):
         **metrics_data,
         "created_at": datetime.now().isoformat()
     }
-    logger.info(f"Created performance metrics: {metrics}")
+    logger.info("Created performance metrics: %s", metrics)
     return {"status": "success", "data": metrics, "id": metrics_id}
 
 
@@ -3152,7 +3586,7 @@ def chatbot_daily_followups():
         ]
         return {"status": "success", "results": results}
     except Exception as e:
-        logger.error(f"chatbot_daily_followups error: {e}")
+        logger.error("chatbot_daily_followups error: %s", e)
         return {"status": "error", "results": []}
 
 
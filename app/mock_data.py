@@ -0,0 +1,200 @@
+"""Deterministic mock data for merchant and retention endpoints.
+
+Each merchant gets one dataset per day, generated from an RNG seeded with
+(MOCK_DATA_SEED, merchant_id, day) and memoized in a size-capped LRU. Repeat
+calls for the same merchant are dictionary lookups and return identical data,
+so responses are stable (cacheable) and load tests are reproducible.
+
+The returned sections are shared between calls: treat them as read-only.
+
+Settings (environment variables):
+- MOCK_DATA_SEED: global seed mixed into every dataset (default 0)
+- MOCK_DATA_CACHE_SIZE: max number of merchant datasets kept (default 1024)
+"""
+import os
+import random
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Any, Dict
+
+MOCK_DATA_SEED = int(os.getenv("MOCK_DATA_SEED", "0"))
+MOCK_DATA_CACHE_SIZE = int(os.getenv("MOCK_DATA_CACHE_SIZE", "1024"))
+
+
+def _yesterday_sales(rng: random.Random, today: date) -> Dict[str, Any]:
+    return {
+        "date": (today - timedelta(days=1)).isoformat(),
+        "total_sales": round(rng.uniform(40000, 80000), 2),
+        "total_transactions": rng.randint(60, 150),
+        "top_products": [
+            {"name": "Product A", "sales": round(rng.uniform(5000, 15000), 2)},
+            {"name": "Product B", "sales": round(rng.uniform(3000, 12000), 2)},
+            {"name": "Product C", "sales": round(rng.uniform(2000, 8000), 2)}
+        ]
+    }
+
+
+def _outstanding_payments(rng: random.Random, today: date) -> Dict[str, Any]:
+    return {
+        "total_outstanding": round(rng.uniform(5000, 25000), 2),
+        "payments": [
+            {
+                "payment_id": f"PAY{i:04d}",
+                "amount": round(rng.uniform(1000, 8000), 2),
+                "due_date": (today + timedelta(days=rng.randint(1, 30))).isoformat(),
+                "status": rng.choice(["Pending", "Overdue"])
+            }
+            for i in range(1, 6)
+        ]
+    }
+
+
+def _expenses_bills(rng: random.Random, today: date) -> Dict[str, Any]:
+    return {
+        "total_expenses": round(rng.uniform(10000, 30000), 2),
+        "bills": [
+            {
+                "bill_id": f"BILL{i:04d}",
+                "description": rng.choice(["Electricity", "Rent", "Internet", "Supplies", "Insurance"]),
+                "amount": round(rng.uniform(2000, 8000), 2),
+                "due_date": (today + timedelta(days=rng.randint(1, 30))).isoformat(),
+                "status": rng.choice(["Paid", "Pending", "Overdue"])
+            }
+            for i in range(1, 6)
+        ]
+    }
+
+
+def _staff_attendance(rng: random.Random, today: date) -> Dict[str, Any]:
+    return {
+        "date": today.isoformat(),
+        "staff": [
+            {
+                "employee_id": f"EMP{i:03d}",
+                "name": f"Staff Member {i}",
+                "status": rng.choice(["Present", "Absent", "On Leave", "Late"]),
+                "check_in": f"{rng.randint(8, 10)}:{rng.randint(0, 59):02d} AM" if rng.choice([True, False]) else None,
+                "role": rng.choice(["Sales Operator", "Manager", "Cashier"])
+            }
+            for i in range(1, 8)
+        ]
+    }
+
+
+def _staff_leave_requests(rng: random.Random, today: date) -> Dict[str, Any]:
+    return {
+        "requests": [
+            {
+                "request_id": f"LR{i:04d}",
+                "employee_name": f"Staff Member {i}",
+                "leave_type": rng.choice(["Sick Leave", "Casual Leave", "Annual Leave"]),
+                "from_date": (today + timedelta(days=rng.randint(1, 10))).isoformat(),
+                "to_date": (today + timedelta(days=rng.randint(11, 20))).isoformat(),
+                "status": rng.choice(["Pending", "Approved", "Rejected"]),
+                "reason": "Personal work"
+            }
+            for i in range(1, 5)
+        ]
+    }
+
+
+def _staff_messages(rng: random.Random, today: date) -> Dict[str, Any]:
+    day_start = datetime.combine(today, time(0, 0))
+    return {
+        "messages": [
+            {
+                "message_id": f"MSG{i:04d}",
+                "from": f"Staff Member {i}",
+                "role": rng.choice(["Sales Operator", "Manager"]),
+                "subject": rng.choice(["Daily Report", "Issue Alert", "Request"]),
+                "message": f"This is a sample message {i} from staff member.",
+                "timestamp": (day_start - timedelta(hours=rng.randint(1, 24))).isoformat(),
+                "status": rng.choice(["Unread", "Read"])
+            }
+            for i in range(1, 6)
+        ]
+    }
+
+
+def _staff_salaries(rng: random.Random, today: date) -> Dict[str, Any]:
+    return {
+        "staff_salaries": [
+            {
+                "employee_id": f"EMP{i:03d}",
+                "name": f"Staff Member {i}",
+                "monthly_salary": round(rng.uniform(15000, 50000), 2),
+                "status": rng.choice(["Paid", "Pending", "Overdue"]),
+                "last_paid": (today - timedelta(days=rng.randint(1, 30))).isoformat()
+            }
+            for i in range(1, 6)
+        ]
+    }
+
+
+def _campaign_results(rng: random.Random, today: date) -> Dict[str, Any]:
+    day_start = datetime.combine(today, time(0, 0))
+    return {
+        "campaigns": [
+            {
+                "campaign_id": f"CAMP{i:04d}",
+                "type": rng.choice(["WhatsApp", "SMS", "Email"]),
+                "sent": rng.randint(100, 1000),
+                "opened": rng.randint(50, 500),
+                "clicked": rng.randint(10, 100),
+                "conversion_rate": f"{rng.randint(5, 25)}%",
+                "created_at": (day_start - timedelta(days=rng.randint(1, 30))).isoformat()
+            }
+            for i in range(1, 4)
+        ]
+    }
+
+
+def _loan_status(rng: random.Random, today: date) -> Dict[str, Any]:
+    day_start = datetime.combine(today, time(0, 0))
+    return {
+        "loan_id": f"LOAN{rng.randint(10000, 99999)}",
+        "status": rng.choice(["Under Review", "Approved", "Disbursed", "Rejected"]),
+        "amount_requested": round(rng.uniform(50000, 500000), 2),
+        "amount_approved": round(rng.uniform(30000, 400000), 2),
+        "interest_rate": f"{rng.uniform(8.5, 15.0):.1f}%",
+        "applied_at": (day_start - timedelta(days=rng.randint(1, 30))).isoformat()
+    }
+
+
+def _merchant_profile(rng: random.Random, today: date) -> Dict[str, Any]:
+    return {
+        "business_type": rng.choice(["Retail", "Food", "Services"]),
+        "status": rng.choice(["Active", "Suspended", "Inactive"]),
+        "last_seen": datetime.combine(today, time(rng.randint(8, 20), rng.randint(0, 59))).isoformat()
+    }
+
+
+# Section name -> generator. Each section draws from its own RNG stream so
+# adding a section never changes the data of the existing ones.
+SECTIONS = {
+    "yesterday_sales": _yesterday_sales,
+    "outstanding_payments": _outstanding_payments,
+    "expenses_bills": _expenses_bills,
+    "staff_attendance": _staff_attendance,
+    "staff_leave_requests": _staff_leave_requests,
+    "staff_messages": _staff_messages,
+    "staff_salaries": _staff_salaries,
+    "campaign_results": _campaign_results,
+    "loan_status": _loan_status,
+    "merchant_profile": _merchant_profile,
+}
+
+
+@lru_cache(maxsize=MOCK_DATA_CACHE_SIZE)
+def merchant_dataset(merchant_id: str, day: date) -> Dict[str, Dict[str, Any]]:
+    """Generate (once) every mock section for a merchant on a given day."""
+    return {
+        name: generator(random.Random(
+            f"{MOCK_DATA_SEED}:{merchant_id}:{day.isoformat()}:{name}"), day)
+        for name, generator in SECTIONS.items()
+    }
+
+
+def get_section(merchant_id: str, section: str) -> Dict[str, Any]:
+    """Return one section of today's dataset for merchant_id."""
+    return merchant_dataset(merchant_id, date.today())[section]
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Date, Time
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Date, Time, Text, Index, UniqueConstraint, LargeBinary, Float
 from sqlalchemy.orm import relationship
 from datetime import datetime, date
 from .database import Base
@@ -41,6 +41,11 @@ class ChatbotSubmenu(Base):
 
 class AttendanceRecord(Base):
     __tablename__ = "attendance_records"
+    # one row per employee and day; punches are upserted on it (app/punch_buffer.py)
+    __table_args__ = (
+        UniqueConstraint("employee_id", "date",
+                         name="uq_attendance_employee_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(String(50), nullable=False)
@@ -53,6 +58,8 @@ class AttendanceRecord(Base):
     status = Column(String(20), nullable=False)
     location = Column(String(100), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # data version for cached exports (app/exports.py)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class LeaveApplication(Base):
@@ -74,6 +81,15 @@ class LeaveApplication(Base):
     approved_date = Column(Date, nullable=True)
     comments = Column(String(500), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # bumped on every ORM update; a stale approve/reject fails instead of overwriting
+    version = Column(Integer, nullable=False, default=1)
+
+    __table_args__ = (
+        # overlap checks: employee_id = ? AND from_date <= ? AND to_date >= ?
+        Index("ix_leave_applications_employee_dates",
+              "employee_id", "from_date", "to_date"),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
 
 class Payslip(Base):
@@ -86,6 +102,12 @@ class Payslip(Base):
     amount = Column(Integer, nullable=False)
     status = Column(String(20), nullable=False)  # e.g., "Paid", "Pending"
     created_at = Column(DateTime, default=datetime.utcnow)
+    # data version for cached exports (app/exports.py)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # set for payslips generated by a payroll run (app/payroll.py); amount is the net pay
+    payroll_run_id = Column(Integer, ForeignKey("payroll_runs.id"), nullable=True, index=True)
+    gross_amount = Column(Integer, nullable=True)
+    deductions = Column(Integer, nullable=True)
 
 
 class Employee(Base):
@@ -190,6 +212,8 @@ class SalesRecord(Base):
     amount = Column(Integer, nullable=False)
     merchant_id = Column(Integer, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # data version for cached exports (app/exports.py)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class ExpenseRecord(Base):
@@ -319,9 +343,220 @@ class AssignedMerchant(Base):
 
 class Activity(Base):
     __tablename__ = "activities"
+    __table_args__ = (
+        Index("ix_activities_kind_merchant_created",
+              "kind", "merchant_id", "created_at"),
+        UniqueConstraint("client_id", name="uq_activities_client_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
     status = Column(String(20), default="Pending")
     assigned_to = Column(String(100), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # activity_complete, summary_report, health_update, merchant_need, note, attachment
+    kind = Column(String(30), nullable=False, default="activity_complete")
+    merchant_id = Column(String(50), nullable=True)
+    # JSON record returned to the retention executor UI
+    details = Column(Text, nullable=True)
+    # idempotency key of an offline-synced action (see /api/retention/sync)
+    client_id = Column(String(64), nullable=True)
+
+
+class StoredBlob(Base):
+    """An uploaded file stored once by content hash (see app/uploads.py)."""
+    __tablename__ = "stored_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    content_type = Column(String(100), nullable=True)
+    # number of activity records pointing at this blob
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_referenced_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ExportJob(Base):
+    """A background Excel/PDF export (see app/exports.py)."""
+    __tablename__ = "export_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    report_type = Column(String(30), nullable=False)
+    format = Column(String(10), nullable=False)
+    # JSON-encoded filters and header lines for the report
+    filters = Column(Text, nullable=True)
+    title = Column(String(200), nullable=True)
+    summary = Column(Text, nullable=True)
+    file_name = Column(String(200), nullable=True)
+    # hash of report, filters and source data version; equal fingerprints reuse the file
+    fingerprint = Column(String(64), nullable=True, index=True)
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, done, failed, expired
+    row_count = Column(Integer, nullable=True)
+    error = Column(String(500), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class PayrollRun(Base):
+    """One monthly payroll computation (see app/payroll.py)."""
+    __tablename__ = "payroll_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    month = Column(String(7), nullable=False, index=True)  # YYYY-MM
+    dry_run = Column(Boolean, nullable=False, default=False)
+    # completed, dry_run, superseded (a later run replaced its payslips);
+    # partitioned runs are running until every partition has finished, then
+    # completed or failed (failed partitions can be retried)
+    status = Column(String(20), nullable=False)
+    partition_by = Column(String(20), nullable=True)  # department, office_location
+    error = Column(Text, nullable=True)
+    employee_count = Column(Integer, nullable=True)
+    total_gross = Column(Integer, nullable=True)
+    total_deductions = Column(Integer, nullable=True)
+    total_net = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class PayrollMonth(Base):
+    """Lock row serializing the payroll runs of one month (see app/payroll.py)."""
+    __tablename__ = "payroll_months"
+
+    month = Column(String(7), primary_key=True)  # YYYY-MM
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class PayrollPartition(Base):
+    """The employees of one department / office location in a partitioned payroll run."""
+    __tablename__ = "payroll_partitions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("payroll_runs.id"), nullable=False, index=True)
+    key = Column(String(100), nullable=True)  # NULL: employees without a department/location
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    employee_count = Column(Integer, nullable=True)
+    total_gross = Column(Integer, nullable=True)
+    total_deductions = Column(Integer, nullable=True)
+    total_net = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # set when queued, renewed while a worker prices it; stale ones are failed
+    heartbeat_at = Column(DateTime, nullable=True)
+
+
+class LeaveBalance(Base):
+    """Ledger head: current balance of one employee's leave type (see app/leave_ledger.py)."""
+    __tablename__ = "leave_balances"
+
+    id = Column(Integer, primary_key=True, index=True)
+    employee_id = Column(String(50), nullable=False)
+    leave_type = Column(String(50), nullable=False)
+    balance = Column(Integer, nullable=False)
+    reserved = Column(Integer, nullable=False, default=0)  # days held by pending applications
+    last_entry_id = Column(Integer, nullable=True)
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("employee_id", "leave_type",
+                         name="uq_leave_balances_employee_type"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
+
+class LeaveLedgerEntry(Base):
+    """One change to a leave balance, with the running balance after it."""
+    __tablename__ = "leave_ledger"
+
+    id = Column(Integer, primary_key=True, index=True)
+    employee_id = Column(String(50), nullable=False)
+    leave_type = Column(String(50), nullable=False)
+    entry_type = Column(String(20), nullable=False)  # grant, debit, adjustment
+    days = Column(Integer, nullable=False)  # signed
+    balance_after = Column(Integer, nullable=False)
+    leave_application_id = Column(Integer, ForeignKey("leave_applications.id"), nullable=True, index=True)
+    note = Column(String(500), nullable=True)
+    created_by = Column(String(100), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_leave_ledger_employee_type",
+              "employee_id", "leave_type", "id"),
+    )
+
+
+class IdempotencyKey(Base):
+    """First response to a request sent with an Idempotency-Key header (see app/idempotency.py)."""
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(255), nullable=False)
+    method = Column(String(10), nullable=False)
+    path = Column(String(255), nullable=False)
+    fingerprint = Column(String(64), nullable=False)  # sha256 of method, path, query and body
+    status = Column(String(20), nullable=False)  # in_progress, completed
+    response_status = Column(Integer, nullable=True)
+    response_headers = Column(Text, nullable=True)  # JSON [[name, value], ...]
+    response_body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        UniqueConstraint("key", "method", "path",
+                         name="uq_idempotency_keys_key_request"),
+    )
+
+
+class RateLimitBucket(Base):
+    """Token bucket of one merchant / employee / client IP (see app/rate_limit.py)."""
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String(150), primary_key=True)  # merchant:<id>, employee:<id>, ip:<address>
+    tokens = Column(Float, nullable=False)
+    capacity = Column(Float, nullable=False)
+    rate = Column(Float, nullable=False)  # tokens per second
+    cost = Column(Float, nullable=False)  # of the last request
+    allowed = Column(Boolean, nullable=False)  # whether the last request was let through
+    updated_at = Column(Float, nullable=False)  # unix time
+
+
+class ScheduledJob(Base):
+    """Schedule and lease of one periodic job (see app/scheduler.py)."""
+    __tablename__ = "scheduled_jobs"
+
+    name = Column(String(100), primary_key=True)
+    interval_seconds = Column(Integer, nullable=False)
+    next_run_at = Column(DateTime, nullable=False)
+    lease_owner = Column(String(100), nullable=True)  # host:pid:nonce of the worker running it
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_started_at = Column(DateTime, nullable=True)
+    last_finished_at = Column(DateTime, nullable=True)
+    last_status = Column(String(20), nullable=True)  # completed, failed
+    last_error = Column(Text, nullable=True)
+    run_count = Column(Integer, nullable=False, default=0)
+
+
+class ExecutorTask(Base):
+    """A precomputed task, reminder or pending action of a retention executor (see app/retention_tasks.py)."""
+    __tablename__ = "executor_tasks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    executor_id = Column(String(100), nullable=False)
+    day = Column(Date, nullable=False)
+    kind = Column(String(20), nullable=False)  # task, reminder, action
+    item_key = Column(String(100), nullable=False)  # stable across refreshes, e.g. followup:MERCH1001
+    title = Column(String(200), nullable=False)
+    merchant_id = Column(String(50), nullable=True)
+    priority = Column(String(10), nullable=False, default="Medium")
+    due_at = Column(DateTime, nullable=True)
+    source_activity_id = Column(Integer, ForeignKey("activities.id"), nullable=True)
+    computed_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("executor_id", "day", "kind", "item_key",
+                         name="uq_executor_tasks_item"),
+    )
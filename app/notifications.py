@@ -0,0 +1,125 @@
+"""Pluggable sources for the aggregated merchant notifications panel.
+
+Each source is a plain (sync) function merchant_id -> data, registered with
+its own cache TTL and timeout:
+
+    @notifications.source("head_office_messages", ttl=300)
+    def head_office_messages(merchant_id): ...
+
+aggregate() runs every source concurrently in worker threads. Fresh cached
+results are served without calling the source; a source that errors or
+misses its timeout falls back to its last cached value (or is reported as
+unavailable) so one slow source never holds up the whole panel. A source that
+finishes after its timeout still refreshes the cache for the next open.
+
+Settings (environment variables):
+- NOTIFICATION_SOURCE_TIMEOUT: default per-source timeout in seconds (default 2)
+- NOTIFICATION_CACHE_SIZE: max cached (source, merchant) entries (default 4096)
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = float(os.getenv("NOTIFICATION_SOURCE_TIMEOUT", "2"))
+CACHE_SIZE = int(os.getenv("NOTIFICATION_CACHE_SIZE", "4096"))
+
+
+class NotificationSource:
+    def __init__(self, key: str, fetch: Callable[[str], Any], ttl: float, timeout: float):
+        self.key = key
+        self.fetch = fetch
+        self.ttl = ttl
+        self.timeout = timeout
+
+
+_sources: "OrderedDict[str, NotificationSource]" = OrderedDict()
+# (source key, merchant_id) -> (expires_at, data)
+_cache: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def source(key: str, ttl: float = 30.0, timeout: float = None):
+    """Decorator registering a notification source under `key`."""
+    def decorator(fetch):
+        _sources[key] = NotificationSource(
+            key, fetch, ttl, DEFAULT_TIMEOUT if timeout is None else timeout)
+        return fetch
+    return decorator
+
+
+def sources() -> List[NotificationSource]:
+    return list(_sources.values())
+
+
+def _cache_get(key: str, merchant_id: str):
+    """Return (data, fresh) or (None, False) when nothing is cached."""
+    with _cache_lock:
+        entry = _cache.get((key, merchant_id))
+        if entry is None:
+            return None, False
+        _cache.move_to_end((key, merchant_id))
+    expires_at, data = entry
+    return data, time.monotonic() < expires_at
+
+
+def _cache_set(src: NotificationSource, merchant_id: str, data):
+    with _cache_lock:
+        _cache[(src.key, merchant_id)] = (time.monotonic() + src.ttl, data)
+        _cache.move_to_end((src.key, merchant_id))
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def invalidate(merchant_id: str, key: str = None):
+    """Drop cached results for a merchant (one source, or all of them)."""
+    with _cache_lock:
+        for cache_key in [k for k in _cache if k[1] == merchant_id and (key is None or k[0] == key)]:
+            del _cache[cache_key]
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _fetch_and_cache(src: NotificationSource, merchant_id: str):
+    data = src.fetch(merchant_id)
+    _cache_set(src, merchant_id, data)
+    return data
+
+
+async def _resolve(src: NotificationSource, merchant_id: str):
+    cached, fresh = _cache_get(src.key, merchant_id)
+    if fresh:
+        return cached, True
+    try:
+        data = await asyncio.wait_for(
+            asyncio.to_thread(_fetch_and_cache, src, merchant_id), src.timeout)
+        return data, True
+    except asyncio.TimeoutError:
+        logger.warning("Notification source %s timed out after %.1fs for %s",
+                       src.key, src.timeout, merchant_id)
+    except Exception as e:
+        logger.error("Notification source %s failed for %s: %s",
+                     src.key, merchant_id, e)
+    # Serve the stale copy if there is one
+    return cached, cached is not None
+
+
+async def aggregate(merchant_id: str) -> Tuple[Dict[str, Any], List[str]]:
+    """Resolve every source concurrently; returns (data by key, unavailable keys)."""
+    registered = sources()
+    results = await asyncio.gather(*[_resolve(src, merchant_id) for src in registered])
+    data, unavailable = {}, []
+    for src, (value, ok) in zip(registered, results):
+        if ok:
+            data[src.key] = value
+        else:
+            unavailable.append(src.key)
+    return data, unavailable
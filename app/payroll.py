@@ -0,0 +1,676 @@
+"""Monthly payroll runs: attendance + approved leave + salary grade -> payslips.
+
+compute() loads one month of data into columnar arrays and prices every
+employee at once with NumPy: attendance and paid leave are scattered into an
+employees x days credit matrix (1 = paid day, 0.5 = half day), days that were
+expected (working day, on or after the hire date) but not credited are loss
+of pay, and gross, deductions and net pay are array expressions over the
+result. run_payroll() stores the run and bulk-inserts its payslips; with
+dry_run it stores nothing but the run summary and diffs the result against
+the previous completed run.
+
+A stored run replaces the month's earlier payslips - those of earlier runs
+and those created before payroll runs existed (payroll_run_id NULL) - unless
+any of them is Paid. Everything that replaces a month's payslips first locks
+the month's payroll_months row (SELECT ... FOR UPDATE, see lock_month()), so
+two runs of one month started together are serialized instead of both
+superseding the same earlier run and leaving two sets of payslips.
+
+Partitioned runs (partition_by department or office_location) are for
+month-ends too large for one request: start_partitioned_run() records one
+payroll_partitions row per department / location and returns at once, and
+each partition is priced on a process pool (PAYROLL_WORKERS processes) in its
+own session, replacing its employees' payslips and committing on its own.
+The last partition to finish settles the run (completed, or failed if any
+partition failed); retry_run() re-queues only the failed partitions. Progress
+is read back from the partition rows (GET /api/payroll/runs/{id}).
+
+A partition's heartbeat_at is set when it is queued and renewed by its worker
+every third of PAYROLL_PARTITION_LEASE_SECONDS. Before a month is run, re-run
+or retried, expire_stale() fails the partitions whose process is gone - a
+running one whose heartbeat is older than the lease, or pending ones when no
+partition of the run has made progress for that long - and settles their run
+as failed, so it can be retried instead of blocking the month for good. A
+worker that finishes after its partition was given up on discards its result.
+
+Pay rules:
+- monthly salary by Employee.salary_grade (PAYROLL_GRADE_SALARIES, JSON);
+  unknown grades are paid as PAYROLL_DEFAULT_GRADE and counted in the summary
+- gross = salary * (employed days - loss-of-pay days) / days in month
+- deductions: provident fund 12% of basic (basic = 50% of gross), professional
+  tax 200 when gross >= 15000, TDS 10% of gross above 50000
+- Sundays are weekly offs; only Active employees hired by month end are paid
+
+Settings (environment variables):
+- PAYROLL_GRADE_SALARIES: e.g. {"G1": 20000, "G2": 30000}
+- PAYROLL_DEFAULT_GRADE: default G1
+- PAYROLL_DIFF_LIMIT: changed employees listed in a dry-run diff (default 100)
+- PAYROLL_WORKERS: processes pricing partitions (default: CPU count)
+- PAYROLL_PARTITION_LEASE_SECONDS: how long a partition may go without
+  progress before it is failed (default 300)
+"""
+import calendar
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import and_, case, create_engine, delete, event, extract, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+GRADE_SALARIES = json.loads(os.getenv("PAYROLL_GRADE_SALARIES", "null")) or {
+    "G1": 20000, "G2": 30000, "G3": 45000, "G4": 65000, "G5": 90000, "G6": 125000,
+}
+DEFAULT_GRADE = os.getenv("PAYROLL_DEFAULT_GRADE", "G1")
+DIFF_LIMIT = int(os.getenv("PAYROLL_DIFF_LIMIT", "100"))
+WORKERS = int(os.getenv("PAYROLL_WORKERS", str(os.cpu_count() or 2)))
+LEASE = timedelta(seconds=float(os.getenv("PAYROLL_PARTITION_LEASE_SECONDS", "300")))
+
+ATTENDANCE_CREDIT = {"Present": 1.0, "Late": 1.0, "Half Day": 0.5}
+UNPAID_LEAVE_TYPES = ("Unpaid", "Loss of Pay", "LOP")
+WEEKLY_OFF = {6}  # Sunday
+BASIC_SHARE = 0.5
+PF_RATE = 0.12
+PROFESSIONAL_TAX = 200
+PROFESSIONAL_TAX_FROM = 15000
+TDS_RATE = 0.10
+TDS_FROM = 50000
+PARTITION_COLUMNS = ("department", "office_location")
+# runs whose payslips are (at least partly) stored
+STORED_STATUSES = ("completed", "failed")
+# partitions a worker has yet to finish
+ACTIVE_STATUSES = ("pending", "running")
+TOTAL_FIELDS = ("employee_count", "total_gross", "total_deductions", "total_net")
+
+
+class PayrollError(Exception):
+    status_code = 400
+
+
+class PayrollConflict(PayrollError):
+    status_code = 409
+
+
+class PayrollRunNotFound(PayrollError):
+    status_code = 404
+
+
+@dataclass
+class PayrollResult:
+    month: str
+    employee_ids: List[str]
+    employee_names: List[str]
+    payable_days: np.ndarray
+    lop_days: np.ndarray
+    gross: np.ndarray
+    deductions: np.ndarray
+    net: np.ndarray
+    unknown_grades: int
+
+    def totals(self) -> dict:
+        return {"employee_count": len(self.employee_ids), "total_gross": int(self.gross.sum()),
+                "total_deductions": int(self.deductions.sum()), "total_net": int(self.net.sum())}
+
+
+def month_bounds(month: str) -> Tuple[date, date, int]:
+    try:
+        start = datetime.strptime(month, "%Y-%m").date()
+    except (TypeError, ValueError):
+        raise PayrollError("month must be YYYY-MM")
+    days = calendar.monthrange(start.year, start.month)[1]
+    return start, start.replace(day=days), days
+
+
+def payslip_month(month: str) -> str:
+    # payslips use the "August 2025" form
+    return datetime.strptime(month, "%Y-%m").strftime("%B %Y")
+
+
+class _EmployeeIndex:
+    """Vectorized employee_id -> row lookup (binary search over the sorted ids)."""
+
+    def __init__(self, ids: List[str]):
+        ids = np.array(ids, dtype=object).astype(str) if ids else np.array([], dtype=str)
+        self.order = np.argsort(ids, kind="stable")
+        self.sorted_ids = ids[self.order]
+
+    def rows(self, values) -> np.ndarray:
+        values = np.array(values, dtype=object).astype(str)
+        if not len(self.sorted_ids):
+            return np.full(len(values), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.sorted_ids, values), len(self.sorted_ids) - 1)
+        return np.where(self.sorted_ids[pos] == values, self.order[pos], -1)
+
+
+def _day_offsets(dates, start: date) -> np.ndarray:
+    base = start.toordinal()
+    return np.fromiter((d.toordinal() - base for d in dates), dtype=np.int64, count=len(dates))
+
+
+def compute(conn, month: str, employee_filter=None) -> PayrollResult:
+    """Price every active employee for `month` (optionally only rows matching employee_filter)."""
+    start, end, days = month_bounds(month)
+    E = models.Employee.__table__
+    A = models.AttendanceRecord.__table__
+    L = models.LeaveApplication.__table__
+
+    query = select(E.c.employee_id, E.c.employee_name, E.c.salary_grade, E.c.hire_date).where(
+        E.c.employment_status == "Active", E.c.hire_date <= end).order_by(E.c.employee_id)
+    if employee_filter is not None:
+        query = query.where(employee_filter)
+    employees = conn.execute(query).all()
+    attendance_scope, leave_scope = [], []
+    if employee_filter is not None:
+        # only the partition's attendance and leave rows are fetched
+        in_scope = select(E.c.employee_id).where(employee_filter).scalar_subquery()
+        attendance_scope = [A.c.employee_id.in_(in_scope)]
+        leave_scope = [L.c.employee_id.in_(in_scope)]
+    n = len(employees)
+    ids, names, grades, hired = (list(col) for col in zip(*employees)) if n else ([], [], [], [])
+    index = _EmployeeIndex(ids)
+
+    # employees x days: share of each day that is paid
+    credit = np.zeros((n, days), dtype=np.float32)
+    if n:
+        # day of month and credit are computed by the database so the (large)
+        # attendance result is plain strings and numbers, not dates to parse
+        attendance = conn.execute(select(
+            A.c.employee_id, extract("day", A.c.date),
+            case(*((A.c.status == status, value) for status, value in ATTENDANCE_CREDIT.items()), else_=0.0)
+        ).where(A.c.date.between(start, end), A.c.status.in_(list(ATTENDANCE_CREDIT)), *attendance_scope)).all()
+        if attendance:
+            emp_ids, day_of_month, values = zip(*attendance)
+            rows = index.rows(emp_ids)
+            cols = np.array(day_of_month, dtype=np.int64) - 1
+            values = np.array(values, dtype=np.float32)
+            keep = rows >= 0
+            np.maximum.at(credit, (rows[keep], cols[keep]), values[keep])
+
+        leave = conn.execute(select(L.c.employee_id, L.c.from_date, L.c.to_date).where(
+            L.c.status == "Approved", L.c.from_date <= end, L.c.to_date >= start,
+            L.c.leave_type.notin_(UNPAID_LEAVE_TYPES), *leave_scope)).all()
+        if leave:
+            emp_ids, from_dates, to_dates = zip(*leave)
+            rows = index.rows(emp_ids)
+            first = np.clip(_day_offsets(from_dates, start), 0, days - 1)
+            last = np.clip(_day_offsets(to_dates, start), 0, days - 1)
+            keep = (rows >= 0) & (last >= first)
+            rows, first, lengths = rows[keep], first[keep], (last - first + 1)[keep]
+            # expand each leave into one (row, day) pair per day it covers
+            starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+            day_cols = np.repeat(first, lengths) + \
+                (np.arange(lengths.sum()) - starts)
+            credit[np.repeat(rows, lengths), day_cols] = 1.0
+
+    day_numbers = np.arange(days)
+    weekdays = (start.weekday() + day_numbers) % 7
+    working = ~np.isin(weekdays, list(WEEKLY_OFF))
+    hire_offset = np.clip(_day_offsets(hired, start), 0, days) if n else np.zeros(0, dtype=np.int64)
+    employed = day_numbers[None, :] >= hire_offset[:, None]
+    expected = employed & working[None, :]
+
+    lop_days = ((1.0 - credit) * expected).sum(axis=1)
+    payable_days = (days - hire_offset) - lop_days
+    unknown = [g not in GRADE_SALARIES for g in grades]
+    salary = np.fromiter((GRADE_SALARIES.get(g, GRADE_SALARIES[DEFAULT_GRADE]) for g in grades),
+                         dtype=np.float64, count=n)
+
+    gross = np.rint(salary * payable_days / days)
+    provident_fund = np.rint(gross * BASIC_SHARE * PF_RATE)
+    professional_tax = np.where(gross >= PROFESSIONAL_TAX_FROM, PROFESSIONAL_TAX, 0)
+    tds = np.rint(np.maximum(gross - TDS_FROM, 0) * TDS_RATE)
+    deductions = provident_fund + professional_tax + tds
+
+    return PayrollResult(month=month, employee_ids=ids, employee_names=names,
+                         payable_days=payable_days, lop_days=lop_days,
+                         gross=gross.astype(np.int64), deductions=deductions.astype(np.int64),
+                         net=(gross - deductions).astype(np.int64), unknown_grades=sum(unknown))
+
+
+def _latest_completed_run(db: Session, month: str = None) -> Optional[models.PayrollRun]:
+    R = models.PayrollRun
+    query = db.query(R).filter(R.status == "completed")
+    if month:
+        query = query.filter(R.month == month)
+    return query.order_by(R.id.desc()).first()
+
+
+def diff(db: Session, result: PayrollResult) -> Optional[dict]:
+    """Compare a result with the latest completed run of the month (or, failing that, of any month)."""
+    baseline = _latest_completed_run(db, result.month) or _latest_completed_run(db)
+    if baseline is None:
+        return None
+    P = models.Payslip
+    previous = dict(db.execute(select(P.employee_id, P.amount).where(
+        P.payroll_run_id == baseline.id)).all())
+    current = dict(zip(result.employee_ids, result.net.tolist()))
+    changes = [{"employee_id": employee_id, "previous_net": previous.get(employee_id), "net": net,
+                "delta": net - previous.get(employee_id, 0)}
+               for employee_id, net in current.items() if previous.get(employee_id) != net]
+    removed = [employee_id for employee_id in previous if employee_id not in current]
+    changes.extend({"employee_id": employee_id, "previous_net": previous[employee_id], "net": None,
+                    "delta": -previous[employee_id]} for employee_id in removed)
+    changes.sort(key=lambda c: abs(c["delta"]), reverse=True)
+    return {
+        "baseline_run_id": baseline.id,
+        "baseline_month": baseline.month,
+        "added": sum(1 for c in changes if c["previous_net"] is None),
+        "removed": len(removed),
+        "changed": sum(1 for c in changes if c["previous_net"] is not None and c["net"] is not None),
+        "total_net_delta": int(result.net.sum()) - sum(previous.values()),
+        "changes": changes[:DIFF_LIMIT],
+    }
+
+
+def store_payslips(conn, run_id: int, result: PayrollResult):
+    if not result.employee_ids:
+        return
+    now = datetime.utcnow()
+    label = payslip_month(result.month)
+    rows = [{"employee_id": employee_id, "employee_name": name, "month": label, "amount": net,
+             "gross_amount": gross, "deductions": deductions, "status": "Pending",
+             "payroll_run_id": run_id, "created_at": now, "updated_at": now}
+            for employee_id, name, gross, deductions, net in zip(
+                result.employee_ids, result.employee_names, result.gross.tolist(),
+                result.deductions.tolist(), result.net.tolist())]
+    conn.execute(insert(models.Payslip.__table__), rows)
+
+
+def lock_month(db: Session, month: str):
+    """Hold the month's payroll_months row locked until the caller's transaction ends."""
+    M = models.PayrollMonth
+    query = db.query(M).filter_by(month=month).with_for_update()
+    if query.first() is not None:
+        return
+    try:
+        with db.begin_nested():
+            db.add(M(month=month))
+            db.flush()
+    except IntegrityError:
+        # created by a concurrent run: wait for its lock
+        query.first()
+
+
+def _replaced_payslips(month: str, previous_ids: List[int]):
+    """The payslips a new run of the month replaces: earlier runs' and pre-payroll-run ones."""
+    P = models.Payslip
+    legacy = and_(P.payroll_run_id.is_(None), P.month == payslip_month(month))
+    return or_(P.payroll_run_id.in_(previous_ids), legacy) if previous_ids else legacy
+
+
+def _previous_runs(db: Session, month: str, run_id: int = None) -> List[int]:
+    R = models.PayrollRun
+    return [r.id for r in db.query(R.id).filter(
+        R.month == month, R.status.in_(STORED_STATUSES), R.id != run_id)]
+
+
+def check_replaceable(db: Session, month: str, run_id: int = None) -> List[int]:
+    """Refuse a new run while another run of the month is in progress or its payslips are paid.
+
+    Returns the ids of the earlier runs whose payslips the new run replaces.
+    """
+    R, P = models.PayrollRun, models.Payslip
+    running = db.query(R.id).filter(R.month == month, R.status == "running", R.id != run_id).first()
+    if running is not None:
+        raise PayrollConflict(f"Payroll run {running.id} for {month} is still running")
+    previous_ids = _previous_runs(db, month, run_id)
+    if db.query(P.id).filter(_replaced_payslips(month, previous_ids), P.status == "Paid").first() is not None:
+        raise PayrollConflict(f"Payroll for {month} has already been paid")
+    return previous_ids
+
+
+def supersede_previous_runs(db: Session, month: str, run_id: int):
+    """Remove the month's earlier payslips; refuses once any is paid (caller holds lock_month)."""
+    R, P = models.PayrollRun, models.Payslip
+    previous_ids = check_replaceable(db, month, run_id)
+    db.execute(delete(P).where(_replaced_payslips(month, previous_ids)))
+    if previous_ids:
+        db.execute(update(R).where(R.id.in_(previous_ids)).values(status="superseded"))
+
+
+def summary(run: models.PayrollRun, result: PayrollResult, elapsed: float) -> dict:
+    return {"run_id": run.id, "month": run.month, "status": run.status, "dry_run": run.dry_run,
+            **result.totals(), "unknown_grades": result.unknown_grades,
+            "elapsed_ms": round(elapsed * 1000)}
+
+
+def run_payroll(db: Session, month: str, dry_run: bool = False) -> dict:
+    """Compute a month's payroll; store payslips unless dry_run (which returns a diff instead)."""
+    started = time.monotonic()
+    month_bounds(month)
+    result = compute(db.connection(), month)
+    run = models.PayrollRun(month=month, dry_run=dry_run, status="dry_run" if dry_run else "completed",
+                            finished_at=datetime.utcnow(), **result.totals())
+    try:
+        if not dry_run:
+            # before the new run exists, or settling a stale run would supersede it
+            lock_month(db, month)
+            expire_stale(db, month)
+        db.add(run)
+        db.flush()
+        if dry_run:
+            changes = diff(db, result)
+        else:
+            supersede_previous_runs(db, month, run.id)
+            store_payslips(db.connection(), run.id, result)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    response = summary(run, result, time.monotonic() - started)
+    if dry_run:
+        response["diff"] = changes
+    logger.info("Payroll run %s for %s: %d employees, net %d (%s)", run.id, month,
+                response["employee_count"], response["total_net"], "dry run" if dry_run else "stored")
+    return response
+
+
+# --- partitioned runs --------------------------------------------------------
+
+_pool = None
+_pool_lock = threading.Lock()
+# engines opened by pool worker processes, by database URL
+_worker_engines = {}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork: the web process runs threads (exports,
+            # punch buffer) whose locks fork would copy mid-flight
+            _pool = ProcessPoolExecutor(max_workers=WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+
+
+def _worker_engine(url: str):
+    engine = _worker_engines.get(url)
+    if engine is None:
+        connect_args = {"timeout": 30} if url.startswith("sqlite") else {}
+        engine = _worker_engines[url] = create_engine(url, connect_args=connect_args, pool_pre_ping=True)
+    return engine
+
+
+def partition_filter(partition_by: str, key: Optional[str]):
+    column = models.Employee.__table__.c[partition_by]
+    return column.is_(None) if key is None else column == key
+
+
+def replace_partition_payslips(db: Session, run: models.PayrollRun, partition: models.PayrollPartition,
+                               result: PayrollResult):
+    """Swap the partition's payslips from earlier runs of the month for this run's."""
+    P, E = models.Payslip, models.Employee.__table__
+    previous_ids = _previous_runs(db, run.month, run.id)
+    in_partition = select(E.c.employee_id).where(partition_filter(run.partition_by, partition.key))
+    db.execute(delete(P).where(_replaced_payslips(run.month, previous_ids), P.employee_id.in_(in_partition)))
+    store_payslips(db.connection(), run.id, result)
+
+
+def _settle(db: Session, run: models.PayrollRun, partitions: List[models.PayrollPartition]):
+    done = [p for p in partitions if p.status == "completed"]
+    for field in TOTAL_FIELDS:
+        setattr(run, field, sum(getattr(p, field) for p in done))
+    run.finished_at = datetime.utcnow()
+    failed = len(partitions) - len(done)
+    if failed:
+        run.status, run.error = "failed", f"{failed} of {len(partitions)} partitions failed"
+        return
+    try:
+        # payslips of employees no longer in any partition
+        supersede_previous_runs(db, run.month, run.id)
+    except PayrollConflict as e:
+        run.status, run.error = "failed", str(e)
+        return
+    run.status, run.error = "completed", None
+
+
+def expire_stale(db: Session, month: str, now: datetime = None):
+    """Fail the month's partitions whose worker is gone and settle their runs (caller commits)."""
+    R, P = models.PayrollRun, models.PayrollPartition
+    now = now or datetime.utcnow()
+    cutoff = now - LEASE
+    for run in db.query(R).filter(R.month == month, R.status == "running").with_for_update().all():
+        partitions = db.query(P).filter_by(run_id=run.id).with_for_update().all()
+        last_progress = max((t for p in partitions for t in (p.heartbeat_at, p.finished_at) if t), default=None)
+        for partition in partitions:
+            if partition.status == "running":
+                stale = partition.heartbeat_at is None or partition.heartbeat_at < cutoff
+            else:
+                # queued partitions wait their turn while others make progress
+                stale = partition.status == "pending" and (last_progress is None or last_progress < cutoff)
+            if stale:
+                logger.warning("Payroll partition %s (%s=%s) of run %s made no progress since %s; failing it",
+                               partition.id, run.partition_by, partition.key, run.id, partition.heartbeat_at)
+                partition.status, partition.finished_at = "failed", now
+                partition.error = f"No progress for {int(LEASE.total_seconds())}s (worker lost)"
+        if not any(p.status in ACTIVE_STATUSES for p in partitions):
+            _settle(db, run, partitions)
+    db.flush()
+
+
+def finish_run(bind, run_id: int):
+    """Settle a partitioned run once none of its partitions is pending or running."""
+    with Session(bind=bind) as db:
+        run = db.get(models.PayrollRun, run_id)
+        if run is None or run.status != "running":
+            return
+        # settling supersedes earlier runs: month lock first, like every other writer
+        lock_month(db, run.month)
+        db.refresh(run, with_for_update=True)
+        if run.status != "running":
+            return
+        partitions = db.query(models.PayrollPartition).filter_by(run_id=run_id).all()
+        if any(p.status in ACTIVE_STATUSES for p in partitions):
+            return
+        _settle(db, run, partitions)
+        db.commit()
+        logger.info("Payroll run %s for %s %s: %d employees, net %d", run.id, run.month,
+                    run.status, run.employee_count, run.total_net)
+
+
+def _heartbeat(engine, partition_id: int, attempt: int, done: threading.Event):
+    P = models.PayrollPartition.__table__
+    while not done.wait(LEASE.total_seconds() / 3):
+        try:
+            with engine.begin() as conn:
+                conn.execute(update(P).where(P.c.id == partition_id, P.c.status == "running",
+                                             P.c.attempts == attempt).values(heartbeat_at=datetime.utcnow()))
+        except Exception as e:
+            logger.warning("Could not renew heartbeat of payroll partition %s: %s", partition_id, e)
+
+
+def run_partition(url: str, partition_id: int):
+    """Process pool entry point: price and store one partition in its own session."""
+    engine = _worker_engine(url)
+    P = models.PayrollPartition
+    with Session(bind=engine) as db:
+        partition = db.get(P, partition_id, with_for_update=True)
+        if partition is None or partition.status != "pending":
+            return
+        run = db.get(models.PayrollRun, partition.run_id)
+        run_id = run.id
+        partition.status = "running"
+        partition.attempts += 1
+        attempt = partition.attempts
+        partition.started_at = partition.heartbeat_at = datetime.utcnow()
+        partition.error = None
+        db.commit()
+        done = threading.Event()
+        threading.Thread(target=_heartbeat, args=(engine, partition_id, attempt, done),
+                         name=f"payroll-partition-{partition_id}", daemon=True).start()
+        try:
+            try:
+                result = compute(db.connection(), run.month, partition_filter(run.partition_by, partition.key))
+                replace_partition_payslips(db, run, partition, result)
+                outcome = {"status": "completed", **result.totals()}
+            except Exception as e:
+                db.rollback()
+                logger.exception("Payroll partition %s (%s=%s) of run %s failed",
+                                 partition_id, run.partition_by, partition.key, run_id)
+                outcome = {"status": "failed", "error": str(e)}
+            current = db.query(P.status, P.attempts).filter(P.id == partition_id).with_for_update().one()
+            if tuple(current) != ("running", attempt):
+                # expire_stale() gave up on this attempt (and may have re-queued it)
+                db.rollback()
+                logger.warning("Payroll partition %s of run %s was failed as stale; discarding its result",
+                               partition_id, run_id)
+                return
+            for field, value in outcome.items():
+                setattr(partition, field, value)
+            partition.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            done.set()
+    finish_run(engine, run_id)
+
+
+def _fail_partition(bind, run_id: int, partition_id: int, error):
+    P = models.PayrollPartition
+    with Session(bind=bind) as db:
+        db.query(P).filter(P.id == partition_id, P.status.in_(("pending", "running"))).update(
+            {"status": "failed", "error": str(error) or type(error).__name__,
+             "finished_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+    finish_run(bind, run_id)
+
+
+def _partition_done(bind, pool: ProcessPoolExecutor, run_id: int, partition_id: int, future: Future):
+    # run_partition records its own failures; this catches the worker process dying
+    error = "cancelled" if future.cancelled() else future.exception()
+    if error is None:
+        return
+    logger.error("Payroll partition %s of run %s crashed: %s", partition_id, run_id, error)
+    if isinstance(error, BrokenProcessPool):
+        _discard_pool(pool)
+    _fail_partition(bind, run_id, partition_id, error)
+
+
+def submit(bind, run_id: int, partition_ids: List[int]):
+    url = bind.url.render_as_string(hide_password=False)
+    pool = _get_pool()
+    for partition_id in partition_ids:
+        try:
+            future = pool.submit(run_partition, url, partition_id)
+        except Exception as e:
+            # the run is already committed: leave it failed (and retryable), not running forever
+            logger.error("Could not queue payroll partition %s of run %s: %s", partition_id, run_id, e)
+            if isinstance(e, BrokenProcessPool):
+                _discard_pool(pool)
+            _fail_partition(bind, run_id, partition_id, e)
+            continue
+        future.add_done_callback(functools.partial(_partition_done, bind, pool, run_id, partition_id))
+
+
+def _dispatch(db: Session, run: models.PayrollRun, partitions: List[models.PayrollPartition]):
+    """Queue the run's pending partitions once the caller commits (or settle it now if none)."""
+    pending = [p.id for p in partitions if p.status == "pending"]
+    if not pending:
+        _settle(db, run, partitions)
+        return
+    bind, run_id = db.get_bind(), run.id
+    event.listen(db, "after_commit", lambda session: submit(bind, run_id, pending), once=True)
+
+
+def start_partitioned_run(db: Session, month: str, partition_by: str) -> models.PayrollRun:
+    """Record a run with one pending partition per department / location and queue them."""
+    if partition_by not in PARTITION_COLUMNS:
+        raise PayrollError(f"partition_by must be one of {list(PARTITION_COLUMNS)}")
+    _, end, _ = month_bounds(month)
+    E = models.Employee
+    try:
+        lock_month(db, month)
+        expire_stale(db, month)
+        check_replaceable(db, month)
+        column = getattr(E, partition_by)
+        keys = [key for (key,) in db.query(column).filter(
+            E.employment_status == "Active", E.hire_date <= end).distinct()]
+        run = models.PayrollRun(month=month, dry_run=False, status="running", partition_by=partition_by)
+        db.add(run)
+        db.flush()
+        now = datetime.utcnow()
+        partitions = [models.PayrollPartition(run_id=run.id, key=key, status="pending", attempts=0,
+                                              heartbeat_at=now)
+                      for key in keys]
+        db.add_all(partitions)
+        db.flush()
+        _dispatch(db, run, partitions)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    logger.info("Payroll run %s for %s queued as %d partitions by %s",
+                run.id, month, len(partitions), partition_by)
+    return run
+
+
+def retry_run(db: Session, run_id: int) -> models.PayrollRun:
+    """Re-queue the failed partitions of a failed run; completed partitions are kept."""
+    run = db.get(models.PayrollRun, run_id)
+    if run is None:
+        raise PayrollRunNotFound(f"Payroll run {run_id} not found")
+    try:
+        lock_month(db, run.month)
+        # a run whose worker died is still "running" until its partitions are found stale
+        expire_stale(db, run.month)
+        if run.partition_by is None or run.status != "failed":
+            raise PayrollConflict(
+                f"Payroll run {run_id} is {run.status}; only failed partitioned runs can be retried")
+        check_replaceable(db, run.month, run.id)
+        partitions = db.query(models.PayrollPartition).filter_by(run_id=run.id).all()
+        now = datetime.utcnow()
+        for partition in partitions:
+            if partition.status == "failed":
+                partition.status, partition.error, partition.heartbeat_at = "pending", None, now
+        run.status, run.error, run.finished_at = "running", None, None
+        _dispatch(db, run, partitions)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return run
+
+
+def run_status(db: Session, run: models.PayrollRun) -> dict:
+    partitions = db.query(models.PayrollPartition).filter_by(
+        run_id=run.id).order_by(models.PayrollPartition.id).all()
+    counts = Counter(p.status for p in partitions)
+    return {
+        "run_id": run.id,
+        "month": run.month,
+        "status": run.status,
+        "dry_run": run.dry_run,
+        "partition_by": run.partition_by,
+        **{field: getattr(run, field) for field in TOTAL_FIELDS},
+        "error": run.error,
+        "created_at": run.created_at.isoformat() if run.created_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        "progress": {"partitions": len(partitions),
+                     **{status: counts[status] for status in ("pending", "running", "completed", "failed")}},
+        "partitions": [{"key": p.key, "status": p.status, "attempts": p.attempts,
+                        "employee_count": p.employee_count, "total_net": p.total_net, "error": p.error}
+                       for p in partitions],
+        "status_url": f"/api/payroll/runs/{run.id}",
+    }
@@ -0,0 +1,278 @@
+"""Buffered ingestion of attendance punches from biometric terminals.
+
+POST /api/attendance/punches hands each batch of events to PunchBuffer.offer(),
+which returns as soon as they are queued. A background thread flushes the
+queue every PUNCH_FLUSH_INTERVAL_MS, or as soon as PUNCH_FLUSH_BATCH events
+are waiting: events are folded per (employee_id, date), merged with the stored
+attendance_records row and written with one INSERT ... ON CONFLICT
+(employee_id, date) DO UPDATE per flush, recomputing working_hours and status.
+The DO UPDATE itself keeps the earlier check-in and the later check-out of the
+stored and incoming rows, so two flushes that both found no row for a day
+(another worker process inserted it meanwhile) merge instead of the second
+overwriting the first; rows whose merged times changed have their
+working_hours and status recomputed in the same transaction.
+
+Backpressure: once PUNCH_BUFFER_SIZE events are waiting, offer() refuses new
+batches and the endpoint answers 503 with Retry-After, so a burst at shift
+change slows the terminals down instead of growing the process. A flush that
+fails puts its punches back at the front of the buffer and the background
+thread retries them with backoff (100 ms doubling to 5 s); accepted punches are
+never dropped, and while the database is down the buffer fills and terminals
+get 503. The upsert needs PostgreSQL or SQLite; on other
+databases offer() raises instead of queueing punches that could never be
+written (the endpoint answers 501).
+
+Merge rules: the check-in is the earliest "in" (or untyped) punch of the day,
+the check-out the latest "out" (or untyped) punch after it. Status is
+"Half Day" when fewer than ATTENDANCE_HALF_DAY_HOURS were worked, "Late" when
+the check-in is after ATTENDANCE_SHIFT_START plus ATTENDANCE_LATE_GRACE_MINUTES,
+and "Present" otherwise. Timestamps are the store's local time.
+
+Settings (environment variables):
+- PUNCH_BUFFER_SIZE: events held before refusing batches (default 50000)
+- PUNCH_FLUSH_BATCH: events written per flush (default 5000)
+- PUNCH_FLUSH_INTERVAL_MS: longest an event waits to be written (default 500)
+- ATTENDANCE_SHIFT_START (default 09:30), ATTENDANCE_LATE_GRACE_MINUTES
+  (default 10), ATTENDANCE_HALF_DAY_HOURS (default 4)
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, tuple_, update
+
+from app import cache, models
+from app.database import UPSERT_DIALECTS, upsert_insert
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = int(os.getenv("PUNCH_BUFFER_SIZE", "50000"))
+FLUSH_BATCH = int(os.getenv("PUNCH_FLUSH_BATCH", "5000"))
+FLUSH_INTERVAL = float(os.getenv("PUNCH_FLUSH_INTERVAL_MS", "500")) / 1000
+RETRY_DELAY, MAX_RETRY_DELAY = 0.1, 5.0
+SHIFT_START = dt_time.fromisoformat(os.getenv("ATTENDANCE_SHIFT_START", "09:30"))
+LATE_GRACE = timedelta(minutes=int(os.getenv("ATTENDANCE_LATE_GRACE_MINUTES", "10")))
+HALF_DAY_MINUTES = float(os.getenv("ATTENDANCE_HALF_DAY_HOURS", "4")) * 60
+# keeps (employee_id, date) IN lists under SQLite's bound-parameter limit
+KEY_CHUNK = 400
+
+ATTENDANCE = models.AttendanceRecord.__table__
+UPDATED_COLUMNS = ("employee_name", "check_in_time", "check_out_time",
+                   "working_hours", "status", "location", "updated_at")
+
+
+def _minutes_between(start: dt_time, end: dt_time) -> int:
+    return int((datetime.combine(date.min, end) - datetime.combine(date.min, start)).total_seconds() // 60)
+
+
+def working_hours(check_in: Optional[dt_time], check_out: Optional[dt_time]) -> Optional[str]:
+    if check_in is None or check_out is None:
+        return None
+    minutes = _minutes_between(check_in, check_out)
+    return f"{minutes // 60}h {minutes % 60}m"
+
+
+def attendance_status(check_in: Optional[dt_time], check_out: Optional[dt_time]) -> str:
+    if check_in is not None and check_out is not None and _minutes_between(check_in, check_out) < HALF_DAY_MINUTES:
+        return "Half Day"
+    if check_in is not None and datetime.combine(date.min, check_in) > datetime.combine(date.min, SHIFT_START) + LATE_GRACE:
+        return "Late"
+    return "Present"
+
+
+def _fold(events: List[dict]) -> Dict[Tuple[str, date], dict]:
+    days = {}
+    for event in events:
+        # wall-clock time at the store, whatever offset the terminal sent
+        ts = event["timestamp"].replace(tzinfo=None)
+        key = (event["employee_id"], ts.date())
+        punch = ts.time().replace(microsecond=0)
+        day = days.setdefault(
+            key, {"ins": [], "outs": [], "employee_name": None, "location": None})
+        if event.get("type") != "out":
+            day["ins"].append(punch)
+        if event.get("type") != "in":
+            day["outs"].append(punch)
+        day["employee_name"] = event.get("employee_name") or day["employee_name"]
+        day["location"] = event.get("location") or day["location"]
+    return days
+
+
+def _merged(dialect_name: str, stored, incoming, earliest: bool):
+    # PostgreSQL's LEAST/GREATEST skip NULLs; SQLite's two-argument min()/max() return NULL
+    pick = (func.least if earliest else func.greatest) if dialect_name == "postgresql" else \
+        (func.min if earliest else func.max)
+    return func.coalesce(pick(stored, incoming), stored, incoming)
+
+
+def _upsert_statement(dialect_name: str):
+    stmt = upsert_insert(ATTENDANCE, dialect_name)
+    set_ = {c: stmt.excluded[c] for c in UPDATED_COLUMNS}
+    set_["check_in_time"] = _merged(dialect_name, ATTENDANCE.c.check_in_time,
+                                    stmt.excluded.check_in_time, earliest=True)
+    set_["check_out_time"] = _merged(dialect_name, ATTENDANCE.c.check_out_time,
+                                     stmt.excluded.check_out_time, earliest=False)
+    return stmt.on_conflict_do_update(index_elements=["employee_id", "date"], set_=set_).returning(
+        ATTENDANCE.c.id, ATTENDANCE.c.check_in_time, ATTENDANCE.c.check_out_time,
+        ATTENDANCE.c.working_hours, ATTENDANCE.c.status)
+
+
+def upsert_punches(conn, events: List[dict]) -> int:
+    """Merge events into attendance_records inside the caller's transaction; returns rows written."""
+    days = _fold(events)
+    keys = list(days)
+    existing = {}
+    for i in range(0, len(keys), KEY_CHUNK):
+        query = select(ATTENDANCE).where(
+            tuple_(ATTENDANCE.c.employee_id, ATTENDANCE.c.date).in_(keys[i:i + KEY_CHUNK]))
+        for row in conn.execute(query.with_for_update()):
+            existing[(row.employee_id, row.date)] = row
+
+    unnamed = {emp for (emp, d), day in days.items()
+               if not day["employee_name"] and (emp, d) not in existing}
+    names = {}
+    if unnamed:
+        employees = models.Employee.__table__
+        names = dict(conn.execute(select(employees.c.employee_id, employees.c.employee_name).where(
+            employees.c.employee_id.in_(list(unnamed)))).all())
+
+    now = datetime.utcnow()
+    rows = []
+    for (employee_id, day_date), day in days.items():
+        stored = existing.get((employee_id, day_date))
+        ins = day["ins"] + ([stored.check_in_time] if stored is not None and stored.check_in_time else [])
+        outs = day["outs"] + ([stored.check_out_time] if stored is not None and stored.check_out_time else [])
+        check_in = min(ins) if ins else None
+        check_out = max(outs) if outs else None
+        if check_in is not None and check_out is not None and check_out <= check_in:
+            check_out = None
+        rows.append({
+            "employee_id": employee_id,
+            "employee_name": day["employee_name"] or (stored.employee_name if stored is not None else None)
+            or names.get(employee_id) or employee_id,
+            "date": day_date,
+            "check_in_time": check_in,
+            "check_out_time": check_out,
+            "working_hours": working_hours(check_in, check_out),
+            "status": attendance_status(check_in, check_out),
+            "location": day["location"] or (stored.location if stored is not None else None),
+            "created_at": now,
+            "updated_at": now,
+        })
+    written = conn.execute(_upsert_statement(conn.dialect.name), rows).all()
+    # a concurrent flush inserted the day first: the statement merged the times, fix what follows from them
+    for row in written:
+        check_in, check_out = row.check_in_time, row.check_out_time
+        if check_in is not None and check_out is not None and check_out <= check_in:
+            check_out = None
+        fixed = {"check_out_time": check_out, "working_hours": working_hours(check_in, check_out),
+                 "status": attendance_status(check_in, check_out)}
+        if fixed != {"check_out_time": row.check_out_time, "working_hours": row.working_hours,
+                     "status": row.status}:
+            conn.execute(update(ATTENDANCE).where(ATTENDANCE.c.id == row.id).values(**fixed))
+    return len(rows)
+
+
+class PunchBuffer:
+    def __init__(self, capacity: int = None, flush_batch: int = None, flush_interval: float = None):
+        self.capacity = capacity or BUFFER_SIZE
+        self.flush_batch = flush_batch or FLUSH_BATCH
+        self.flush_interval = FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.flushes = 0
+        self.failed_flushes = 0
+        self._retry_at = 0.0
+        self._events = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._events)
+
+    def offer(self, bind, events: List[dict]) -> bool:
+        """Queue a batch of punches for `bind`; False (nothing queued) when the buffer is full.
+
+        Raises NotImplementedError for databases the flush cannot upsert into, rather than
+        accepting punches that would be dropped.
+        """
+        if bind.dialect.name not in UPSERT_DIALECTS:
+            raise NotImplementedError(f"Attendance punches cannot be stored in {bind.dialect.name}")
+        with self._cond:
+            if len(self._events) + len(events) > self.capacity:
+                return False
+            self._events.extend((bind, event) for event in events)
+            if len(self._events) >= self.flush_batch:
+                self._cond.notify()
+        self._ensure_started()
+        return True
+
+    def flush(self):
+        """Write everything buffered now (shutdown, tests); stops at the first failed write."""
+        while self._write_next():
+            pass
+        if self._events:
+            logger.error("%d attendance punches are still buffered after a failed flush", len(self._events))
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="attendance-punches", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._events) >= self.flush_batch,
+                                    timeout=self.flush_interval)
+            # back off after a failed flush; the buffered punches wait (and offer() refuses once full)
+            delay = self._retry_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._write_next()
+
+    def _write_next(self) -> bool:
+        """Write one batch; False when there was nothing to write or the write failed."""
+        with self._flush_lock:
+            with self._cond:
+                batch = [self._events.popleft()
+                         for _ in range(min(len(self._events), self.flush_batch))]
+            if not batch:
+                return False
+            by_bind = {}
+            for bind, event in batch:
+                by_bind.setdefault(bind, []).append(event)
+            failed = []
+            for bind, events in by_bind.items():
+                if not self._write(bind, events):
+                    failed.extend((bind, event) for event in events)
+            if failed:
+                self.failed_flushes += 1
+                self._retry_at = time.monotonic() + min(
+                    RETRY_DELAY * 2 ** (self.failed_flushes - 1), MAX_RETRY_DELAY)
+                with self._cond:
+                    self._events.extendleft(reversed(failed))
+                return False
+            self.failed_flushes = 0
+            return True
+
+    def _write(self, bind, events: List[dict]) -> bool:
+        try:
+            with bind.begin() as conn:
+                upsert_punches(conn, events)
+        except Exception as e:
+            logger.warning("Attendance flush of %d punches failed; keeping them buffered: %s", len(events), e)
+            return False
+        self.flushes += 1
+        # cached employee status shows the last check-in / check-out
+        cache.invalidate(*sorted({f"employee:{event['employee_id']}" for event in events}))
+        return True
+
+
+punch_buffer = PunchBuffer()
@@ -0,0 +1,139 @@
+"""SQL statement monitoring: slow-query log and per-request N+1 detection.
+
+Statements are timed with SQLAlchemy cursor events. While a request is being
+served, every statement is also counted by its normalized shape so repeated
+lookups (one query per menu row, etc.) can be reported against the route that
+issued them.
+
+Settings (environment variables):
+- SLOW_QUERY_MS: log statements slower than this many milliseconds (default 200)
+- N_PLUS_ONE_THRESHOLD: flag a statement shape executed more than this many
+  times in a single request (default 5)
+- QUERY_MONITOR_STRICT: when truthy, detections raise QueryMonitorError at the
+  end of the request so they fail tests instead of only being logged
+"""
+import contextvars
+import logging
+import os
+import re
+import time
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+STRICT = os.getenv("QUERY_MONITOR_STRICT", "").lower() in ("1", "true", "yes")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|:\w+|\$\d+|%s")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryMonitorError(RuntimeError):
+    """Raised in strict mode when a request trips a slow-query or N+1 check."""
+
+
+class RequestQueryStats:
+    """Statement counts and timings collected for a single request."""
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        # normalized sql -> [count, total_ms]
+        self.statements = {}
+        self.detections = []
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        path = getattr(route, "path", None) or self.scope.get("path", "")
+        return f"{self.scope.get('method', '')} {path}".strip()
+
+    def record(self, sql: str, elapsed_ms: float):
+        entry = self.statements.setdefault(sql, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed_ms
+
+    @property
+    def total_queries(self) -> int:
+        return sum(count for count, _ in self.statements.values())
+
+    @property
+    def total_ms(self) -> float:
+        return sum(total for _, total in self.statements.values())
+
+
+_current_stats = contextvars.ContextVar("query_stats", default=None)
+
+
+def normalize_sql(statement: str) -> str:
+    """Reduce a statement to its shape: literals and bind markers become '?'."""
+    sql = _STRING_LITERAL.sub("?", statement)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    return _IN_LIST.sub("IN (?)", sql)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() -
+                  conn.info["query_start_time"].pop()) * 1000
+    stats = _current_stats.get()
+    sql = normalize_sql(statement)
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        route = stats.route if stats is not None else "-"
+        logger.warning("Slow query route=%s time_ms=%.1f sql=%s",
+                       route, elapsed_ms, sql)
+        if stats is not None:
+            stats.detections.append(
+                f"slow query ({elapsed_ms:.1f} ms): {sql}")
+
+    if stats is not None:
+        stats.record(sql, elapsed_ms)
+
+
+def _handle_error(context):
+    # a failed statement never reaches after_cursor_execute; drop its start time
+    conn = context.connection
+    if conn is not None and context.execution_context is not None and conn.info.get("query_start_time"):
+        conn.info["query_start_time"].pop()
+
+
+def install(engine):
+    """Attach the timing hooks to an engine (idempotent)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+
+def begin_request(scope: dict):
+    """Start collecting statements for the request described by an ASGI scope."""
+    return _current_stats.set(RequestQueryStats(scope))
+
+
+def end_request(token) -> RequestQueryStats:
+    """Stop collecting, log N+1 patterns and, in strict mode, raise on any detection."""
+    stats = _current_stats.get()
+    _current_stats.reset(token)
+    if stats is None:
+        return stats
+
+    for sql, (count, total_ms) in stats.statements.items():
+        if count > N_PLUS_ONE_THRESHOLD:
+            logger.warning("Repeated query route=%s count=%d total_ms=%.1f sql=%s",
+                           stats.route, count, total_ms, sql)
+            stats.detections.append(
+                f"statement executed {count} times ({total_ms:.1f} ms): {sql}")
+
+    if STRICT and stats.detections:
+        raise QueryMonitorError(
+            f"{stats.route}: " + "; ".join(stats.detections))
+    return stats
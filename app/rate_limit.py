@@ -0,0 +1,279 @@
+"""Token-bucket rate limiting per merchant, employee and client IP.
+
+Every request (static files and API docs aside) is charged against up to two
+buckets: the caller's merchant (X-Merchant-Id header or merchant_id query
+parameter) or, failing that, employee (X-Employee-Id / employee_id), at
+RATE_LIMIT_PER_MINUTE; and always the client IP, at RATE_LIMIT_IP_PER_MINUTE,
+so rotating made-up merchant ids does not escape the limit. A bucket holds up
+to a minute's worth of tokens and refills continuously. Routes cost 1 token
+unless RATE_LIMIT_COSTS (JSON, merged over COSTS) weighs them: keys are
+"METHOD /path-prefix" or "/path-prefix", the longest match wins.
+
+Buckets live in the rate_limit_buckets table, so every uvicorn worker (and
+host) sharing the store shares the limits. Each bucket is checked with one
+INSERT ... ON CONFLICT DO UPDATE ... RETURNING that refills, charges and
+reports in the database, so concurrent workers cannot both spend the same
+token; a request's buckets are charged in one transaction that is rolled back
+when any of them refuses, so a refused request spends nothing. The store is
+the application database, reached through get_db (dependency overrides
+included) like the endpoints, unless RATE_LIMIT_STORE_URL points elsewhere
+(a sqlite file is enough for several workers on one host). If the store is
+unreachable requests are let through (and the store is not retried for
+STORE_RETRY_SECONDS): rate limiting never takes the API down with it.
+
+Sub-requests POST /api/batch runs in-process (marked with SUBREQUEST in
+scope["extensions"]) are not charged again: the batch has paid for them.
+
+Refused requests get 429 with Retry-After; all limited responses carry
+RateLimit-Limit, RateLimit-Remaining and RateLimit-Reset (seconds until the
+bucket is full again) for the tightest bucket. Behind a proxy run uvicorn
+with --proxy-headers so the client IP is the real one.
+
+Settings (environment variables):
+- RATE_LIMIT_ENABLED: default true
+- RATE_LIMIT_PER_MINUTE: per merchant / employee (default 120)
+- RATE_LIMIT_IP_PER_MINUTE: per client IP (default 600)
+- RATE_LIMIT_COSTS: e.g. {"POST /api/exports": 10}
+- RATE_LIMIT_STORE_URL: SQLAlchemy URL of the bucket store (default: DATABASE_URL)
+"""
+import json
+import logging
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from sqlalchemy import case, create_engine, delete, event
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+from app import models
+from app.database import get_db, upsert_insert
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() not in ("0", "false", "no")
+PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "120"))
+IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "600"))
+COSTS = {
+    "POST /api/payroll/runs": 50,
+    "POST /api/employees/bulk": 20,
+    "POST /api/exports": 10,
+    "POST /api/batch": 5,
+    "POST /api/retention/attach-photo-proof": 5,
+    "POST /api/retention/onboarding/upload-missing-documents": 5,
+    "POST /api/retention/sync": 5,
+    "GET /api/downloads/": 2,
+}
+COSTS.update(json.loads(os.getenv("RATE_LIMIT_COSTS", "null")) or {})
+EXEMPT_PREFIXES = ("/static/", "/docs", "/redoc", "/openapi.json", "/favicon.ico")
+STORE_RETRY_SECONDS = 30
+# buckets idle this long are full again and can be dropped
+IDLE_BUCKET_SECONDS = 3600
+PURGE_INTERVAL = 600
+MAX_IDENTITY_LENGTH = 100
+# scope["extensions"] key of in-process sub-requests
+SUBREQUEST = "app.subrequest"
+
+BUCKETS = models.RateLimitBucket.__table__
+
+
+def _take_statement(dialect_name: str):
+    stmt = upsert_insert(BUCKETS, dialect_name)
+    new, old = stmt.excluded, BUCKETS.c
+    elapsed = case((new.updated_at > old.updated_at, new.updated_at - old.updated_at), else_=0.0)
+    refilled = old.tokens + elapsed * new.rate
+    available = case((refilled > new.capacity, new.capacity), else_=refilled)
+    return stmt.on_conflict_do_update(index_elements=["key"], set_={
+        "tokens": case((available >= new.cost, available - new.cost), else_=available),
+        "allowed": available >= new.cost,
+        "capacity": new.capacity,
+        "rate": new.rate,
+        "cost": new.cost,
+        "updated_at": case((new.updated_at > old.updated_at, new.updated_at), else_=old.updated_at),
+    }).returning(BUCKETS.c.key, BUCKETS.c.tokens, BUCKETS.c.allowed)
+
+
+class SQLBucketStore:
+    """Buckets in a SQL table shared by every worker using the same database."""
+
+    def __init__(self, bind):
+        self.bind = bind
+        self._statement = _take_statement(bind.dialect.name)
+        self._last_purge = 0.0
+
+    def take(self, charges: List[Tuple[str, float, float, float]], now: float) -> Dict[str, Tuple[float, bool]]:
+        """Charge (key, capacity, rate per second, cost) buckets; returns {key: (tokens left, allowed)}."""
+        rows = [{"key": key, "capacity": capacity, "rate": rate, "cost": cost,
+                 "tokens": capacity - cost if cost <= capacity else capacity,
+                 "allowed": cost <= capacity, "updated_at": now}
+                for key, capacity, rate, cost in charges]
+        with self.bind.connect() as conn:
+            transaction = conn.begin()
+            result = {}
+            for row in rows:
+                key, tokens, allowed = conn.execute(self._statement, row).one()
+                result[key] = (tokens, bool(allowed))
+            if not all(allowed for _, allowed in result.values()):
+                # all or nothing: a refused request spends none of its buckets
+                transaction.rollback()
+                for row in rows:
+                    tokens, allowed = result[row["key"]]
+                    if allowed:
+                        result[row["key"]] = (tokens + row["cost"], allowed)
+                return result
+            if now - self._last_purge > PURGE_INTERVAL:
+                self._last_purge = now
+                conn.execute(delete(BUCKETS).where(BUCKETS.c.updated_at < now - IDLE_BUCKET_SECONDS))
+            transaction.commit()
+        return result
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # losing the last few charges in a power cut is fine; an fsync per request is not
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def _url_store() -> Optional[SQLBucketStore]:
+    url = os.getenv("RATE_LIMIT_STORE_URL")
+    if url and url.startswith("sqlite"):
+        engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 5})
+        event.listen(engine, "connect", _sqlite_pragmas)
+        return SQLBucketStore(engine)
+    if url:
+        return SQLBucketStore(create_engine(url, pool_pre_ping=True))
+    return None
+
+
+def _app_bind(app):
+    """The engine behind the app's get_db (dependency overrides included)."""
+    sessions = app.dependency_overrides.get(get_db, get_db)()
+    db = next(sessions)
+    try:
+        return db.get_bind()
+    finally:
+        sessions.close()
+
+
+def route_cost(method: str, path: str, costs: Dict[str, float]) -> float:
+    best, cost = -1, 1.0
+    for pattern, weight in costs.items():
+        pattern_method, _, prefix = pattern.rpartition(" ")
+        if pattern_method and pattern_method.upper() != method:
+            continue
+        if path.startswith(prefix) and len(prefix) > best:
+            best, cost = len(prefix), float(weight)
+    return cost
+
+
+def identities(scope) -> List[Tuple[str, float]]:
+    """(bucket key, per-minute limit) pairs the request is charged against."""
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    merchant = headers.get("x-merchant-id") or (query.get("merchant_id") or [None])[0]
+    employee = headers.get("x-employee-id") or (query.get("employee_id") or [None])[0]
+    keys = []
+    if merchant:
+        keys.append((f"merchant:{merchant[:MAX_IDENTITY_LENGTH]}", PER_MINUTE))
+    elif employee:
+        keys.append((f"employee:{employee[:MAX_IDENTITY_LENGTH]}", PER_MINUTE))
+    client = scope.get("client")
+    keys.append((f"ip:{client[0] if client else 'unknown'}", IP_PER_MINUTE))
+    return keys
+
+
+class RateLimiter:
+    def __init__(self, store=None, costs: Dict[str, float] = None, clock=time.time):
+        self.store = store
+        self.costs = COSTS if costs is None else costs
+        self.clock = clock
+        self._store_down_until = 0.0
+        self._url_store_checked = False
+        self._app_store = None
+
+    def store_for(self, app) -> SQLBucketStore:
+        """The configured store, else one on the database get_db hands out."""
+        if self.store is None and not self._url_store_checked:
+            self._url_store_checked = True
+            self.store = _url_store()
+        if self.store is not None:
+            return self.store
+        bind = _app_bind(app)
+        store = self._app_store
+        if store is None or store.bind is not bind:
+            store = self._app_store = SQLBucketStore(bind)
+        return store
+
+    def check(self, scope) -> Optional[dict]:
+        """Charge the request; returns the tightest bucket's state, or None when not limited."""
+        now = self.clock()
+        if now < self._store_down_until:
+            return None
+        cost = route_cost(scope["method"], scope["path"], self.costs)
+        limits = {key: per_minute for key, per_minute in identities(scope) if per_minute > 0}
+        if not limits:
+            return None
+        charges = [(key, per_minute, per_minute / 60.0, min(cost, per_minute))
+                   for key, per_minute in limits.items()]
+        try:
+            taken = self.store_for(scope["app"]).take(charges, now)
+        except Exception as e:
+            self._store_down_until = now + STORE_RETRY_SECONDS
+            logger.warning("Rate limit store unavailable, not limiting for %ds: %s", STORE_RETRY_SECONDS, e)
+            return None
+        states = []
+        for key, capacity, rate, charged in charges:
+            tokens, allowed = taken[key]
+            states.append({
+                "key": key, "allowed": allowed, "limit": int(capacity), "remaining": max(0, math.floor(tokens)),
+                "reset": math.ceil((capacity - tokens) / rate),
+                "retry_after": 0 if allowed else max(1, math.ceil((charged - tokens) / rate)),
+            })
+        refused = [s for s in states if not s["allowed"]]
+        if refused:
+            return max(refused, key=lambda s: s["retry_after"])
+        return min(states, key=lambda s: s["remaining"] / s["limit"])
+
+
+def _headers(state: dict) -> List[Tuple[bytes, bytes]]:
+    headers = [(b"ratelimit-limit", str(state["limit"]).encode()),
+               (b"ratelimit-remaining", str(state["remaining"]).encode()),
+               (b"ratelimit-reset", str(state["reset"]).encode())]
+    if not state["allowed"]:
+        headers.append((b"retry-after", str(state["retry_after"]).encode()))
+    return headers
+
+
+limiter = RateLimiter()
+
+
+class RateLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not ENABLED or scope["method"] == "OPTIONS"
+                or scope["path"] == "/" or scope["path"].startswith(EXEMPT_PREFIXES)
+                or SUBREQUEST in scope.get("extensions", {})):
+            return await self.app(scope, receive, send)
+        state = await run_in_threadpool(limiter.check, scope)
+        if state is None:
+            return await self.app(scope, receive, send)
+        headers = _headers(state)
+        if not state["allowed"]:
+            logger.info("Rate limited %s %s (%s)", scope["method"], scope["path"], state["key"])
+            response = JSONResponse(status_code=429, content={
+                "status": "error", "message": f"Too many requests; retry in {state['retry_after']}s"})
+            response.raw_headers.extend(headers)
+            return await response(scope, receive, send)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,167 @@
+"""Precomputed daily worklists of retention executors.
+
+The "retention_tasks" scheduled job (see app/scheduler.py) rebuilds today's
+executor_tasks rows every RETENTION_TASKS_REFRESH_MINUTES for every executor
+with activities in the last RETENTION_LOOKBACK_DAYS, from those activities:
+
+- tasks (today's worklist): follow-ups due today or overdue, and visits to
+  merchants whose latest health update is not Healthy and who have not had a
+  completed activity since. A merchant is due a follow-up
+  RETENTION_FOLLOWUP_DAYS after the executor's last activity with them.
+- reminders: follow-ups due within the next RETENTION_REMINDER_HORIZON_DAYS.
+- pending actions: logged merchant needs and commitments (notes whose type
+  mentions "commitment") with no completed activity for the merchant since,
+  and the daily report once the executor has activity today but no report.
+
+GET /api/retention/my-notifications, /followup-reminders and /pending-actions
+read these rows and never compute on demand, so what they show is at most one
+refresh old. Days and times are UTC, like activities.created_at. Rows older
+than RETENTION_TASKS_KEEP_DAYS are purged by the refresh.
+
+Settings (environment variables):
+- RETENTION_TASKS_REFRESH_MINUTES: default 15
+- RETENTION_FOLLOWUP_DAYS: default 7
+- RETENTION_REMINDER_HORIZON_DAYS: default 3
+- RETENTION_LOOKBACK_DAYS: activities considered (default 30)
+- RETENTION_TASKS_KEEP_DAYS: default 7
+"""
+import json
+import os
+import re
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, insert, or_
+from sqlalchemy.orm import Session
+
+from app import models, scheduler
+
+REFRESH_MINUTES = float(os.getenv("RETENTION_TASKS_REFRESH_MINUTES", "15"))
+FOLLOWUP = timedelta(days=float(os.getenv("RETENTION_FOLLOWUP_DAYS", "7")))
+HORIZON_DAYS = int(os.getenv("RETENTION_REMINDER_HORIZON_DAYS", "3"))
+LOOKBACK = timedelta(days=float(os.getenv("RETENTION_LOOKBACK_DAYS", "30")))
+KEEP_DAYS = int(os.getenv("RETENTION_TASKS_KEEP_DAYS", "7"))
+# assigned_to of activities saved without an executor_id (see _activity_row in main)
+DEFAULT_EXECUTOR = "Executor"
+REPORT_DUE = time(18, 0)
+DEFAULT_RESOLUTION = timedelta(hours=48)
+KINDS = {
+    # kind: (id field, text field, due field) of the items the endpoints return
+    "task": ("task_id", "title", "due"),
+    "reminder": ("reminder_id", "text", "when"),
+    "action": ("action_id", "title", "due"),
+}
+
+JOB_NAME = "retention_tasks"
+TASKS = models.ExecutorTask.__table__
+
+
+def _resolution_time(estimate) -> timedelta:
+    """'48 hours' / '2 days' -> timedelta (48h when missing or unreadable)."""
+    match = re.match(r"\s*(\d+)\s*(hour|day)", str(estimate or ""), re.IGNORECASE)
+    if not match:
+        return DEFAULT_RESOLUTION
+    amount = int(match.group(1))
+    return timedelta(days=amount) if match.group(2).lower() == "day" else timedelta(hours=amount)
+
+
+def _item(executor_id: str, kind: str, key: str, title: str, merchant_id: Optional[str],
+          priority: str, due_at: Optional[datetime], activity_id: Optional[int]) -> dict:
+    return {"executor_id": executor_id, "kind": kind, "item_key": key, "title": title[:200],
+            "merchant_id": merchant_id, "priority": priority, "due_at": due_at,
+            "source_activity_id": activity_id}
+
+
+def build_items(activities: Iterable, now: datetime) -> List[dict]:
+    """Worklist items for the day of `now` from activity rows, oldest first."""
+    today = now.date()
+    merchants = {}  # (executor, merchant) -> state
+    active_today, reported_today = set(), set()
+    for activity in activities:
+        executor = activity.assigned_to
+        if activity.created_at.date() == today:
+            active_today.add(executor)
+            if activity.kind == "summary_report":
+                reported_today.add(executor)
+        if not activity.merchant_id:
+            continue
+        state = merchants.setdefault((executor, activity.merchant_id), {"at_risk": None, "open": []})
+        state["last"] = activity
+        details = json.loads(activity.details or "{}")
+        if activity.kind == "activity_complete":
+            # a completed visit / call settles what was logged before it
+            state["at_risk"], state["open"] = None, []
+        elif activity.kind == "health_update":
+            status = details.get("new_status")
+            state["at_risk"] = (activity, status) if status and status != "Healthy" else None
+        elif activity.kind == "merchant_need":
+            state["open"].append(("need", activity, details))
+        elif activity.kind == "note" and "commitment" in str(details.get("note_type", "")).lower():
+            state["open"].append(("commitment", activity, details))
+
+    items = []
+    for (executor, merchant_id), state in merchants.items():
+        last = state["last"]
+        due = last.created_at + FOLLOWUP
+        if state["at_risk"] is not None:
+            activity, status = state["at_risk"]
+            items.append(_item(executor, "task", f"visit:{merchant_id}", f"Visit {merchant_id} (health: {status})",
+                               merchant_id, "High", activity.created_at, activity.id))
+        elif due.date() <= today:
+            items.append(_item(executor, "task", f"followup:{merchant_id}", f"Follow up with {merchant_id}",
+                               merchant_id, "High" if due.date() < today else "Medium", due, last.id))
+        elif due.date() <= today + timedelta(days=HORIZON_DAYS):
+            items.append(_item(executor, "reminder", f"followup:{merchant_id}", f"Follow up with {merchant_id}",
+                               merchant_id, "Medium", due, last.id))
+        for open_kind, activity, details in state["open"]:
+            if open_kind == "need":
+                title = f"Check {details.get('need_type') or activity.name} is resolved for {merchant_id}"
+                items.append(_item(executor, "action", f"need:{activity.id}", title, merchant_id,
+                                   details.get("priority") or "Medium",
+                                   activity.created_at + _resolution_time(details.get("estimated_resolution")),
+                                   activity.id))
+            else:
+                title = f"Commitment to {merchant_id}: {details.get('content') or activity.name}"
+                items.append(_item(executor, "action", f"commitment:{activity.id}", title, merchant_id,
+                                   "Medium", activity.created_at + FOLLOWUP, activity.id))
+    for executor in sorted(active_today - reported_today):
+        items.append(_item(executor, "action", "daily_report", "Submit daily report", None, "Medium",
+                           datetime.combine(today, REPORT_DUE), None))
+    return items
+
+
+@scheduler.job(JOB_NAME, every=REFRESH_MINUTES * 60)
+def refresh(bind, now: datetime) -> int:
+    """Replace today's precomputed items (in one transaction); returns how many were written."""
+    today = now.date()
+    A, T = models.Activity, models.ExecutorTask
+    with Session(bind=bind) as db:
+        activities = (db.query(A.id, A.kind, A.name, A.assigned_to, A.merchant_id, A.details, A.created_at)
+                      .filter(A.created_at >= now - LOOKBACK, A.created_at <= now)
+                      .order_by(A.created_at, A.id).yield_per(1000))
+        items = build_items(activities, now)
+        db.query(T).filter(or_(T.day == today, T.day < today - timedelta(days=KEEP_DAYS))).delete(
+            synchronize_session=False)
+        if items:
+            db.execute(insert(TASKS), [{**item, "day": today, "computed_at": now} for item in items])
+        db.commit()
+    return len(items)
+
+
+def read(db: Session, kind: str, executor_id: str = None, day: date = None) -> Tuple[List[dict], Optional[str]]:
+    """(items, computed_at) of one kind for an executor's day (today by default)."""
+    T = models.ExecutorTask
+    rows = (db.query(T)
+            .filter(T.executor_id == (executor_id or DEFAULT_EXECUTOR),
+                    T.day == (day or datetime.utcnow().date()), T.kind == kind)
+            .order_by(case({"High": 0, "Medium": 1}, value=T.priority, else_=2), T.due_at, T.id)
+            .all())
+    id_field, text_field, due_field = KINDS[kind]
+    items = [{id_field: row.item_key, text_field: row.title, due_field: row.due_at.isoformat() if row.due_at else None,
+              "priority": row.priority, "merchant_id": row.merchant_id} for row in rows]
+    computed_at = max((row.computed_at for row in rows), default=None)
+    if computed_at is None:
+        # nothing to do today, or not computed yet: say which
+        job = db.get(models.ScheduledJob, JOB_NAME)
+        computed_at = job.last_finished_at if job is not None and job.last_status == "completed" else None
+    return items, computed_at.isoformat() if computed_at else None
@@ -0,0 +1,212 @@
+"""Periodic jobs run inside the app, with the database as the job store.
+
+Jobs register with a decorator and take the engine and the current (UTC) time:
+
+    @scheduler.job("retention_tasks", every=900)
+    def refresh_retention_tasks(bind, now): ...
+
+Every worker process runs a scheduler thread (started with the app) that
+checks the scheduled_jobs table every SCHEDULER_POLL_SECONDS. A due job is
+leased with a single conditional UPDATE (next_run_at has passed and nobody
+holds an unexpired lease), so whichever worker's UPDATE matches runs it and
+the others skip it. The lease is renewed while the job runs; if the worker
+dies, the lease lapses after SCHEDULER_LEASE_SECONDS and another worker takes
+the job over. When a job finishes (or fails, see last_status / last_error)
+it is due again `every` seconds after it started.
+
+Rows are created the first time a worker sees a registered job, due at once.
+POST /api/scheduler/jobs/{name}/run makes a job due now.
+
+Settings (environment variables):
+- SCHEDULER_ENABLED: run jobs in this process (default true)
+- SCHEDULER_POLL_SECONDS: how often due jobs are looked for (default 30)
+- SCHEDULER_LEASE_SECONDS: lease length, renewed every third of it (default 300)
+"""
+import logging
+import os
+import socket
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() not in ("0", "false", "no")
+POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", "30"))
+LEASE = timedelta(seconds=float(os.getenv("SCHEDULER_LEASE_SECONDS", "300")))
+# identifies this process in lease_owner
+OWNER = f"{socket.gethostname()[:60]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+JOBS = models.ScheduledJob.__table__
+
+
+class Job:
+    def __init__(self, name: str, run: Callable, every: float):
+        self.name = name
+        self.run = run
+        self.every = every
+
+
+_jobs: "OrderedDict[str, Job]" = OrderedDict()
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+class JobNotFound(Exception):
+    status_code = 404
+
+
+def job(name: str, every: float):
+    """Decorator registering run(bind, now) to run every `every` seconds."""
+    def decorator(run):
+        _jobs[name] = Job(name, run, every)
+        return run
+    return decorator
+
+
+def jobs() -> List[Job]:
+    return list(_jobs.values())
+
+
+def ensure_rows(bind, now: datetime = None):
+    """Create missing scheduled_jobs rows (due now) and pick up changed intervals."""
+    now = now or datetime.utcnow()
+    with Session(bind=bind) as db:
+        existing = {row.name: row for row in db.query(models.ScheduledJob)}
+        for registered in _jobs.values():
+            row = existing.get(registered.name)
+            if row is None:
+                try:
+                    with db.begin_nested():
+                        db.add(models.ScheduledJob(name=registered.name, interval_seconds=int(registered.every),
+                                                   next_run_at=now, run_count=0))
+                except IntegrityError:
+                    pass  # another worker created it
+            elif row.interval_seconds != int(registered.every):
+                row.interval_seconds = int(registered.every)
+        db.commit()
+
+
+def _lease(bind, name: str, now: datetime, owner: str) -> bool:
+    with bind.begin() as conn:
+        result = conn.execute(
+            update(JOBS)
+            .where(JOBS.c.name == name, JOBS.c.next_run_at <= now,
+                   or_(JOBS.c.lease_expires_at.is_(None), JOBS.c.lease_expires_at < now))
+            .values(lease_owner=owner, lease_expires_at=now + LEASE, last_started_at=now))
+        return result.rowcount == 1
+
+
+def _renew(bind, name: str, owner: str):
+    with bind.begin() as conn:
+        conn.execute(update(JOBS).where(JOBS.c.name == name, JOBS.c.lease_owner == owner)
+                     .values(lease_expires_at=datetime.utcnow() + LEASE))
+
+
+def _release(bind, registered: Job, owner: str, started: datetime, error: str = None):
+    finished = datetime.utcnow()
+    with bind.begin() as conn:
+        conn.execute(
+            update(JOBS).where(JOBS.c.name == registered.name, JOBS.c.lease_owner == owner)
+            .values(lease_owner=None, lease_expires_at=None, last_finished_at=finished,
+                    next_run_at=max(started + timedelta(seconds=registered.every), finished),
+                    last_status="failed" if error else "completed", last_error=error,
+                    run_count=JOBS.c.run_count + 1))
+
+
+def _run_leased(bind, registered: Job, now: datetime, owner: str):
+    done = threading.Event()
+
+    def heartbeat():
+        while not done.wait(LEASE.total_seconds() / 3):
+            try:
+                _renew(bind, registered.name, owner)
+            except Exception as e:
+                logger.warning("Could not renew lease of job %s: %s", registered.name, e)
+
+    threading.Thread(target=heartbeat, name=f"lease-{registered.name}", daemon=True).start()
+    error = None
+    try:
+        registered.run(bind, now)
+    except Exception as e:
+        logger.exception("Scheduled job %s failed", registered.name)
+        error = str(e)[:1000] or type(e).__name__
+    finally:
+        done.set()
+    _release(bind, registered, owner, now, error)
+
+
+def run_due(bind, now: datetime = None, owner: str = OWNER) -> List[str]:
+    """Run the due jobs this worker manages to lease; returns their names."""
+    now = now or datetime.utcnow()
+    ensure_rows(bind, now)
+    ran = []
+    for registered in list(_jobs.values()):
+        if _stop.is_set():
+            break
+        if _lease(bind, registered.name, now, owner):
+            _run_leased(bind, registered, now, owner)
+            ran.append(registered.name)
+    return ran
+
+
+def request_run(db: Session, name: str) -> models.ScheduledJob:
+    """Make a job due now (the next poll of any worker runs it); caller commits."""
+    row = db.get(models.ScheduledJob, name)
+    if row is None:
+        if name not in _jobs:
+            raise JobNotFound(f"Scheduled job {name} not found")
+        row = models.ScheduledJob(name=name, interval_seconds=int(_jobs[name].every), run_count=0)
+        db.add(row)
+    row.next_run_at = datetime.utcnow()
+    db.flush()
+    return row
+
+
+def job_status(row: models.ScheduledJob) -> dict:
+    iso = lambda value: value.isoformat() if value else None
+    return {
+        "name": row.name,
+        "every_seconds": row.interval_seconds,
+        "next_run_at": iso(row.next_run_at),
+        "running": row.lease_owner is not None and row.lease_expires_at is not None
+        and row.lease_expires_at > datetime.utcnow(),
+        "last_started_at": iso(row.last_started_at),
+        "last_finished_at": iso(row.last_finished_at),
+        "last_status": row.last_status,
+        "last_error": row.last_error,
+        "run_count": row.run_count,
+    }
+
+
+def _loop(bind):
+    while not _stop.is_set():
+        try:
+            run_due(bind)
+        except Exception as e:
+            logger.warning("Scheduler poll failed: %s", e)
+        _stop.wait(POLL_SECONDS)
+
+
+def start(bind):
+    """Start this process's scheduler thread (no-op when disabled or already running)."""
+    global _thread
+    if not ENABLED or (_thread is not None and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, args=(bind,), name="scheduler", daemon=True)
+    _thread.start()
+
+
+def stop(timeout: float = 5):
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout)
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-from datetime import date
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, List, Dict, Any, Literal
+from datetime import date, datetime
 
 
 # ===== HR SCHEMAS =====
@@ -200,3 +200,55 @@ class CompanyInfoResponse(BaseModel):
     description: str
     features: List[str]
     last_updated: str
+
+
+class BatchRequest(BaseModel):
+    # Internal GET paths (optionally with a query string), e.g.
+    # "/api/retention/pending-actions" or "/api/merchant/sales/today?merchant_id=MERCH001"
+    paths: List[str]
+
+
+class RetentionSyncAction(BaseModel):
+    # client-generated idempotency key; replays of the same key are not applied twice
+    client_id: str = Field(..., min_length=1, max_length=64)
+    # mark_activity_complete, submit_summary_report, update_merchant_health,
+    # log_merchant_needs, add_notes_commitments or attach_photo_proof
+    type: str
+    payload: Dict[str, Any] = {}
+
+
+class RetentionSyncRequest(BaseModel):
+    executor_id: Optional[str] = None
+    # applied in order
+    actions: List[RetentionSyncAction]
+
+
+class ExportRequest(BaseModel):
+    # attendance, payslips, sales or retention
+    report_type: str
+    # xlsx or pdf
+    format: str = "xlsx"
+    filters: Dict[str, Any] = {}
+
+
+class AttendancePunch(BaseModel):
+    employee_id: str
+    # store-local time of the punch
+    timestamp: datetime
+    # omitted: the day's first punch is the check-in and its last the check-out
+    type: Optional[Literal["in", "out"]] = None
+    employee_name: Optional[str] = None
+    location: Optional[str] = None
+
+
+class AttendancePunchBatch(BaseModel):
+    terminal_id: Optional[str] = None
+    events: List[AttendancePunch]
+
+
+class PayrollRunRequest(BaseModel):
+    month: str  # YYYY-MM
+    # compute and diff against the previous run without storing payslips
+    dry_run: bool = False
+    # run one partition per department / office location on the payroll process pool
+    partition_by: Optional[Literal["department", "office_location"]] = None
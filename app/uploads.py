@@ -0,0 +1,380 @@
+"""Streaming multipart uploads into a content-addressed store.
+
+receive_upload() feeds the request body to the multipart parser as it arrives
+instead of going through UploadFile, which spools the whole file before the
+handler runs. File parts are written to a temporary file in WRITE_BUFFER-sized
+pieces (in the threadpool, off the event loop) and hashed with SHA-256 as they
+go. The request is rejected with UploadTooLarge up front when Content-Length
+is already over MAX_UPLOAD_BYTES, and otherwise as soon as the streamed body
+crosses it.
+
+Files are stored once per content hash under UPLOAD_DIR/blobs/<ab>/<sha256>;
+the stored_blobs table counts how many records reference each one. A received
+part stays a temp file until the caller has recorded its reference and calls
+persist(), which moves it into place - or just drops it when the blob already
+exists. Clients that know the hash can send it in X-Content-SHA256: when the
+blob is already stored, the body is only hashed to verify it and nothing is
+written to disk. The Content-Type the client sent is not trusted: sniff()
+replaces it with one read from the bytes (Pillow for images, the header for
+PDFs, application/octet-stream otherwise), and downloads are only served as
+one of SAFE_CONTENT_TYPES. Thumbnails for images are rendered once per hash by a small
+thread pool so the response does not wait for them.
+
+Settings (environment variables):
+- UPLOAD_DIR: where uploads are stored (default ./uploads)
+- MAX_UPLOAD_BYTES: limit per request (default 10 MB)
+- THUMBNAIL_WORKERS: thumbnail pool size (default 2)
+- THUMBNAIL_SIZE: longest thumbnail edge in pixels (default 256)
+"""
+import hashlib
+import logging
+import os
+import re
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from multipart.multipart import MultipartParser, parse_options_header
+from PIL import Image
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", os.path.join(os.getcwd(), "uploads")))
+THUMBNAIL_DIR = UPLOAD_DIR / "thumbnails"
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+
+WRITE_BUFFER = 1024 * 1024
+# room for boundaries, part headers and small text fields on top of the file bytes
+FORM_OVERHEAD = 64 * 1024
+MAX_FIELD_BYTES = 16 * 1024
+CONTENT_HASH_HEADER = "X-Content-SHA256"
+# blobs never change once written, so clients may cache them for good
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+SHA256_RE = re.compile(r"[0-9a-f]{64}")
+# what a stored blob may be served as; anything else goes out as application/octet-stream
+SAFE_CONTENT_TYPES = frozenset(
+    {"image/jpeg", "image/png", "image/gif", "image/webp", "application/pdf"})
+
+_thumbnail_pool = ThreadPoolExecutor(
+    max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+
+
+class UploadError(Exception):
+    status_code = 400
+
+
+class UploadTooLarge(UploadError):
+    status_code = 413
+
+
+def blob_path(sha256: str) -> Path:
+    return UPLOAD_DIR / "blobs" / sha256[:2] / sha256
+
+
+def thumbnail_path(sha256: str) -> Path:
+    return THUMBNAIL_DIR / f"{sha256}.jpg"
+
+
+def served_content_type(content_type: Optional[str]) -> str:
+    """The Content-Type to serve a blob with, given the type recorded when it was uploaded."""
+    return content_type if content_type in SAFE_CONTENT_TYPES else "application/octet-stream"
+
+
+def _sniff_image(path: Path) -> Optional[str]:
+    try:
+        with Image.open(path) as im:
+            fmt = im.format
+            im.verify()
+    except Exception:
+        return None
+    return Image.MIME.get(fmt)
+
+
+def blob_for_name(name: str) -> Optional[Tuple[str, Path]]:
+    """Resolve a download name of the form <sha256>[.ext] to (hash, stored path)."""
+    sha256 = name.split(".", 1)[0].lower()
+    if not SHA256_RE.fullmatch(sha256):
+        return None
+    path = blob_path(sha256)
+    return (sha256, path) if path.is_file() else None
+
+
+class StoredUpload:
+    """A received file part.
+
+    Until persist() (or discard()) is called the bytes live in a temp file, or
+    nowhere at all when they matched a blob that is already stored.
+    """
+
+    def __init__(self, field: str, filename: str, content_type: str, sha256: str, size: int, tmp_path: Optional[Path]):
+        self.field = field
+        self.filename = filename
+        self.content_type = content_type
+        self.sha256 = sha256
+        self.size = size
+        self.tmp_path = tmp_path
+        self.deduplicated = tmp_path is None
+
+    @property
+    def path(self) -> Path:
+        return blob_path(self.sha256)
+
+    @property
+    def is_image(self) -> bool:
+        return self.content_type.startswith("image/")
+
+    @property
+    def extension(self) -> str:
+        ext = Path(self.filename).suffix.lower()
+        return ext if ext[1:].isalnum() and len(ext) <= 10 else ""
+
+    def sniff(self, image_only: bool = False):
+        """Replace the client's content_type with one read from the received bytes.
+
+        Raises UploadError when image_only is set and the bytes are not an image.
+        """
+        src = self.tmp_path or self.path
+        if not src.is_file():
+            raise UploadError("Stored content is no longer available; upload the file again")
+        content_type = _sniff_image(src)
+        if content_type is None:
+            if image_only:
+                raise UploadError("The file is not an image")
+            with open(src, "rb") as fh:
+                content_type = "application/pdf" if fh.read(5) == b"%PDF-" else "application/octet-stream"
+        self.content_type = content_type
+
+    def persist(self):
+        """Move the received bytes into the store; a no-op for content that is already there."""
+        dest = self.path
+        if self.tmp_path is None:
+            if not dest.is_file():
+                raise UploadError("Stored content is no longer available; upload the file again")
+            return
+        if dest.exists():
+            self.tmp_path.unlink(missing_ok=True)
+            self.deduplicated = True
+        else:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self.tmp_path, dest)
+        self.tmp_path = None
+
+    def discard(self):
+        if self.tmp_path is not None:
+            self.tmp_path.unlink(missing_ok=True)
+            self.tmp_path = None
+
+    def as_dict(self) -> dict:
+        return {
+            "file_name": self.filename,
+            "file_url": f"/api/downloads/{self.sha256}{self.extension}",
+            "content_type": self.content_type,
+            "size_bytes": self.size,
+            "sha256": self.sha256,
+            "deduplicated": self.deduplicated,
+            "thumbnail_url": f"/api/uploads/thumbnails/{self.sha256}.jpg" if self.is_image else None
+        }
+
+
+class _FilePart:
+    def __init__(self, field: str, filename: str, content_type: str, expected_sha256: Optional[str]):
+        self.field = field
+        self.filename = filename
+        self.content_type = content_type
+        self.expected_sha256 = expected_sha256
+        # content the store already has is only hashed, never written
+        self.write = not (expected_sha256 and blob_path(
+            expected_sha256).is_file())
+        self.tmp_path = UPLOAD_DIR / "tmp" / \
+            f"{uuid.uuid4().hex}.part" if self.write else None
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.pending: List[bytes] = []
+        self.done = False
+        self.finished = False
+        self.fh = None
+
+    def flush(self):
+        if self.write and self.fh is None:
+            self.tmp_path.parent.mkdir(parents=True, exist_ok=True)
+            self.fh = open(self.tmp_path, "wb")
+        for piece in self.pending:
+            self.hasher.update(piece)
+            if self.write:
+                self.fh.write(piece)
+        self.pending.clear()
+        if self.done:
+            if self.write:
+                self.fh.close()
+            self.finished = True
+            if self.expected_sha256 and self.hasher.hexdigest() != self.expected_sha256:
+                raise UploadError(
+                    f"File content does not match {CONTENT_HASH_HEADER}")
+
+    def stored(self) -> StoredUpload:
+        return StoredUpload(self.field, self.filename, self.content_type,
+                            self.hasher.hexdigest(), self.size, self.tmp_path)
+
+    def discard(self):
+        if self.fh is not None and not self.fh.closed:
+            self.fh.close()
+        if self.tmp_path is not None:
+            self.tmp_path.unlink(missing_ok=True)
+
+
+class _MultipartSink:
+    """Parser callbacks: collect text fields, queue file bytes for the writer."""
+
+    def __init__(self, max_bytes: int, expected_sha256: Optional[str]):
+        self.max_bytes = max_bytes
+        self.expected_sha256 = expected_sha256
+        self.received = 0
+        self.pending_bytes = 0
+        self.fields: Dict[str, str] = {}
+        self.parts: List[_FilePart] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._field_name = None
+        self._field_data = b""
+        self._part: Optional[_FilePart] = None
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+        self._field_name = None
+        self._field_data = b""
+        self._part = None
+
+    def on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(
+            self._headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise UploadError("Multipart part without a field name")
+        self._field_name = options[b"name"].decode("utf-8", "replace")
+        if b"filename" in options:
+            content_type = self._headers.get(
+                b"content-type", b"application/octet-stream").decode("latin-1")
+            self._part = _FilePart(self._field_name, options[b"filename"].decode(
+                "utf-8", "replace"), content_type, self.expected_sha256)
+            self.parts.append(self._part)
+
+    def on_part_data(self, data, start, end):
+        size = end - start
+        self.received += size
+        if self.received > self.max_bytes:
+            raise UploadTooLarge(
+                f"Upload exceeds the {self.max_bytes} byte limit")
+        if self._part is None:
+            self._field_data += data[start:end]
+            if len(self._field_data) > MAX_FIELD_BYTES:
+                raise UploadError(f"Field '{self._field_name}' is too large")
+        else:
+            self._part.pending.append(data[start:end])
+            self._part.size += size
+            self.pending_bytes += size
+
+    def on_part_end(self):
+        if self._part is None:
+            self.fields[self._field_name] = self._field_data.decode(
+                "utf-8", "replace")
+        else:
+            self._part.done = True
+
+    def write_pending(self):
+        """Hash and write queued file bytes; runs in the threadpool."""
+        for part in self.parts:
+            if not part.finished:
+                part.flush()
+        self.pending_bytes = 0
+
+    def discard(self):
+        for part in self.parts:
+            part.discard()
+
+
+async def receive_upload(request: Request, max_bytes: int = None) -> Tuple[Dict[str, str], List[StoredUpload]]:
+    """Stream a multipart/form-data body; returns (text fields, received files).
+
+    The caller must persist() or discard() every returned file.
+    """
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+    content_type, params = parse_options_header(
+        request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("Expected a multipart/form-data body")
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes + FORM_OVERHEAD:
+        raise UploadTooLarge(f"Upload exceeds the {max_bytes} byte limit")
+    expected_sha256 = request.headers.get(
+        CONTENT_HASH_HEADER, "").strip().lower() or None
+    if expected_sha256 and not SHA256_RE.fullmatch(expected_sha256):
+        raise UploadError(
+            f"{CONTENT_HASH_HEADER} must be a hex SHA-256 digest")
+
+    sink = _MultipartSink(max_bytes, expected_sha256)
+    parser = MultipartParser(params[b"boundary"], sink.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if sink.pending_bytes >= WRITE_BUFFER:
+                await run_in_threadpool(sink.write_pending)
+        parser.finalize()
+        await run_in_threadpool(sink.write_pending)
+        if any(not part.finished for part in sink.parts):
+            raise UploadError("Incomplete multipart body")
+    except BaseException:
+        await run_in_threadpool(sink.discard)
+        raise
+    return sink.fields, [part.stored() for part in sink.parts]
+
+
+def _render_thumbnail(src: Path, dest: Path):
+    # render under a private name so concurrent renders of one hash never expose a partial file
+    tmp = dest.with_name(f".{uuid.uuid4().hex}.tmp")
+    try:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with Image.open(src) as im:
+            im.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            im.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            im.convert("RGB").save(tmp, "JPEG", quality=80)
+        os.replace(tmp, dest)
+    except Exception as e:
+        tmp.unlink(missing_ok=True)
+        logger.warning("Could not render thumbnail for %s: %s", src.name, e)
+        raise
+
+
+def schedule_thumbnail(upload: StoredUpload) -> Optional[Future]:
+    """Queue thumbnail rendering for a persisted image unless its hash already has one."""
+    dest = thumbnail_path(upload.sha256)
+    if not upload.is_image or dest.exists():
+        return None
+    return _thumbnail_pool.submit(_render_thumbnail, upload.path, dest)
@@ -0,0 +1,72 @@
+"""Micro-benchmarks for pure-Python helpers that run on every request.
+
+Requires pytest-benchmark (in requirements.txt). Results are stored
+under .benchmarks/ so they can be compared across commits:
+
+    pytest benchmarks --benchmark-autosave
+    pytest benchmarks --benchmark-compare            # against the latest saved run
+    pytest benchmarks --benchmark-compare=0001 --benchmark-compare-fail=mean:10%
+"""
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app.main import (  # noqa: E402
+    _attendance_row_to_dict,
+    _load_json_file,
+    _save_json_file,
+    generate_mock_menu_data_for_company,
+    generate_mock_sales_data,
+    validate_merchant_id,
+)
+
+
+def _attendance_rows(count):
+    today = date.today()
+    return [
+        (i, f"EMP{i % 500:03d}", f"Employee {i % 500}", today - timedelta(days=i % 365),
+         time(9, i % 60), time(18, i % 60), "9h 0m", "Present", "Head Office",
+         datetime(2025, 1, 1, 9, 0))
+        for i in range(count)
+    ]
+
+
+def test_validate_merchant_id_given(benchmark):
+    merchant_id, _ = benchmark(validate_merchant_id, "MERCH001")
+    assert merchant_id == "MERCH001"
+
+
+def test_validate_merchant_id_missing(benchmark):
+    merchant_id, _ = benchmark(validate_merchant_id, None)
+    assert merchant_id.startswith("MERCH")
+
+
+@pytest.mark.parametrize("company_type", ["icp_hr", "pos_youhr", "unknown"])
+def test_generate_mock_menu_data_for_company(benchmark, company_type):
+    benchmark(generate_mock_menu_data_for_company, company_type)
+
+
+@pytest.mark.parametrize("period", ["today", "weekly"])
+def test_generate_mock_sales_data(benchmark, period):
+    data = benchmark(generate_mock_sales_data, period)
+    assert data["period"] == period
+
+
+def test_attendance_row_to_dict_1k_rows(benchmark):
+    rows = _attendance_rows(1000)
+    history = benchmark(lambda: [_attendance_row_to_dict(r) for r in rows])
+    assert len(history) == 1000
+
+
+@pytest.mark.parametrize("entries", [1_000, 10_000, 100_000])
+def test_load_json_file(benchmark, tmp_path, entries):
+    path = tmp_path / "feedback.json"
+    _save_json_file(path, [
+        {"id": i, "merchant_id": f"MERCH{i % 100:03d}", "content": f"Feedback {i}",
+         "created_on": "2025-01-01"}
+        for i in range(entries)
+    ])
+    data = benchmark(_load_json_file, path, [])
+    assert len(data) == entries
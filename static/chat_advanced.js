@@ -612,6 +612,7 @@ class ChatBot {
                                                 `;
                                                 document.body.appendChild(modal);
                                                 const cleanup = () => { modal.remove(); };
+                                                const idempotencyKey = crypto.randomUUID();
                                                 document.getElementById('_fb_cancel').addEventListener('click', cleanup);
                                                 document.getElementById('_fb_submit').addEventListener('click', async () => {
                                                     const content = document.getElementById('_fb_content').value.trim();
@@ -619,7 +620,7 @@ class ChatBot {
                                                     try {
                                                         const resp = await fetch('http://127.0.0.1:8000/api/merchant/feedback-ideas', {
                                                             method: 'POST',
-                                                            headers: { 'Content-Type': 'application/json', 'X-Merchant-Id': DEMO_MERCHANT_ID },
+                                                            headers: { 'Content-Type': 'application/json', 'X-Merchant-Id': DEMO_MERCHANT_ID, 'Idempotency-Key': idempotencyKey },
                                                             body: JSON.stringify({ content })
                                                         });
                                                         const j = await resp.json().catch(() => ({}));
@@ -836,6 +837,8 @@ class ChatBot {
                 this.autoScroll();
 
                 const cleanup = () => { modal.remove(); };
+                // one key per form: a double-tapped or retried submit is answered once
+                const idempotencyKey = crypto.randomUUID();
 
                 document.getElementById('_leave_cancel').addEventListener('click', () => cleanup());
 
@@ -846,14 +849,15 @@ class ChatBot {
                         leave_type: document.getElementById('_leave_type').value || 'Annual Leave',
                         start_date: document.getElementById('_from_date').value || new Date().toISOString().slice(0,10),
                         end_date: document.getElementById('_to_date').value || new Date().toISOString().slice(0,10),
-                        days: parseInt(document.getElementById('_days').value || '1', 10),
+                        // the server counts the days from the dates; an entered count must agree with them
+                        days: document.getElementById('_days').value ? parseInt(document.getElementById('_days').value, 10) : undefined,
                         reason: document.getElementById('_reason').value || 'Not specified'
                     };
 
                     try {
                         const resp = await fetch('http://127.0.0.1:8000/api/leave/apply', {
                             method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
+                            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey },
                             body: JSON.stringify(payload)
                         });
 
@@ -1535,6 +1539,7 @@ class ChatBot {
             `;
             document.body.appendChild(modal);
             const cleanup = () => modal.remove();
+            const idempotencyKey = crypto.randomUUID();
             document.getElementById('_ticket_cancel').addEventListener('click', cleanup);
             document.getElementById('_ticket_submit').addEventListener('click', async () => {
                 const subject = document.getElementById('_ticket_subject').value || 'Support Request';
@@ -1542,7 +1547,7 @@ class ChatBot {
                 try {
                     const resp = await fetch('http://127.0.0.1:8000/api/merchant/help/general', {
                         method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
+                        headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey },
                         body: JSON.stringify({ subject, description: desc })
                     });
                     const j = await resp.json().catch(() => ({}));
@@ -1844,34 +1849,78 @@ class ChatBot {
                 menuContainer.parentNode.insertBefore(notifCard, menuContainer.nextSibling);
             }
 
-            // Try to populate notifications
-            (async () => {
+            // Latest notifications payload; pushed events patch it and re-render without a refetch
+            let notifState = {};
+            const renderNotifications = () => {
+                const payload = notifState;
+                notifCard.innerHTML = '';
+                const header = document.createElement('h4'); header.textContent = 'Notifications'; header.style = 'margin:0 0 8px 0;font-size:1rem;'; notifCard.appendChild(header);
+                const list = document.createElement('div'); list.style = 'color:#333;';
+                if (payload.pending_leave_requests && payload.pending_leave_requests.length) {
+                    list.innerHTML += `<div>⚠️ Pending leave requests: ${payload.pending_leave_requests.length}</div>`;
+                }
+                if (payload.pending_shift_changes && payload.pending_shift_changes.length) {
+                    list.innerHTML += `<div>🔁 Pending shift changes: ${payload.pending_shift_changes.length}</div>`;
+                }
+                if (payload.payment_settlement) {
+                    list.innerHTML += `<div>💳 Last settlement: ${payload.payment_settlement.last_settlement} — ₹${(payload.payment_settlement.amount||0).toLocaleString()}</div>`;
+                }
+                if (payload.head_office_messages && payload.head_office_messages.length) {
+                    list.innerHTML += `<div>🏢 Head Office Messages: ${payload.head_office_messages.length}</div>`;
+                }
+                if (list.innerHTML === '') list.innerHTML = '<div style="color:#666;">No notifications</div>';
+                notifCard.appendChild(list);
+            };
+
+            // Full fetch: on first render, and to resync after the stream drops
+            const loadNotifications = async () => {
                 try {
-                    const resp = await fetch('http://127.0.0.1:8000/api/merchant/notifications');
+                    const resp = await fetch(`http://127.0.0.1:8000/api/merchant/notifications?merchant_id=${encodeURIComponent(DEMO_MERCHANT_ID)}`);
                     if (!resp.ok) throw new Error('Failed to fetch notifications');
                     const j = await resp.json();
-                    const payload = j.data || {};
-                    notifCard.innerHTML = '';
-                    const header = document.createElement('h4'); header.textContent = 'Notifications'; header.style = 'margin:0 0 8px 0;font-size:1rem;'; notifCard.appendChild(header);
-                    const list = document.createElement('div'); list.style = 'color:#333;';
-                    if (payload.pending_leave_requests && payload.pending_leave_requests.length) {
-                        list.innerHTML += `<div>⚠️ Pending leave requests: ${payload.pending_leave_requests.length}</div>`;
-                    }
-                    if (payload.pending_shift_changes && payload.pending_shift_changes.length) {
-                        list.innerHTML += `<div>🔁 Pending shift changes: ${payload.pending_shift_changes.length}</div>`;
-                    }
-                    if (payload.payment_settlement) {
-                        list.innerHTML += `<div>💳 Last settlement: ${payload.payment_settlement.last_settlement} — ₹${(payload.payment_settlement.amount||0).toLocaleString()}</div>`;
-                    }
-                    if (payload.head_office_messages && payload.head_office_messages.length) {
-                        list.innerHTML += `<div>🏢 Head Office Messages: ${payload.head_office_messages.length}</div>`;
-                    }
-                    if (list.innerHTML === '') list.innerHTML = '<div style="color:#666;">No notifications</div>';
-                    notifCard.appendChild(list);
+                    notifState = j.data || {};
+                    renderNotifications();
                 } catch (e) {
                     try { notifCard.innerHTML = '<div style="color:#666;">Unable to load notifications</div>'; } catch(_){}
                 }
-            })();
+            };
+            loadNotifications();
+
+            // A pushed request joins its pending list while Pending and leaves it once decided
+            const applyPendingDelta = (key, item) => {
+                const items = (notifState[key] || []).filter(x => String(x.request_id) !== String(item.request_id));
+                if ((item.status || 'Pending') === 'Pending') items.push(item);
+                notifState[key] = items;
+            };
+
+            // Apply the deltas the server pushes instead of polling
+            if (window.EventSource) {
+                if (this.notificationStream) this.notificationStream.close();
+                const stream = new EventSource(`http://127.0.0.1:8000/api/merchant/notifications/stream?merchant_id=${encodeURIComponent(DEMO_MERCHANT_ID)}`);
+                this.notificationStream = stream;
+                ['pending_leave_requests', 'pending_shift_changes', 'payment_settlement'].forEach(type => {
+                    stream.addEventListener(type, (event) => {
+                        let data;
+                        try { data = JSON.parse(event.data); } catch (_) { return; }
+                        if (!data || typeof data !== 'object') return;
+                        if (type === 'payment_settlement') {
+                            notifState.payment_settlement = { ...(notifState.payment_settlement || {}), ...data };
+                        } else {
+                            applyPendingDelta(type, data);
+                        }
+                        renderNotifications();
+                    });
+                });
+                // Events sent while disconnected are lost: resync on reconnect, or once if the stream gives up
+                let opened = false;
+                stream.addEventListener('open', () => {
+                    if (opened) loadNotifications();
+                    opened = true;
+                });
+                stream.addEventListener('error', () => {
+                    if (stream.readyState === EventSource.CLOSED) loadNotifications();
+                });
+            }
 
             let staffList = document.querySelector('.staff-list');
             if (!staffList) {
@@ -1943,9 +1992,165 @@ class ChatBot {
     }
 }
 
+// Offline queue for retention executor actions. Each action gets a client-generated id and
+// is kept in localStorage until /api/retention/sync acknowledges it, so a flaky connection
+// neither loses nor duplicates a visit, note or health update. Usage:
+//   window.retentionSyncQueue.enqueue('add_notes_commitments', { merchant_id, content })
+// Network errors, 5xx and 429 are retried with backoff. Any other 4xx means the server will
+// never take the batch as sent, so it is split in half until the refused action is found;
+// that action is set aside under `${storageKey}.rejected` instead of blocking the queue.
+class RetentionSyncQueue {
+    constructor(endpoint = 'http://127.0.0.1:8000/api/retention/sync', storageKey = 'retentionSyncQueue') {
+        this.endpoint = endpoint;
+        this.storageKey = storageKey;
+        this.batchSize = 100;
+        this.retryDelay = 5000;
+        this.flushing = null;
+        window.addEventListener('online', () => this.flush());
+    }
+
+    load() {
+        try { return JSON.parse(localStorage.getItem(this.storageKey)) || []; } catch (e) { return []; }
+    }
+
+    save(actions) {
+        localStorage.setItem(this.storageKey, JSON.stringify(actions));
+    }
+
+    get size() {
+        return this.load().length;
+    }
+
+    enqueue(type, payload) {
+        const clientId = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        const actions = this.load();
+        actions.push({ client_id: clientId, type, payload: payload || {} });
+        this.save(actions);
+        this.flush();
+        return clientId;
+    }
+
+    // Only one flush runs at a time; callers share the in-flight promise
+    flush() {
+        if (!this.flushing) {
+            this.flushing = this.drain().finally(() => { this.flushing = null; });
+        }
+        return this.flushing;
+    }
+
+    async drain() {
+        let size = this.batchSize;
+        let batch;
+        while ((batch = this.load().slice(0, size)).length) {
+            let resp, body;
+            try {
+                resp = await fetch(this.endpoint, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ actions: batch })
+                });
+                if (resp.ok) body = await resp.json();
+            } catch (e) {
+                // offline: keep everything queued; the client ids make the retry safe
+                this.scheduleRetry();
+                return;
+            }
+            if (resp.status >= 500 || resp.status === 429) {
+                this.scheduleRetry(parseInt(resp.headers.get('Retry-After'), 10));
+                return;
+            }
+            if (!resp.ok) {
+                if (batch.length > 1) {
+                    size = Math.ceil(batch.length / 2);
+                    continue;
+                }
+                const error = await resp.json().catch(() => ({}));
+                this.quarantine(batch[0], typeof error.message === 'string' ? error.message : `HTTP ${resp.status}`);
+                size = this.batchSize;
+                continue;
+            }
+            this.retryDelay = 5000;
+            size = this.batchSize;
+            // applied, duplicate and rejected actions all leave the queue
+            const acknowledged = new Set((body.results || []).map(r => r.client_id));
+            this.save(this.load().filter(a => !acknowledged.has(a.client_id)));
+            const rejected = (body.results || []).filter(r => r.status === 'error');
+            if (rejected.length) showToast(`⚠️ ${rejected.length} queued action(s) rejected: ${rejected[0].message}`, 4000);
+            if (!acknowledged.size) return;
+        }
+    }
+
+    // Move an action the server refuses out of the queue, keeping it for inspection
+    quarantine(action, reason) {
+        const key = `${this.storageKey}.rejected`;
+        let rejected;
+        try { rejected = JSON.parse(localStorage.getItem(key)) || []; } catch (e) { rejected = []; }
+        rejected.push({ ...action, reason });
+        localStorage.setItem(key, JSON.stringify(rejected));
+        this.save(this.load().filter(a => a.client_id !== action.client_id));
+        showToast(`⚠️ Queued ${action.type.replace(/_/g, ' ')} was rejected and set aside: ${reason}`, 4000);
+    }
+
+    scheduleRetry(retryAfterSeconds) {
+        clearTimeout(this.retryTimer);
+        const delay = retryAfterSeconds > 0 ? Math.max(this.retryDelay, retryAfterSeconds * 1000) : this.retryDelay;
+        this.retryTimer = setTimeout(() => this.flush(), delay);
+        this.retryDelay = Math.min(this.retryDelay * 2, 5 * 60 * 1000);
+    }
+}
+
+// Retention write actions recorded through the sync queue rather than a direct POST:
+// menu endpoint -> sync action type, form title and [field, label, default] inputs
+const RETENTION_QUEUED_ACTIONS = {
+    '/api/retention/mark-activity-complete': { type: 'mark_activity_complete', title: 'Mark Activity Complete',
+        fields: [['activity_type', 'Activity', 'Visit']] },
+    '/api/retention/update-merchant-health': { type: 'update_merchant_health', title: 'Update Merchant Health',
+        fields: [['health_status', 'Health status', 'Healthy']] },
+    '/api/retention/log-merchant-needs': { type: 'log_merchant_needs', title: 'Log Merchant Needs',
+        fields: [['need_type', 'Need', 'POS issue'], ['description', 'Description', '']] },
+    '/api/retention/add-notes-commitments': { type: 'add_notes_commitments', title: 'Add Notes or Commitments',
+        fields: [['content', 'Note', '']] }
+};
+
+function showRetentionActionForm(action) {
+    const inputs = [['merchant_id', 'Merchant ID', DEMO_MERCHANT_ID], ...action.fields];
+    const modal = document.createElement('div');
+    modal.className = 'retention-action-modal';
+    modal.style = 'position:fixed;left:0;right:0;top:0;bottom:0;display:flex;align-items:center;justify-content:center;background:rgba(0,0,0,0.35);z-index:9999;';
+    modal.innerHTML = `
+        <div style="background:#fff;padding:18px;border-radius:8px;min-width:320px;box-shadow:0 6px 24px rgba(0,0,0,0.2);">
+            <h3 style="margin-top:0;">${action.title}</h3>
+            ${inputs.map(([field, label, value]) => `
+                <label style="display:block;margin:8px 0 4px;font-size:0.9rem;">${label}</label>
+                <input data-field="${field}" style="width:100%;padding:8px;border:1px solid #ddd;border-radius:4px;" value="${value}" />`).join('')}
+            <div style="display:flex;gap:8px;justify-content:flex-end;margin-top:12px;">
+                <button class="_retention_cancel" style="padding:8px 12px;border-radius:6px;border:1px solid #ccc;background:#fff;">Cancel</button>
+                <button class="_retention_submit" style="padding:8px 12px;border-radius:6px;border:none;background:#28a745;color:#fff;">Save</button>
+            </div>
+        </div>
+    `;
+    document.body.appendChild(modal);
+    modal.querySelector('._retention_cancel').addEventListener('click', () => modal.remove());
+    modal.querySelector('._retention_submit').addEventListener('click', () => {
+        const payload = {};
+        modal.querySelectorAll('input[data-field]').forEach(input => {
+            if (input.value.trim()) payload[input.dataset.field] = input.value.trim();
+        });
+        if (!payload.merchant_id) { alert('Please enter a merchant ID'); return; }
+        window.retentionSyncQueue.enqueue(action.type, payload);
+        modal.remove();
+        window.hrChatBot.addBotMessage(navigator.onLine
+            ? `✅ ${action.title} saved.`
+            : `✅ ${action.title} saved offline; it will sync when you are back online.`, 800);
+    });
+}
+
 // Initialize the chatbot when page loads
 document.addEventListener('DOMContentLoaded', () => {
     window.hrChatBot = new ChatBot();
+    window.retentionSyncQueue = new RetentionSyncQueue();
+    // send anything left over from a previous offline session
+    window.retentionSyncQueue.flush();
 });
 
 // Global helper to handle menu clicks from rendered buttons
@@ -2073,6 +2278,12 @@ window.handleMenuClick = async function(endpoint, label) {
             return;
         }
 
+        // Retention write actions are queued so they survive a dropped connection
+        if (RETENTION_QUEUED_ACTIONS[endpoint]) {
+            showRetentionActionForm(RETENTION_QUEUED_ACTIONS[endpoint]);
+            return;
+        }
+
         // Default: simple GET
         const data = await window.hrChatBot.fetchData(endpoint, 'GET');
         window.hrChatBot.addBotMessage(`<div style="background:#fff;padding:12px;border-radius:8px;border-left:4px solid #007bff;">✅ ${label} data retrieved successfully.</div>`, 800);
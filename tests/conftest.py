@@ -0,0 +1,60 @@
+"""Fixtures shared by the endpoint tests: a throwaway database behind get_db.
+
+Modules that need a file-backed database (worker threads or processes with
+their own connections) override `engine`; modules that need more setup
+around the client override `client` and request it by the same name.
+"""
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import cache, models
+from app.database import Base, get_db
+from app.main import app
+
+
+@pytest.fixture
+def engine():
+    """In-memory database with every table; one connection shared by all threads."""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False},
+                           poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def client(session_factory):
+    """TestClient whose requests get sessions from session_factory (and an empty cache)."""
+    def override_get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    # cached responses belong to another test's database
+    cache.use_backend(cache.MemoryBackend())
+    app.dependency_overrides[get_db] = override_get_db
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_db, None)
+
+
+@pytest.fixture
+def employees(session_factory):
+    """Active employees E1 and E2."""
+    with session_factory() as db:
+        for employee_id in ("E1", "E2"):
+            db.add(models.Employee(employee_id=employee_id, employee_name=f"Name {employee_id}",
+                                   email=f"{employee_id}@example.com", department="Ops", position="Clerk",
+                                   employment_type="Full-time", employment_status="Active",
+                                   hire_date=date(2024, 1, 1)))
+        db.commit()
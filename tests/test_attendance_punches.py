@@ -0,0 +1,161 @@
+import threading
+import time
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app import cache, models, punch_buffer
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    # flushed explicitly by the tests
+    buffer = punch_buffer.PunchBuffer(capacity=100, flush_batch=10_000, flush_interval=3600)
+    monkeypatch.setattr(punch_buffer, "punch_buffer", buffer)
+    return buffer
+
+
+@pytest.fixture
+def client(client, buffer):
+    return client
+
+
+def punch(employee_id, timestamp, **extra):
+    return {"employee_id": employee_id, "timestamp": timestamp, **extra}
+
+
+def records(session_factory):
+    db = session_factory()
+    rows = {(r.employee_id, r.date.isoformat()): r for r in db.query(models.AttendanceRecord)}
+    db.close()
+    return rows
+
+
+def test_punches_are_merged_per_employee_and_day(client, session_factory, buffer, monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(cache, "invalidate", lambda *tags: invalidated.append(tags))
+    db = session_factory()
+    db.add(models.Employee(employee_id="E1", employee_name="Asha Rao", email="asha@example.com", department="Ops",
+                           position="Cashier", employment_type="Full-time", employment_status="Active",
+                           hire_date=date(2024, 1, 1)))
+    db.commit()
+    db.close()
+
+    resp = client.post("/api/attendance/punches", json={"terminal_id": "STORE-7", "events": [
+        punch("E1", "2026-03-02T09:05:00"),
+        punch("E2", "2026-03-02T10:12:00", employee_name="Ravi"),
+        punch("E3", "2026-03-02T09:00:00", employee_name="Meena"),
+        punch("E3", "2026-03-02T12:00:00"),
+    ]})
+    assert resp.status_code == 202, resp.text
+    assert resp.json()["accepted"] == 4
+    buffer.flush()
+
+    rows = records(session_factory)
+    assert rows[("E1", "2026-03-02")].employee_name == "Asha Rao"
+    assert rows[("E1", "2026-03-02")].status == "Present"
+    assert rows[("E1", "2026-03-02")].check_out_time is None
+    assert rows[("E1", "2026-03-02")].location == "STORE-7"
+    assert rows[("E2", "2026-03-02")].status == "Late"
+    assert rows[("E3", "2026-03-02")].status == "Half Day"
+    assert rows[("E3", "2026-03-02")].working_hours == "3h 0m"
+    assert invalidated == [("employee:E1", "employee:E2", "employee:E3")]
+
+    # a later flush merges with the stored row instead of duplicating it
+    client.post("/api/attendance/punches", json={"events": [
+        punch("E1", "2026-03-02T18:35:00", type="out"),
+        punch("E1", "2026-03-02T08:58:00", type="in"),
+    ]})
+    buffer.flush()
+    rows = records(session_factory)
+    assert len(rows) == 3
+    e1 = rows[("E1", "2026-03-02")]
+    assert (e1.check_in_time.isoformat(), e1.check_out_time.isoformat()) == ("08:58:00", "18:35:00")
+    assert e1.working_hours == "9h 37m"
+    assert e1.status == "Present"
+
+
+def test_full_buffer_applies_backpressure(client, buffer):
+    events = [punch(f"E{i}", "2026-03-02T09:00:00") for i in range(60)]
+    assert client.post("/api/attendance/punches", json={"events": events}).status_code == 202
+    resp = client.post("/api/attendance/punches", json={"events": events})
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"]
+    assert len(buffer) == 60
+
+    buffer.flush()
+    assert client.post("/api/attendance/punches", json={"events": events}).status_code == 202
+
+
+def test_unsupported_database_is_refused_up_front(buffer):
+    bind = SimpleNamespace(dialect=SimpleNamespace(name="mssql"))
+    with pytest.raises(NotImplementedError):
+        buffer.offer(bind, [punch("E1", datetime(2026, 3, 2, 9))])
+    assert len(buffer) == 0
+
+
+def test_background_flush_writes_in_batches(session_factory):
+    buffer = punch_buffer.PunchBuffer(capacity=10_000, flush_batch=500, flush_interval=0.05)
+    bind = session_factory.kw["bind"]
+    events = [{"employee_id": f"E{i % 250}", "timestamp": datetime(2026, 3, 2, 9 + i // 250, 0)}
+              for i in range(2000)]
+    threads = [threading.Thread(target=buffer.offer, args=(bind, events[i::4])) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for _ in range(100):
+        if not len(buffer) and buffer.flushes >= 4:
+            break
+        time.sleep(0.05)
+    rows = records(session_factory)
+    assert len(rows) == 250
+    assert buffer.flushes <= 8
+    assert {r.check_out_time.isoformat() for r in rows.values()} == {"16:00:00"}
+
+
+class StaleRead:
+    """A connection whose first read misses the stored rows, as when another worker inserted them meanwhile."""
+
+    def __init__(self, conn):
+        self.conn, self.dialect, self.reads = conn, conn.dialect, 0
+
+    def execute(self, statement, *args):
+        self.reads += 1
+        return [] if self.reads == 1 else self.conn.execute(statement, *args)
+
+
+def test_flushes_that_missed_each_other_merge(session_factory):
+    bind = session_factory.kw["bind"]
+    with bind.begin() as conn:
+        punch_buffer.upsert_punches(conn, [punch("E1", datetime(2026, 3, 2, 9, 0), type="in", employee_name="Asha"),
+                                           punch("E1", datetime(2026, 3, 2, 18, 0), type="out")])
+    with bind.begin() as conn:
+        punch_buffer.upsert_punches(StaleRead(conn), [
+            punch("E1", datetime(2026, 3, 2, 8, 45), type="in", employee_name="Asha")])
+
+    e1 = records(session_factory)[("E1", "2026-03-02")]
+    assert (e1.check_in_time.isoformat(), e1.check_out_time.isoformat()) == ("08:45:00", "18:00:00")
+    assert (e1.working_hours, e1.status) == ("9h 15m", "Present")
+
+
+def test_failed_flush_keeps_the_punches(client, session_factory, buffer, monkeypatch):
+    real_upsert = punch_buffer.upsert_punches
+
+    def db_down(conn, events):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(punch_buffer, "upsert_punches", db_down)
+    events = [punch(f"E{i}", "2026-03-02T09:00:00") for i in range(60)]
+    assert client.post("/api/attendance/punches", json={"events": events}).status_code == 202
+    buffer.flush()
+    assert len(buffer) == 60
+    assert records(session_factory) == {}
+    # still full: the terminals are told to come back later
+    assert client.post("/api/attendance/punches", json={"events": events}).status_code == 503
+
+    monkeypatch.setattr(punch_buffer, "upsert_punches", real_upsert)
+    buffer.flush()
+    assert len(buffer) == 0
+    assert len(records(session_factory)) == 60
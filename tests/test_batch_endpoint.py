@@ -0,0 +1,49 @@
+import pytest
+
+from app import models
+
+RETENTION_DASHBOARD = [
+    "/api/retention/assigned-merchants",
+    "/api/retention/followup-reminders",
+    "/api/retention/pending-actions",
+    "/api/retention/my-notifications",
+]
+
+
+@pytest.fixture
+def client(client, session_factory):
+    db = session_factory()
+    menu = models.ChatbotMenu(menu_key="retention", menu_title="Retention",
+                              company_type="icp_hr", role="retention_executor")
+    db.add(menu)
+    db.flush()
+    for i, endpoint in enumerate(RETENTION_DASHBOARD + ["/api/merchant/sales/today"]):
+        db.add(models.ChatbotSubmenu(menu_id=menu.id, submenu_key=f"sm_{i}", submenu_title=endpoint,
+                                     api_endpoint=endpoint, company_type="icp_hr", role="retention_executor"))
+    db.commit()
+    db.close()
+    return client
+
+
+def test_batch_returns_results_in_request_order(client):
+    paths = RETENTION_DASHBOARD + \
+        ["/api/merchant/sales/today?merchant_id=MERCH042"]
+    resp = client.post("/api/batch", json={"paths": paths})
+    assert resp.status_code == 200, resp.text
+    data = resp.json()["data"]
+    assert [item["path"] for item in data] == paths
+    assert all(item["status_code"] == 200 for item in data)
+    assert data[-1]["body"]["data"]["merchant_id"] == "MERCH042"
+
+
+def test_batch_rejects_paths_not_in_submenus(client):
+    resp = client.post(
+        "/api/batch", json={"paths": ["/api/retention/pending-actions", "/api/database/info"]})
+    assert resp.status_code == 400
+    assert resp.json()["rejected"] == ["/api/database/info"]
+
+
+def test_batch_rejects_absolute_urls(client):
+    resp = client.post(
+        "/api/batch", json={"paths": ["http://example.com/api/retention/pending-actions"]})
+    assert resp.status_code == 400
@@ -0,0 +1,199 @@
+import socketserver
+import threading
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app import cache, models
+
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    """Just enough of the Redis protocol for the cache backend."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RESPHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def run(self, command, args):
+        now = time.monotonic()
+        live = {k: v for k, (v, expires) in self.data.items() if expires is None or expires > now}
+        if command == "MGET":
+            return [live.get(k) for k in args]
+        if command == "SET":
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            if b"NX" in options and key in live:
+                return None
+            ttl = int(options[options.index(b"PX") + 1]) / 1000 if b"PX" in options else None
+            self.data[key] = (value, now + ttl if ttl else None)
+            return "OK"
+        if command == "DEL":
+            return sum(self.data.pop(k, None) is not None for k in args)
+        if command == "INCR":
+            value = int(live.get(args[0], b"0")) + 1
+            self.data[args[0]] = (str(value).encode(), None)
+            return value
+        return Exception(f"ERR unknown command '{command}'")
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            with self.server.lock:
+                reply = self.server.run(args[0].decode().upper(), args[1:])
+            self.wfile.write(encode(reply))
+
+
+def encode(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return b"-%s\r\n" % str(reply).encode()
+    if isinstance(reply, str):
+        return b"+%s\r\n" % reply.encode()
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(encode(r) for r in reply)
+    return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+
+@pytest.fixture
+def redis_url():
+    server = FakeRedis()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "redis://127.0.0.1:%d/0" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_memory_backend_evicts_least_recently_used_and_expired():
+    backend = cache.MemoryBackend(max_entries=2)
+    backend.set("a", b"1", 60)
+    backend.set("b", b"2", 60)
+    backend.get_many(["a"])
+    backend.set("c", b"3", 60)
+    assert backend.get_many(["a", "b", "c"]) == [b"1", None, b"3"]
+    backend.set("a", b"1", 0.01)
+    time.sleep(0.02)
+    assert backend.get_many(["a"]) == [None]
+    assert backend.add("a", b"x", 60) and not backend.add("a", b"y", 60)
+
+
+def test_key_uses_declared_params_sorted():
+    key = cache.normalized_key("/api/menu/merchant", [("role", "x"), ("_", "123"), ("company_type", ""),
+                                                      ("a", "1")], ["role", "a", "company_type"])
+    assert key == "/api/menu/merchant?a=1&role=x"
+
+
+def test_balance_is_cached_until_leave_is_applied(client, session_factory, employees):
+    balance = lambda: client.get("/api/leave/balance?employee_id=E1").json()["data"]["balances"]
+    assert next(b for b in balance() if b["leave_type"] == "Sick")["balance"] == 12
+
+    with session_factory() as db:
+        db.add(models.LeaveBalance(employee_id="E1", leave_type="Sick", balance=5, reserved=0))
+        db.commit()
+    assert next(b for b in balance() if b["leave_type"] == "Sick")["balance"] == 12  # served from cache
+
+    resp = client.post("/api/leave/apply", json={
+        "employee_id": "E1", "employee_name": "Asha", "leave_type": "Sick",
+        "start_date": "2026-03-02", "end_date": "2026-03-03", "reason": "Flu"})
+    assert resp.json()["status"] == "success", resp.text
+    sick = next(b for b in balance() if b["leave_type"] == "Sick")
+    assert (sick["balance"], sick["reserved"]) == (5, 2)
+
+
+def test_concurrent_misses_compute_once(redis_url):
+    # two caches on one server stand in for two workers
+    workers = [cache.Cache(cache.RedisBackend(redis_url)) for _ in range(2)]
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"status": "success", "data": [1, 2]}
+
+    results = []
+    threads = [threading.Thread(target=lambda w=w: results.append(w.get_or_compute("/menus", compute, 60, ["menus"])))
+               for w in workers * 4]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == [{"status": "success", "data": [1, 2]}] * 8
+
+    workers[1].invalidate("menus")
+    assert workers[0].get_or_compute("/menus", compute, 60, ["menus"]) == results[0]
+    assert len(calls) == 2
+
+
+def test_errors_are_not_cached_and_dead_backend_is_bypassed():
+    c = cache.Cache(cache.MemoryBackend())
+    assert c.get_or_compute("/x", lambda: {"status": "error"}) == {"status": "error"}
+    assert c.get_or_compute("/x", lambda: {"status": "success"}) == {"status": "success"}
+
+    dead = cache.Cache(cache.RedisBackend("redis://127.0.0.1:1", timeout=0.1))
+    assert dead.get_or_compute("/x", lambda: {"status": "success"}) == {"status": "success"}
+
+
+def test_single_flight_shares_errors_and_survives_leader_failure():
+    flights = cache.SingleFlight()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"status": "error", "message": "Failed to fetch"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do("k", compute))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and results == [{"status": "error", "message": "Failed to fetch"}] * 5
+
+    def boom():
+        time.sleep(0.1)
+        raise RuntimeError("db down")
+
+    follower = []
+    leader = threading.Thread(target=lambda: pytest.raises(RuntimeError, flights.do, "k", boom))
+    leader.start()
+    time.sleep(0.02)
+    follower.append(flights.do("k", lambda: "recomputed"))
+    leader.join()
+    assert follower == ["recomputed"]
+
+
+def test_menu_wave_runs_one_query_without_cache(client, engine, monkeypatch):
+    monkeypatch.setattr(cache, "ENABLED", False)
+    queries = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def slow_menus(conn, cursor, statement, parameters, context, executemany):
+        if "FROM chatbot_menus" in statement:
+            queries.append(statement)
+            time.sleep(0.2)
+
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(client.get("/api/menu/pos_youhr?role=employee")))
+               for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [r.status_code for r in responses] == [200] * 6
+    assert len({r.text for r in responses}) == 1
+    assert len(queries) == 1
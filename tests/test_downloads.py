@@ -0,0 +1,93 @@
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import exports, main
+from app.main import app
+
+
+@pytest.fixture
+def downloads(tmp_path, monkeypatch):
+    monkeypatch.setattr(exports, "DOWNLOAD_DIR", tmp_path)
+    monkeypatch.setattr(main, "DOWNLOAD_DIR", tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def client(downloads):
+    return TestClient(app)
+
+
+CONTENT = bytes(range(256)) * 1024
+
+
+def test_full_download_has_validators_and_media_type(client, downloads):
+    (downloads / "attendance_1.xlsx").write_bytes(CONTENT)
+    resp = client.get("/api/downloads/attendance_1.xlsx")
+    assert resp.status_code == 200
+    assert resp.content == CONTENT
+    assert resp.headers["content-type"] == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    assert resp.headers["accept-ranges"] == "bytes"
+    assert 'filename="attendance_1.xlsx"' in resp.headers["content-disposition"]
+
+    etag, last_modified = resp.headers["etag"], resp.headers["last-modified"]
+    assert client.get("/api/downloads/attendance_1.xlsx",
+                      headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/downloads/attendance_1.xlsx",
+                      headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get("/api/downloads/attendance_1.xlsx",
+                      headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_range_requests_resume_a_download(client, downloads):
+    (downloads / "payslips_1.pdf").write_bytes(CONTENT)
+    resp = client.get("/api/downloads/payslips_1.pdf",
+                      headers={"Range": "bytes=1000-70999"})
+    assert resp.status_code == 206
+    assert resp.content == CONTENT[1000:71000]
+    assert resp.headers["content-range"] == f"bytes 1000-70999/{len(CONTENT)}"
+    assert resp.headers["content-type"] == "application/pdf"
+
+    tail = client.get("/api/downloads/payslips_1.pdf", headers={"Range": "bytes=-10"})
+    assert tail.status_code == 206 and tail.content == CONTENT[-10:]
+    rest = client.get("/api/downloads/payslips_1.pdf", headers={"Range": "bytes=262000-"})
+    assert rest.content == CONTENT[262000:]
+
+    unsatisfiable = client.get("/api/downloads/payslips_1.pdf",
+                               headers={"Range": f"bytes={len(CONTENT)}-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+    # a stale If-Range validator gets the whole (changed) file
+    stale = client.get("/api/downloads/payslips_1.pdf",
+                       headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert stale.status_code == 200 and len(stale.content) == len(CONTENT)
+    # multiple ranges are not supported; the full file is sent
+    assert client.get("/api/downloads/payslips_1.pdf",
+                      headers={"Range": "bytes=0-1,5-6"}).status_code == 200
+
+
+def test_ranges_of_an_empty_file_are_unsatisfiable(client, downloads):
+    (downloads / "empty_1.csv").write_bytes(b"")
+    for spec in ("bytes=-10", "bytes=0-"):
+        resp = client.get("/api/downloads/empty_1.csv", headers={"Range": spec})
+        assert resp.status_code == 416
+        assert resp.headers["content-range"] == "bytes */0"
+    resp = client.get("/api/downloads/empty_1.csv")
+    assert resp.status_code == 200 and resp.content == b""
+
+
+def test_prune_downloads_bounds_size_and_age(downloads, monkeypatch):
+    monkeypatch.setattr(exports, "DOWNLOADS_MAX_BYTES", 3000)
+    now = time.time()
+    for i, name in enumerate(["a.pdf", "b.pdf", "c.pdf", "d.pdf"]):
+        (downloads / name).write_bytes(b"x" * 1000)
+        os.utime(downloads / name, (now - 100 + i, now - 100 + i))
+    (downloads / "old.xlsx").write_bytes(b"x")
+    os.utime(downloads / "old.xlsx", (now - 30 * 86400, now - 30 * 86400))
+    (downloads / ".inprogress.tmp").write_bytes(b"")
+
+    assert exports.prune_downloads(now=now) == ["old.xlsx", "a.pdf"]
+    assert sorted(p.name for p in downloads.iterdir()) == [".inprogress.tmp", "b.pdf", "c.pdf", "d.pdf"]
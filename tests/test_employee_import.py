@@ -0,0 +1,77 @@
+import json
+
+
+from app import cache, employee_import, models
+
+
+HEADER = "employee_id,employee_name,email,department,position,employment_type,hire_date,office_location\n"
+
+
+def csv_row(i, **overrides):
+    row = {"employee_id": f"E{i:06d}", "employee_name": f"Employee {i}", "email": f"e{i}@example.com",
+           "department": "Sales", "position": "Associate", "employment_type": "Full-time",
+           "hire_date": "2024-04-01", "office_location": "Pune"}
+    row.update(overrides)
+    return ",".join(row.values()) + "\n"
+
+
+def test_csv_import_loads_valid_rows_and_reports_the_rest(client, session_factory, monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(cache, "invalidate", lambda *tags: invalidated.append(tags))
+    body = HEADER + csv_row(1) + csv_row(2, email="not-an-email") + csv_row(3, hire_date="01/04/2024") \
+        + csv_row(1) + csv_row(4, employment_type="Intern") + csv_row(5, office_location='"Mumbai, West"')
+    resp = client.post("/api/employees/bulk", content=body,
+                       headers={"Content-Type": "text/csv"})
+    assert resp.status_code == 200, resp.text
+    result = resp.json()
+    assert (result["received"], result["inserted"], result["failed"]) == (6, 2, 4)
+    assert [e["line"] for e in result["errors"]] == [3, 4, 5, 6]
+    assert result["errors"][2] == {"line": 5, "employee_id": "E000001",
+                                   "errors": ["Duplicate employee_id in upload"]}
+
+    db = session_factory()
+    rows = {e.employee_id: e for e in db.query(models.Employee)}
+    assert set(rows) == {"E000001", "E000005"}
+    assert rows["E000005"].office_location == "Mumbai, West"
+    assert rows["E000001"].employment_status == "Active"
+    db.close()
+    assert invalidated == [("employee:E000001", "employee:E000005")]
+
+    again = client.post("/api/employees/bulk", content=HEADER + csv_row(1),
+                        headers={"Content-Type": "text/csv"}).json()
+    assert again["inserted"] == 0
+    assert again["errors"][0]["errors"] == ["employee_id already exists"]
+
+
+def test_ndjson_import(client):
+    lines = [json.dumps({"employee_id": "N1", "employee_name": "Asha", "email": "asha@example.com",
+                         "department": "Ops", "position": "Lead", "employment_type": "Contract",
+                         "hire_date": "2023-01-09", "salary_grade": "G3"}),
+             "{not json", json.dumps({"employee_id": "N2", "nickname": "x"})]
+    resp = client.post("/api/employees/bulk?format=ndjson", content="\n".join(lines))
+    result = resp.json()
+    assert (result["inserted"], result["failed"]) == (1, 2)
+    assert result["errors"][0]["errors"][0].startswith("Invalid JSON")
+    assert "Unknown fields: ['nickname']" in result["errors"][1]["errors"]
+
+
+def test_bad_header_and_oversized_bodies_are_rejected(client, monkeypatch):
+    resp = client.post("/api/employees/bulk", content="employee_id,name\nE1,x\n",
+                       headers={"Content-Type": "text/csv"})
+    assert resp.status_code == 400
+
+    monkeypatch.setattr(employee_import, "MAX_IMPORT_BYTES", 100)
+    resp = client.post("/api/employees/bulk", content=HEADER + csv_row(1) * 3,
+                       headers={"Content-Type": "text/csv"})
+    assert resp.status_code == 413
+
+
+def test_large_import_is_batched(client, session_factory, monkeypatch):
+    monkeypatch.setattr(employee_import, "BATCH_ROWS", 1000)
+    body = HEADER + "".join(csv_row(i) for i in range(20_000))
+    result = client.post("/api/employees/bulk", content=body,
+                         headers={"Content-Type": "text/csv"}).json()
+    assert result["inserted"] == 20_000
+    db = session_factory()
+    assert db.query(models.Employee).count() == 20_000
+    db.close()
@@ -0,0 +1,135 @@
+import re
+import time
+from datetime import date, timedelta
+
+import pytest
+from openpyxl import load_workbook
+from sqlalchemy import create_engine
+
+from app import exports, main, models
+from app.database import Base
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # file-backed so the export worker gets its own connection
+    engine = create_engine(f"sqlite:///{tmp_path / 'exports.db'}",
+                           connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def downloads(tmp_path, monkeypatch):
+    directory = tmp_path / "downloads"
+    directory.mkdir()
+    monkeypatch.setattr(exports, "DOWNLOAD_DIR", directory)
+    monkeypatch.setattr(main, "DOWNLOAD_DIR", directory)
+    return directory
+
+
+@pytest.fixture
+def client(client, downloads):
+    return client
+
+
+def wait_for(client, status_url):
+    for _ in range(200):
+        job = client.get(status_url).json()["data"]
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"export did not finish: {job}")
+
+
+def seed_attendance(session_factory, count):
+    db = session_factory()
+    start = date(2026, 1, 1)
+    db.add_all([models.AttendanceRecord(employee_id=f"EMP{i % 7:03d}", employee_name=f"Employee {i % 7}",
+                                        date=start + timedelta(days=i // 7), working_hours="8h 0m", status="Present")
+                for i in range(count)])
+    db.commit()
+    db.close()
+
+
+def test_attendance_xlsx_export_lands_in_downloads(client, session_factory, downloads, tmp_path):
+    seed_attendance(session_factory, 250)
+    resp = client.post("/api/exports", json={"report_type": "attendance", "format": "xlsx",
+                                             "filters": {"employee_id": "EMP003"}})
+    assert resp.status_code == 202, resp.text
+    job = wait_for(client, resp.json()["data"]["status_url"])
+    assert job["status"] == "done", job
+    assert job["row_count"] == 36
+
+    downloaded = client.get(job["download_url"])
+    assert downloaded.status_code == 200
+    path = tmp_path / "downloaded.xlsx"
+    path.write_bytes(downloaded.content)
+    rows = list(load_workbook(path, read_only=True).active.values)
+    header = rows.index(tuple(exports.REPORTS["attendance"].columns))
+    assert len(rows) - header - 1 == 36
+    assert {r[0] for r in rows[header + 1:]} == {"EMP003"}
+    assert sorted(p.name for p in downloads.iterdir()) == [job["download_url"].rsplit("/", 1)[1]]
+
+
+def test_pdf_export_spans_pages(client, session_factory):
+    seed_attendance(session_factory, 400)
+    resp = client.post("/api/exports", json={"report_type": "attendance", "format": "pdf"})
+    job = wait_for(client, resp.json()["data"]["status_url"])
+    assert job["status"] == "done", job
+    content = client.get(job["download_url"]).content
+    assert content.startswith(b"%PDF")
+    assert job["row_count"] == 400
+    assert int(re.search(rb"/Pages.*?/Count (\d+)", content, re.S).group(1)) > 1
+
+
+def test_invalid_export_requests(client):
+    assert client.post("/api/exports", json={"report_type": "nope"}).status_code == 400
+    assert client.post("/api/exports", json={"report_type": "sales", "format": "csv"}).status_code == 400
+    assert client.post("/api/exports", json={"report_type": "sales",
+                       "filters": {"region": "x"}}).status_code == 400
+    assert client.post("/api/exports", json={"report_type": "sales",
+                       "filters": {"date_from": "yesterday"}}).status_code == 400
+    assert client.get("/api/exports/999").status_code == 404
+
+
+def test_summary_report_download_link_is_generated(client):
+    client.post("/api/retention/mark-activity-complete",
+                json={"merchant_id": "MERCH1", "executor_id": "EXEC1"})
+    resp = client.post("/api/retention/submit-summary-report",
+                       json={"executor_id": "EXEC1", "total_activities": 3, "completed_activities": 1})
+    assert resp.status_code == 200, resp.text
+    details = resp.json()["data"]["file_details"]
+    job = wait_for(client, details["status_url"])
+    assert job["status"] == "done", job
+    # the visit plus the report submission itself
+    assert job["row_count"] == 2
+    assert details["download_link"] == f"/api/downloads/{resp.json()['data']['report_id']}.pdf"
+    assert job["download_url"] == details["download_link"]
+    assert client.get(details["download_link"]).content.startswith(b"%PDF")
+
+
+def test_unchanged_export_reuses_the_file(client, session_factory, downloads):
+    seed_attendance(session_factory, 50)
+    request = {"report_type": "attendance", "format": "xlsx", "filters": {"date_from": "2026-01-01"}}
+    first = wait_for(client, client.post("/api/exports", json=request).json()["data"]["status_url"])
+    assert first["status"] == "done"
+
+    again = client.post("/api/exports", json=request)
+    assert again.status_code == 200
+    assert again.json()["data"]["job_id"] == first["job_id"]
+    assert again.json()["data"]["download_url"] == first["download_url"]
+
+    # an update to a covered row invalidates the cached file
+    db = session_factory()
+    db.query(models.AttendanceRecord).filter_by(id=1).one().status = "Late"
+    db.commit()
+    db.close()
+    changed = client.post("/api/exports", json=request)
+    assert changed.status_code == 202
+    rebuilt = wait_for(client, changed.json()["data"]["status_url"])
+    assert rebuilt["job_id"] != first["job_id"] and rebuilt["status"] == "done"
+
+    # a file removed from downloads/ is rebuilt rather than served as a 404
+    (downloads / rebuilt["download_url"].rsplit("/", 1)[1]).unlink()
+    assert client.post("/api/exports", json=request).json()["data"]["job_id"] != rebuilt["job_id"]
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import idempotency, leave_ledger, models
+
+pytestmark = pytest.mark.usefixtures("employees")
+
+
+LEAVE = {"employee_id": "E1", "employee_name": "Asha", "leave_type": "Unpaid",
+         "start_date": "2026-03-02", "end_date": "2026-03-03", "reason": "Family"}
+
+
+def test_retry_replays_first_response_without_a_second_write(client, session_factory):
+    first = client.post("/api/leave/apply", json=LEAVE, headers={"Idempotency-Key": "tap-1"})
+    assert first.status_code == 200, first.text
+    retry = client.post("/api/leave/apply", json=LEAVE, headers={"Idempotency-Key": "tap-1"})
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+
+    db = session_factory()
+    assert db.query(models.LeaveApplication).count() == 1
+    db.close()
+
+    # same key, different body
+    changed = client.post("/api/leave/apply", json={**LEAVE, "reason": "Travel"},
+                          headers={"Idempotency-Key": "tap-1"})
+    assert changed.status_code == 422
+    # keys are per endpoint, and requests without one are not deduplicated
+    ticket = client.post("/api/merchant/help/report-pos?merchant_id=M1", json={"issue": "frozen"},
+                         headers={"Idempotency-Key": "tap-1"})
+    assert ticket.status_code == 200
+    again = client.post("/api/merchant/help/report-pos?merchant_id=M1", json={"issue": "frozen"},
+                        headers={"Idempotency-Key": "tap-1"})
+    assert again.json()["data"]["ticket_id"] == ticket.json()["data"]["ticket_id"]
+    assert client.post("/api/leave/apply", json={**LEAVE, "start_date": "2026-04-01",
+                                                 "end_date": "2026-04-01"}).status_code == 200
+
+
+def test_failed_requests_release_the_key(client, session_factory):
+    bad = {**LEAVE, "start_date": "2026-03-05"}  # ends before it starts
+    assert client.post("/api/leave/apply", json=bad, headers={"Idempotency-Key": "k2"}).status_code == 400
+    db = session_factory()
+    assert db.query(models.IdempotencyKey).count() == 0
+    db.close()
+    assert client.post("/api/leave/apply", json=LEAVE, headers={"Idempotency-Key": "k2"}).status_code == 200
+    assert client.post("/api/leave/apply", json=LEAVE, headers={"Idempotency-Key": "x" * 300}).status_code == 400
+
+
+def test_error_bodies_are_not_replayed(client, session_factory, monkeypatch):
+    def db_down(*args, **kwargs):
+        raise ConnectionError("database unavailable")
+
+    with monkeypatch.context() as m:
+        m.setattr(leave_ledger, "apply", db_down)
+        failed = client.post("/api/leave/apply", json=LEAVE, headers={"Idempotency-Key": "k3"})
+    assert (failed.status_code, failed.json()["status"]) == (200, "error")
+    retry = client.post("/api/leave/apply", json=LEAVE, headers={"Idempotency-Key": "k3"})
+    assert retry.json()["status"] == "success"
+    assert "idempotent-replayed" not in retry.headers
+
+
+def test_in_progress_and_expired_keys(client, session_factory):
+    db = session_factory()
+    now = datetime.utcnow()
+    fp = idempotency.fingerprint("POST", "/api/leave/apply", b"", b"{}")
+    db.add(models.IdempotencyKey(key="busy", method="POST", path="/api/leave/apply", fingerprint=fp,
+                                 status="in_progress", created_at=now, expires_at=now + timedelta(hours=1)))
+    db.add(models.IdempotencyKey(key="old", method="POST", path="/api/leave/apply", fingerprint=fp,
+                                 status="completed", response_status=200, response_body=b"{}",
+                                 created_at=now - timedelta(days=2), expires_at=now - timedelta(days=1)))
+    db.commit()
+    db.close()
+
+    busy = client.post("/api/leave/apply", json=LEAVE, headers={"Idempotency-Key": "busy"})
+    assert busy.status_code == 409
+    assert busy.headers["retry-after"] == "1"
+    # expired: runs again
+    resp = client.post("/api/leave/apply", json=LEAVE, headers={"Idempotency-Key": "old"})
+    assert resp.status_code == 200 and "application_id" in resp.json()
+
+    db = session_factory()
+    assert idempotency.purge_expired(db, now + timedelta(days=2)) == 2
+    db.close()
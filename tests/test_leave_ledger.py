@@ -0,0 +1,86 @@
+
+import pytest
+
+from app import models
+
+pytestmark = pytest.mark.usefixtures("employees")
+
+
+def apply(client, start, end, leave_type="Annual", employee_id="E1", **extra):
+    return client.post("/api/leave/apply", json={
+        "employee_id": employee_id, "employee_name": "Asha", "leave_type": leave_type,
+        "start_date": start, "end_date": end, "reason": "Family", **extra})
+
+
+def balance(client, leave_type="Annual", employee_id="E1"):
+    balances = client.get(f"/api/leave/balance?employee_id={employee_id}").json()["data"]["balances"]
+    return next(b for b in balances if b["leave_type"] == leave_type)
+
+
+def test_apply_reserves_balance_and_rejects_overlaps(client):
+    assert balance(client) == {"leave_type": "Annual", "entitlement": 18, "balance": 18,
+                               "reserved": 0, "available": 18}
+    resp = apply(client, "2026-03-02", "2026-03-06")
+    assert resp.status_code == 200 and resp.json()["status"] == "success", resp.text
+    assert balance(client)["reserved"] == 5
+    assert balance(client)["available"] == 13
+
+    overlap = apply(client, "2026-03-06", "2026-03-09", leave_type="Sick")
+    assert overlap.status_code == 409
+    assert str(resp.json()["application_id"]) in overlap.json()["message"]
+    assert apply(client, "2026-03-07", "2026-03-09", leave_type="Sick").status_code == 200
+    # another employee's dates do not overlap
+    assert apply(client, "2026-03-02", "2026-03-06", employee_id="E2").status_code == 200
+
+    assert apply(client, "2026-04-01", "2026-04-30").status_code == 409  # 30 > 13 available
+    assert apply(client, "2026-04-09", "2026-04-01").status_code == 400
+    # untracked types are not balance-checked
+    assert apply(client, "2026-05-01", "2026-05-30", leave_type="Unpaid").status_code == 200
+
+
+def test_approve_debits_ledger_once(client, session_factory):
+    request_id = apply(client, "2026-03-02", "2026-03-04").json()["application_id"]
+    stale = client.post(f"/api/merchant/staff/leave-requests/{request_id}/approve?merchant_id=M1&version=7")
+    assert stale.status_code == 409
+
+    resp = client.post(f"/api/merchant/staff/leave-requests/{request_id}/approve?merchant_id=M1&version=1")
+    assert resp.status_code == 200, resp.text
+    data = resp.json()["data"]
+    assert (data["status"], data["approved_by"], data["version"]) == ("Approved", "M1", 2)
+    assert balance(client) == {"leave_type": "Annual", "entitlement": 18, "balance": 15,
+                               "reserved": 0, "available": 15}
+
+    assert client.post(f"/api/merchant/staff/leave-requests/{request_id}/approve?merchant_id=M1").status_code == 409
+    assert client.post(f"/api/merchant/staff/leave-requests/{request_id}/reject?merchant_id=M1").status_code == 409
+    assert client.post("/api/merchant/staff/leave-requests/999/approve?merchant_id=M1").status_code == 404
+
+    db = session_factory()
+    ledger = [(e.entry_type, e.days, e.balance_after)
+              for e in db.query(models.LeaveLedgerEntry).order_by(models.LeaveLedgerEntry.id)]
+    assert ledger == [("grant", 18, 18), ("debit", -3, 15)]
+    head = db.query(models.LeaveBalance).one()
+    assert head.last_entry_id == db.query(models.LeaveLedgerEntry).order_by(
+        models.LeaveLedgerEntry.id.desc()).first().id
+    db.close()
+
+
+def test_reject_releases_reservation_and_dates(client):
+    request_id = apply(client, "2026-03-02", "2026-03-04").json()["application_id"]
+    resp = client.post(f"/api/merchant/staff/leave-requests/{request_id}/reject?merchant_id=M1&comments=Busy")
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["data"]["status"] == "Rejected"
+    assert balance(client) == {"leave_type": "Annual", "entitlement": 18, "balance": 18,
+                               "reserved": 0, "available": 18}
+    assert apply(client, "2026-03-02", "2026-03-04").status_code == 200
+
+
+def test_days_come_from_the_dates_and_employee_must_exist(client):
+    assert apply(client, "2026-03-02", "2026-03-06", days=1).status_code == 400
+    assert balance(client)["reserved"] == 0
+    resp = apply(client, "2026-03-02", "2026-03-06", days=5)
+    assert resp.status_code == 200, resp.text
+    assert balance(client)["reserved"] == 5
+
+    unknown = apply(client, "2026-03-02", "2026-03-06", employee_id="E404")
+    assert unknown.status_code == 404
+    assert client.post("/api/merchant/staff/leave-requests/²/approve?merchant_id=M1").status_code == 404
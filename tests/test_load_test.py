@@ -0,0 +1,38 @@
+import sqlite3
+
+from app.main import app
+from tools.load_test import percentile, prepare_sqlite_db, request_method, route_methods
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert [percentile(values, p) for p in range(1, 101)] == values
+    assert percentile([15, 20, 35, 40, 50], 30) == 20
+    assert percentile([15, 20, 35, 40, 50], 0) == 15
+    assert percentile([], 95) is None
+
+
+def test_post_only_routes_without_an_example_are_skipped():
+    routes = route_methods(app.openapi())
+    assert request_method('/api/retention/mark-activity-complete', routes) == 'POST'
+    assert request_method('/api/leave/apply', routes) is None
+    assert request_method('/api/merchant/staff/leave-requests/7/approve', routes) is None
+    assert request_method('/api/retention/attach-photo-proof', routes) == 'GET'
+    assert request_method('/api/merchant/staff/leave-requests?merchant_id=M1', routes) == 'GET'
+    # without an OpenAPI document everything but the examples is fetched
+    assert request_method('/api/leave/apply', []) == 'GET'
+
+
+def test_seeding_starts_from_an_empty_database(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite://')
+    db_path = tmp_path / 'loadtest.db'
+    prepare_sqlite_db(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO stored_blobs (sha256, size_bytes, content_type, ref_count) "
+                     "VALUES ('x', 1, 'text/plain', 1)")
+    prepare_sqlite_db(db_path)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM stored_blobs').fetchone() == (0,)
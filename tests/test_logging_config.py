@@ -0,0 +1,49 @@
+import json
+import logging
+
+from fastapi.testclient import TestClient
+
+from app import logging_config
+from app.main import app
+
+
+def _record(level=logging.INFO, msg="hello %s", args=("world",)):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+
+def test_parse_sample_rates_skips_malformed_entries():
+    rates = logging_config.parse_sample_rates(
+        "GET /api/menu/{company_type}=0.1, bad, GET /api/=x,GET /api/health=3")
+    assert rates == {"GET /api/menu/{company_type}": 0.1,
+                     "GET /api/health": 1.0}
+
+
+def test_json_formatter_includes_request_context():
+    tokens = logging_config.bind_request(
+        {"method": "GET", "path": "/api/"}, "req-123")
+    try:
+        record = _record()
+        logging_config.RequestContextFilter().filter(record)
+    finally:
+        logging_config.unbind_request(tokens)
+
+    line = json.loads(logging_config.JsonFormatter().format(record))
+    assert line["message"] == "hello world"
+    assert line["request_id"] == "req-123"
+    assert line["route"] == "GET /api/"
+
+
+def test_route_sampling_only_drops_low_severity_records():
+    sampler = logging_config.RouteSamplingFilter({"GET /api/": 0.0})
+    info, warning = _record(), _record(level=logging.WARNING)
+    info.route = warning.route = "GET /api/"
+    assert sampler.filter(info) is False
+    assert sampler.filter(warning) is True
+
+
+def test_request_id_is_echoed_or_generated():
+    client = TestClient(app)
+    resp = client.get("/api/", headers={"X-Request-ID": "abc"})
+    assert resp.headers["X-Request-ID"] == "abc"
+    generated = client.get("/api/").headers["X-Request-ID"]
+    assert generated and generated != "abc"
@@ -0,0 +1,33 @@
+from datetime import date
+
+from fastapi.testclient import TestClient
+
+from app import mock_data
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_dataset_is_deterministic_and_memoized():
+    mock_data.merchant_dataset.cache_clear()
+    first = mock_data.merchant_dataset("MERCH001", date(2025, 1, 1))
+    assert mock_data.merchant_dataset("MERCH001", date(2025, 1, 1)) is first
+    assert mock_data.merchant_dataset.cache_info().hits == 1
+
+    mock_data.merchant_dataset.cache_clear()
+    assert mock_data.merchant_dataset("MERCH001", date(2025, 1, 1)) == first
+    assert mock_data.merchant_dataset("MERCH002", date(2025, 1, 1)) != first
+
+
+def test_cache_is_size_capped():
+    assert mock_data.merchant_dataset.cache_info().maxsize == mock_data.MOCK_DATA_CACHE_SIZE
+
+
+def test_merchant_endpoints_are_stable_across_calls():
+    for path in ("/api/merchant/staff/attendance", "/api/merchant/payments/outstanding",
+                 "/api/merchant/expenses/bills", "/api/merchant/marketing/campaign-results"):
+        a = client.get(path, params={"merchant_id": "MERCH777"})
+        b = client.get(path, params={"merchant_id": "MERCH777"})
+        assert a.status_code == 200, a.text
+        assert a.json() == b.json()
+        assert a.json()["data"]["merchant_id"] == "MERCH777"
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import notifications
+from app.main import app
+
+
+@pytest.fixture
+def isolated_sources(monkeypatch):
+    monkeypatch.setattr(notifications, "_sources", notifications.OrderedDict())
+    notifications.clear_cache()
+    yield
+    notifications.clear_cache()
+
+
+def test_sources_are_cached_per_merchant(isolated_sources):
+    calls = []
+
+    @notifications.source("counter", ttl=60)
+    def counter(merchant_id):
+        calls.append(merchant_id)
+        return len(calls)
+
+    assert asyncio.run(notifications.aggregate("M1")) == ({"counter": 1}, [])
+    assert asyncio.run(notifications.aggregate("M1")) == ({"counter": 1}, [])
+    assert asyncio.run(notifications.aggregate("M2")) == ({"counter": 2}, [])
+
+    notifications.invalidate("M1")
+    assert asyncio.run(notifications.aggregate("M1")) == ({"counter": 3}, [])
+
+
+def test_slow_source_does_not_block_others(isolated_sources):
+    @notifications.source("fast", ttl=60)
+    def fast(merchant_id):
+        return "ok"
+
+    @notifications.source("slow", ttl=60, timeout=0.05)
+    def slow(merchant_id):
+        time.sleep(0.3)
+        return "late"
+
+    async def timed_aggregate():
+        start = time.monotonic()
+        result = await notifications.aggregate("M1")
+        return result, time.monotonic() - start
+
+    (data, unavailable), elapsed = asyncio.run(timed_aggregate())
+    assert elapsed < 0.25
+    assert data == {"fast": "ok"}
+    assert unavailable == ["slow"]
+
+    # asyncio.run waited for the worker thread: its late result is now cached
+    data, unavailable = asyncio.run(notifications.aggregate("M1"))
+    assert data == {"fast": "ok", "slow": "late"}
+    assert unavailable == []
+
+
+def test_failing_source_serves_stale_value(isolated_sources):
+    state = {"fail": False}
+
+    @notifications.source("flaky", ttl=0)
+    def flaky(merchant_id):
+        if state["fail"]:
+            raise RuntimeError("down")
+        return "v1"
+
+    assert asyncio.run(notifications.aggregate("M1"))[0] == {"flaky": "v1"}
+    state["fail"] = True
+    assert asyncio.run(notifications.aggregate("M1")) == ({"flaky": "v1"}, [])
+
+
+def test_aggregate_endpoint_includes_registered_sources():
+    resp = TestClient(app).get("/api/merchant/notifications",
+                               params={"merchant_id": "MERCH_TEST"})
+    assert resp.status_code == 200
+    data = resp.json()["data"]
+    for key in ("pending_leave_requests", "pending_shift_changes", "payment_settlement", "head_office_messages"):
+        assert key in data
@@ -0,0 +1,83 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app import event_broker, main, notifications
+from app.main import app
+
+
+class FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def test_subscriber_queue_is_bounded():
+    async def scenario():
+        broker = event_broker.Broker()
+        sub = broker.subscribe("M1", maxsize=2)
+        for i in range(5):
+            broker.publish("M1", "pending_leave_requests", {"n": i})
+        broker.publish("M2", "pending_leave_requests", {"n": 99})
+        await asyncio.sleep(0)
+        received = [(await sub.get(0.1))["data"]["n"] for _ in range(2)]
+        return received, sub.dropped, await sub.get(0.01)
+
+    received, dropped, leftover = asyncio.run(scenario())
+    assert received == [3, 4]
+    assert dropped == 3
+    assert leftover is None
+
+
+def test_stream_yields_events_and_heartbeats(monkeypatch):
+    monkeypatch.setattr(event_broker, "SSE_HEARTBEAT_SECONDS", 0.01)
+
+    async def scenario():
+        request = FakeRequest()
+        stream = main._notification_events(request, "MSTREAM")
+        frames = [await stream.__anext__()]
+        assert event_broker.broker.subscriber_count("MSTREAM") == 1
+        frames.append(await stream.__anext__())
+        event_broker.broker.publish(
+            "MSTREAM", "payment_settlement", {"amount": 10})
+        frames.append(await stream.__anext__())
+        request.disconnected = True
+        async for _ in stream:
+            pass
+        return frames
+
+    frames = asyncio.run(scenario())
+    assert frames[0].startswith("retry:")
+    assert frames[1] == event_broker.HEARTBEAT_FRAME
+    assert "event: payment_settlement\n" in frames[2]
+    assert 'data: {"amount": 10}' in frames[2]
+    assert event_broker.broker.subscriber_count("MSTREAM") == 0
+
+
+def test_shift_change_is_published_from_threadpool_handler():
+    client = TestClient(app)
+
+    async def scenario():
+        sub = event_broker.broker.subscribe("MSHIFT")
+        try:
+            resp = await asyncio.to_thread(
+                client.post, "/api/merchant/notifications/approve-shift",
+                params={"merchant_id": "MSHIFT"}, json={"request_id": "SR9"})
+            assert resp.status_code == 200
+            return await sub.get(1)
+        finally:
+            event_broker.broker.unsubscribe(sub)
+
+    notifications._cache_set(notifications._sources["pending_shift_changes"], "MSHIFT", [])
+    event = asyncio.run(scenario())
+    assert event["event"] == "pending_shift_changes"
+    assert event["data"]["request_id"] == "SR9"
+    # the aggregated panel re-fetches the source instead of serving the stale entry
+    assert notifications._cache_get("pending_shift_changes", "MSHIFT") == (None, False)
+
+
+def test_stream_requires_merchant_id():
+    resp = TestClient(app).get("/api/merchant/notifications/stream")
+    assert resp.status_code == 400
@@ -0,0 +1,239 @@
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+
+from app import models, payroll
+from app.database import Base
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # a file, so partitioned runs' worker processes see the same database
+    engine = create_engine(f"sqlite:///{tmp_path / 'payroll.db'}",
+                           connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+MARCH = [date(2026, 3, d) for d in range(1, 32)]
+WORKING_DAYS = [d for d in MARCH if d.weekday() != 6]
+
+
+def employee(employee_id, grade, hired=date(2025, 1, 1), status="Active", department="Ops"):
+    return models.Employee(employee_id=employee_id, employee_name=f"Name {employee_id}", email=f"{employee_id}@example.com",
+                           department=department, position="Associate", employment_type="Full-time",
+                           employment_status=status, hire_date=hired, salary_grade=grade)
+
+
+def attendance(employee_id, day, status="Present"):
+    return models.AttendanceRecord(employee_id=employee_id, employee_name=employee_id, date=day, status=status)
+
+
+@pytest.fixture
+def march(session_factory):
+    db = session_factory()
+    db.add_all([employee("E1", "G2"), employee("E2", "G5", department="Sales"),
+                employee("E3", "X9", hired=date(2026, 3, 16)), employee("E4", "G3", status="Inactive")])
+    leave_days = WORKING_DAYS[10:13]
+    absent = WORKING_DAYS[20:22]
+    for day in WORKING_DAYS:
+        db.add(attendance("E1", day))
+        db.add(attendance("E4", day))
+        if day >= date(2026, 3, 16):
+            db.add(attendance("E3", day))
+        if day not in leave_days and day not in absent:
+            db.add(attendance("E2", day, "Half Day" if day == WORKING_DAYS[0] else "Present"))
+    db.add(models.LeaveApplication(employee_id="E2", employee_name="Name E2", leave_type="Annual",
+                                   from_date=leave_days[0], to_date=leave_days[-1], total_days=3,
+                                   reason="Family", status="Approved"))
+    db.commit()
+    db.close()
+
+
+def payslips(session_factory):
+    db = session_factory()
+    rows = {p.employee_id: (p.gross_amount, p.deductions, p.amount) for p in db.query(models.Payslip)}
+    db.close()
+    return rows
+
+
+def test_payroll_run_prices_attendance_leave_and_grades(client, session_factory, march):
+    resp = client.post("/api/payroll/runs", json={"month": "2026-03"})
+    assert resp.status_code == 200, resp.text
+    data = resp.json()["data"]
+    assert data["employee_count"] == 3
+    assert data["unknown_grades"] == 1
+
+    slips = payslips(session_factory)
+    # full month on G2: 30000 gross, PF 1800 + PT 200
+    assert slips["E1"] == (30000, 2000, 28000)
+    # G5 with 2.5 loss-of-pay days (two absences, one half day); approved leave is paid
+    gross = round(90000 * 28.5 / 31)
+    deductions = round(gross * 0.06) + 200 + round((gross - 50000) * 0.1)
+    assert slips["E2"] == (gross, deductions, gross - deductions)
+    # hired mid-month with an unknown grade: G1, pro rata from the hire date
+    assert slips["E3"] == (round(20000 * 16 / 31), round(round(20000 * 16 / 31) * 0.06),
+                           round(20000 * 16 / 31) - round(round(20000 * 16 / 31) * 0.06))
+    assert "E4" not in slips
+    assert data["total_net"] == sum(s[2] for s in slips.values())
+
+    db = session_factory()
+    assert {p.month for p in db.query(models.Payslip)} == {"March 2026"}
+    db.close()
+
+
+def test_dry_run_diffs_without_writing(client, session_factory, march):
+    first = client.post("/api/payroll/runs", json={"month": "2026-03"}).json()["data"]
+    before = payslips(session_factory)
+
+    db = session_factory()
+    db.query(models.AttendanceRecord).filter_by(employee_id="E1", date=WORKING_DAYS[5]).delete()
+    db.commit()
+    db.close()
+
+    dry = client.post("/api/payroll/runs", json={"month": "2026-03", "dry_run": True}).json()["data"]
+    assert dry["status"] == "dry_run"
+    assert payslips(session_factory) == before
+    diff = dry["diff"]
+    assert diff["baseline_run_id"] == first["run_id"]
+    assert (diff["added"], diff["removed"], diff["changed"]) == (0, 0, 1)
+    assert diff["changes"][0]["employee_id"] == "E1"
+    assert diff["changes"][0]["delta"] == diff["total_net_delta"] < 0
+
+
+def test_rerun_supersedes_unpaid_payslips_only(client, session_factory, march):
+    first = client.post("/api/payroll/runs", json={"month": "2026-03"}).json()["data"]
+    second = client.post("/api/payroll/runs", json={"month": "2026-03"}).json()["data"]
+    db = session_factory()
+    assert db.query(models.Payslip).count() == 3
+    assert {p.payroll_run_id for p in db.query(models.Payslip)} == {second["run_id"]}
+    assert db.get(models.PayrollRun, first["run_id"]).status == "superseded"
+    db.query(models.Payslip).update({"status": "Paid"})
+    db.commit()
+    db.close()
+
+    assert client.post("/api/payroll/runs", json={"month": "2026-03"}).status_code == 409
+    assert client.post("/api/payroll/runs", json={"month": "March"}).status_code == 400
+
+
+def test_run_replaces_payslips_from_before_payroll_runs(client, session_factory, march):
+    db = session_factory()
+    db.add_all([models.Payslip(employee_id="E1", employee_name="Name E1", month="March 2026", amount=1, status="Pending"),
+                models.Payslip(employee_id="E1", employee_name="Name E1", month="February 2026", amount=1,
+                               status="Paid")])
+    db.commit()
+    db.close()
+
+    run_id = client.post("/api/payroll/runs", json={"month": "2026-03"}).json()["data"]["run_id"]
+    db = session_factory()
+    march_slips = db.query(models.Payslip).filter_by(month="March 2026").all()
+    assert sorted(p.employee_id for p in march_slips) == ["E1", "E2", "E3"]
+    assert {p.payroll_run_id for p in march_slips} == {run_id}
+    assert db.query(models.Payslip).filter_by(month="February 2026").count() == 1
+    assert db.get(models.PayrollMonth, "2026-03") is not None
+
+    db.add(models.Payslip(employee_id="E9", employee_name="Name E9", month="March 2026", amount=1, status="Paid"))
+    db.commit()
+    db.close()
+    assert client.post("/api/payroll/runs", json={"month": "2026-03"}).status_code == 409
+
+
+def wait_for_run(client, run_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        data = client.get(f"/api/payroll/runs/{run_id}").json()["data"]
+        if data["status"] != "running":
+            return data
+        time.sleep(0.2)
+    raise AssertionError(f"payroll run {run_id} still running")
+
+
+def test_partitioned_run_matches_single_run(client, session_factory, march):
+    single = client.post("/api/payroll/runs", json={"month": "2026-03"}).json()["data"]
+    expected = payslips(session_factory)
+
+    resp = client.post("/api/payroll/runs", json={"month": "2026-03", "partition_by": "department"})
+    assert resp.status_code == 202, resp.text
+    run_id = resp.json()["data"]["run_id"]
+    data = wait_for_run(client, run_id)
+    assert data["status"] == "completed", data
+    assert data["progress"] == {"partitions": 2, "pending": 0, "running": 0, "completed": 2, "failed": 0}
+    assert sorted(p["key"] for p in data["partitions"]) == ["Ops", "Sales"]
+    assert data["total_net"] == single["total_net"]
+    assert payslips(session_factory) == expected
+
+    db = session_factory()
+    assert {p.payroll_run_id for p in db.query(models.Payslip)} == {run_id}
+    assert db.get(models.PayrollRun, single["run_id"]).status == "superseded"
+    db.close()
+
+
+def test_retry_reruns_failed_partitions_only(client, session_factory, march):
+    run_id = client.post("/api/payroll/runs", json={"month": "2026-03", "partition_by": "department"}
+                         ).json()["data"]["run_id"]
+    assert wait_for_run(client, run_id)["status"] == "completed"
+    expected = payslips(session_factory)
+    assert client.post(f"/api/payroll/runs/{run_id}/retry").status_code == 409
+
+    # as if the Sales partition had failed
+    db = session_factory()
+    db.query(models.PayrollPartition).filter_by(run_id=run_id, key="Sales").update(
+        {"status": "failed", "error": "connection reset"})
+    db.query(models.PayrollRun).filter_by(id=run_id).update({"status": "failed"})
+    db.query(models.Payslip).filter_by(employee_id="E2").delete()
+    db.commit()
+    db.close()
+
+    resp = client.post(f"/api/payroll/runs/{run_id}/retry")
+    assert resp.status_code == 202, resp.text
+    data = wait_for_run(client, run_id)
+    assert data["status"] == "completed", data
+    assert {p["key"]: p["attempts"] for p in data["partitions"]} == {"Ops": 1, "Sales": 2}
+    assert payslips(session_factory) == expected
+
+    assert client.get("/api/payroll/runs/9999").status_code == 404
+    assert client.post("/api/payroll/runs", json={"month": "2026-03", "partition_by": "department",
+                                                  "dry_run": True}).status_code == 400
+
+
+def test_stale_partitions_fail_their_run_so_it_can_be_retried(client, session_factory, march):
+    db = session_factory()
+    long_ago = datetime.utcnow() - payroll.LEASE - timedelta(seconds=1)
+    run = models.PayrollRun(month="2026-03", dry_run=False, status="running", partition_by="department")
+    db.add(run)
+    db.flush()
+    # as if the worker pricing Ops died mid-way and Sales was never picked up
+    db.add_all([models.PayrollPartition(run_id=run.id, key="Ops", status="running", attempts=1,
+                                        started_at=long_ago, heartbeat_at=long_ago),
+                models.PayrollPartition(run_id=run.id, key="Sales", status="pending", attempts=0,
+                                        heartbeat_at=long_ago)])
+    db.commit()
+    run_id = run.id
+    db.close()
+
+    resp = client.post(f"/api/payroll/runs/{run_id}/retry")
+    assert resp.status_code == 202, resp.text
+    data = wait_for_run(client, run_id)
+    assert data["status"] == "completed", data
+    assert {p["key"]: p["attempts"] for p in data["partitions"]} == {"Ops": 2, "Sales": 1}
+    assert set(payslips(session_factory)) == {"E1", "E2", "E3"}
+
+
+def test_live_partitions_are_not_expired(session_factory):
+    db = session_factory()
+    now = datetime.utcnow()
+    run = models.PayrollRun(month="2026-03", dry_run=False, status="running", partition_by="department")
+    db.add(run)
+    db.flush()
+    db.add_all([models.PayrollPartition(run_id=run.id, key="Ops", status="running", attempts=1, heartbeat_at=now),
+                models.PayrollPartition(run_id=run.id, key="Sales", status="pending", attempts=0,
+                                        heartbeat_at=now - payroll.LEASE * 2)])
+    db.commit()
+
+    payroll.expire_stale(db, "2026-03")
+    db.commit()
+    assert db.get(models.PayrollRun, run.id).status == "running"
+    assert {p.key: p.status for p in db.query(models.PayrollPartition)} == {"Ops": "running", "Sales": "pending"}
+    db.close()
@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from app import models, query_monitor
+
+
+@pytest.fixture
+def menu_db(engine, session_factory):
+    query_monitor.install(engine)
+    db = session_factory()
+    for i in range(query_monitor.N_PLUS_ONE_THRESHOLD + 1):
+        db.add(models.ChatbotMenu(menu_key=f"menu_{i}", menu_title=f"Menu {i}",
+                                  company_type="pos_youhr", is_active=True))
+    db.commit()
+    db.close()
+    return engine
+
+
+def test_normalize_sql_collapses_literals_and_binds():
+    a = query_monitor.normalize_sql(
+        "SELECT * FROM menus WHERE id = 5 AND key = 'x'")
+    b = query_monitor.normalize_sql(
+        "SELECT *  FROM menus\nWHERE id = :id AND key = 'other'")
+    assert a == b == "SELECT * FROM menus WHERE id = ? AND key = ?"
+    assert query_monitor.normalize_sql(
+        "SELECT 1 WHERE id IN (1, 2, 3)") == "SELECT ? WHERE id IN (?)"
+
+
+def test_repeated_statement_is_detected_per_request():
+    engine = create_engine("sqlite://")
+    query_monitor.install(engine)
+    token = query_monitor.begin_request(
+        {"method": "GET", "path": "/api/menu/x"})
+    with engine.connect() as conn:
+        for i in range(query_monitor.N_PLUS_ONE_THRESHOLD + 1):
+            conn.execute(text("SELECT :i"), {"i": i})
+    stats = query_monitor.end_request(token)
+    assert stats.route == "GET /api/menu/x"
+    assert stats.total_queries == query_monitor.N_PLUS_ONE_THRESHOLD + 1
+    assert len(stats.detections) == 1
+
+
+def test_strict_mode_fails_n_plus_one_route(menu_db, client, monkeypatch):
+    monkeypatch.setattr(query_monitor, "STRICT", True)
+    with pytest.raises(query_monitor.QueryMonitorError) as exc:
+        client.get("/api/menu/pos_youhr")
+    assert "GET /api/menu/{company_type}" in str(exc.value)
+
+
+def test_failed_statement_does_not_leak_its_start_time():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    query_monitor.install(engine)
+    with engine.connect() as conn:
+        with pytest.raises(Exception):
+            conn.execute(text("SELECT * FROM no_such_table"))
+        conn.execute(text("SELECT 1"))
+        assert conn.info["query_start_time"] == []
@@ -0,0 +1,116 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from sqlalchemy import select
+
+from app import models, rate_limit
+from app.main import app
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(engine, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, "limiter", rate_limit.RateLimiter(
+        store=rate_limit.SQLBucketStore(engine), costs={"GET /api/merchant/staff/attendance": 3}, clock=clock))
+    monkeypatch.setattr(rate_limit, "PER_MINUTE", 3)
+    monkeypatch.setattr(rate_limit, "IP_PER_MINUTE", 5)
+    return clock
+
+
+client = TestClient(app)
+
+
+def staff(merchant_id=None, path="leave-requests"):
+    return client.get(f"/api/merchant/staff/{path}" + (f"?merchant_id={merchant_id}" if merchant_id else ""))
+
+
+def test_merchant_bucket_refuses_then_refills(clock):
+    first = staff("M1")
+    assert first.status_code == 200
+    assert (first.headers["ratelimit-limit"], first.headers["ratelimit-remaining"]) == ("3", "2")
+    assert staff("M1").status_code == 200
+    assert staff("M1").status_code == 200
+    refused = staff("M1")
+    assert refused.status_code == 429
+    assert refused.json()["status"] == "error"
+    assert refused.headers["retry-after"] == "20"  # one token per 20s
+    assert refused.headers["ratelimit-remaining"] == "0"
+    # other merchants have their own bucket (the refused request spent none of the IP bucket)
+    assert staff("M2").status_code == 200
+    assert staff("M2").headers["ratelimit-remaining"] == "0"
+
+    clock.now += 20
+    assert staff("M1").status_code == 200
+    assert staff("M1").status_code == 429
+
+
+def test_ip_bucket_and_route_costs(clock):
+    # a weighted route spends the whole merchant bucket at once
+    assert staff("M1", "attendance").status_code == 200
+    assert staff("M1").status_code == 429
+    # without a merchant or employee id only the IP bucket applies
+    assert staff().headers["ratelimit-limit"] == "5"
+    # made-up merchant ids still draw on the IP bucket (3 + 1 tokens spent so far)
+    assert staff("M7").status_code == 200
+    assert staff("M8").status_code == 429
+    assert client.get("/static/chat.css").status_code == 200
+
+
+def test_batch_sub_requests_are_not_charged_again(clock, client):
+    paths = ["/api/merchant/sales/today", "/api/merchant/sales/weekly"] * 2
+    resp = client.post("/api/batch", json={"paths": paths}, headers={"X-Merchant-Id": "M1"})
+    assert resp.status_code == 200
+    assert [item["status_code"] for item in resp.json()["data"]] == [200] * 4
+    # only the batch itself was charged
+    assert resp.headers["ratelimit-remaining"] == "2"
+    assert staff("M1").headers["ratelimit-remaining"] == "1"
+
+
+def test_unreachable_store_lets_requests_through(clock, monkeypatch):
+    class Down:
+        def take(self, charges, now):
+            raise ConnectionError("store down")
+
+    rate_limit.limiter.store = Down()
+    for _ in range(10):
+        resp = staff("M1")
+        assert resp.status_code == 200
+        assert "ratelimit-limit" not in resp.headers
+
+
+def test_refused_requests_spend_no_bucket(clock, engine):
+    for _ in range(3):
+        assert staff("M1").status_code == 200
+    # refused by the merchant bucket: the IP bucket keeps its 2 tokens
+    for _ in range(5):
+        assert staff("M1").status_code == 429
+    assert staff("M2").status_code == 200
+    assert staff("M3").status_code == 200
+    with engine.connect() as conn:
+        tokens = dict(conn.execute(select(rate_limit.BUCKETS.c.key, rate_limit.BUCKETS.c.tokens)).all())
+    assert tokens["merchant:M1"] == 0
+    assert tokens["merchant:M2"] == tokens["merchant:M3"] == 2
+    assert tokens["ip:testclient"] == 0
+
+
+def test_default_store_uses_the_get_db_database(client, session_factory, monkeypatch):
+    monkeypatch.setattr(rate_limit, "limiter", rate_limit.RateLimiter())
+    assert client.get("/api/merchant/staff/leave-requests?merchant_id=M1").status_code == 200
+    with session_factory() as db:
+        assert db.query(models.RateLimitBucket).filter_by(key="merchant:M1").count() == 1
+
+
+def test_route_cost_prefers_longest_match():
+    costs = {"/api/": 2, "POST /api/exports": 10, "GET /api/downloads/": 3}
+    assert rate_limit.route_cost("POST", "/api/exports", costs) == 10
+    assert rate_limit.route_cost("GET", "/api/exports/4", costs) == 2
+    assert rate_limit.route_cost("GET", "/api/downloads/a.pdf", costs) == 3
+    assert rate_limit.route_cost("GET", "/healthz", costs) == 1
@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+from app import exports, group_commit, models
+
+
+@pytest.fixture
+def client(client, monkeypatch):
+    # summary-report PDFs are covered in test_exports; keep the export worker
+    # off the shared in-memory connection here
+    monkeypatch.setattr(exports, "submit", lambda bind, job_id: None)
+    return client
+
+
+def test_actions_are_persisted_and_listed(client):
+    resp = client.post("/api/retention/mark-activity-complete",
+                       json={"merchant_id": "MERCH1001", "activity_type": "Visit", "notes": "Demo done"})
+    assert resp.status_code == 200, resp.text
+    activity = resp.json()["data"][0]
+    assert activity["activity_id"].startswith("ACT")
+
+    client.post("/api/retention/update-merchant-health",
+                json={"merchant_id": "MERCH1001", "health_status": "At Risk"})
+    health = client.post("/api/retention/update-merchant-health",
+                         json={"merchant_id": "MERCH1001", "health_status": "Healthy"}).json()["data"][0]
+    assert health["previous_status"] == "At Risk"
+
+    listed = client.get("/api/retention/mark-activity-complete",
+                        params={"merchant_id": "MERCH1001"}).json()
+    assert listed["data"] == [activity]
+    assert client.get("/api/retention/mark-activity-complete",
+                      params={"merchant_id": "MERCH9999"}).json()["data"] == []
+
+    report = client.post("/api/retention/submit-summary-report",
+                         json={"report_type": "Daily Report", "total_activities": 4, "completed_activities": 3}).json()
+    assert report["data"]["report_details"]["completion_rate"] == "75.0%"
+    assert client.get("/api/retention/submit-summary-report").json()["data"][0]["report_id"] == report["data"]["report_id"]
+
+
+def test_actions_require_merchant_id(client):
+    resp = client.post("/api/retention/log-merchant-needs", json={"need_type": "POS issue"})
+    assert resp.status_code == 400
+
+
+def test_summary_report_counts_must_be_numbers(client):
+    resp = client.post("/api/retention/submit-summary-report",
+                       json={"total_activities": "5 visits", "completed_activities": None})
+    assert resp.status_code == 400
+    assert resp.json()["message"] == "total_activities, completed_activities must be whole numbers"
+    # int() takes superscripts as digits only to fail on them
+    resp = client.post("/api/retention/submit-summary-report", json={"total_activities": "²"})
+    assert resp.status_code == 400
+    resp = client.post("/api/retention/submit-summary-report",
+                       json={"total_activities": "5", "completed_activities": 2})
+    assert resp.json()["data"]["report_details"]["completion_rate"] == "40.0%"
+
+
+def test_concurrent_submissions_are_group_committed(engine):
+    writer = group_commit.GroupCommitWriter(
+        models.Activity.__table__, max_delay=0.05)
+    ids = []
+
+    def submit(i):
+        ids.append(writer.submit(engine, {
+            "kind": "note", "name": "General", "status": "Added", "assigned_to": "EXEC1",
+            "merchant_id": f"MERCH{i}", "details": "{}"
+        }))
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(50)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(ids) == list(range(1, 51))
+    assert writer.batches < 10
+    with engine.connect() as conn:
+        assert conn.execute(models.Activity.__table__.select()).fetchall()[0].kind == "note"
+
+
+def test_bad_row_only_fails_its_submitter(engine):
+    writer = group_commit.GroupCommitWriter(
+        models.Activity.__table__, max_delay=0.05)
+    results = {}
+
+    def submit(name, row):
+        try:
+            results[name] = writer.submit(engine, row)
+        except Exception as e:
+            results[name] = e
+
+    good = {"kind": "note", "name": "ok", "status": "Added",
+            "assigned_to": "EXEC1", "merchant_id": "M1", "details": "{}"}
+    bad = dict(good, name=None)
+    threads = [threading.Thread(target=submit, args=("good", good)),
+               threading.Thread(target=submit, args=("bad", bad))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert isinstance(results["good"], int)
+    assert isinstance(results["bad"], Exception)
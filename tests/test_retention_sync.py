@@ -0,0 +1,65 @@
+
+from app import models
+
+
+BATCH = {
+    "executor_id": "EXEC7",
+    "actions": [
+        {"client_id": "c1", "type": "mark_activity_complete",
+            "payload": {"merchant_id": "MERCH1", "activity_type": "Visit"}},
+        {"client_id": "c2", "type": "update_merchant_health",
+            "payload": {"merchant_id": "MERCH1", "health_status": "At Risk"}},
+        {"client_id": "c3", "type": "update_merchant_health",
+            "payload": {"merchant_id": "MERCH1", "health_status": "Healthy"}},
+        {"client_id": "c4", "type": "add_notes_commitments",
+            "payload": {"content": "no merchant"}},
+        {"client_id": "c5", "type": "teleport", "payload": {}},
+    ]
+}
+
+
+def test_sync_applies_in_order_with_per_item_results(client, session_factory):
+    resp = client.post("/api/retention/sync", json=BATCH)
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert body["applied"] == 3
+    assert [r["status"] for r in body["results"]] == [
+        "applied", "applied", "applied", "error", "error"]
+    # later actions see earlier ones from the same batch
+    assert body["results"][2]["data"]["previous_status"] == "At Risk"
+
+    db = session_factory()
+    rows = db.query(models.Activity).order_by(models.Activity.id).all()
+    assert [r.client_id for r in rows] == ["c1", "c2", "c3"]
+    assert {r.assigned_to for r in rows} == {"EXEC7"}
+    db.close()
+
+
+def test_replayed_sync_is_not_applied_twice(client, session_factory):
+    first = client.post("/api/retention/sync", json=BATCH).json()
+    again = client.post("/api/retention/sync", json=BATCH).json()
+    assert again["applied"] == 0
+    assert [r["status"] for r in again["results"][:3]] == ["duplicate"] * 3
+    assert again["results"][0]["data"] == first["results"][0]["data"]
+
+    db = session_factory()
+    assert db.query(models.Activity).count() == 3
+    db.close()
+
+
+def test_duplicate_key_within_one_batch(client):
+    action = {"client_id": "same", "type": "log_merchant_needs",
+              "payload": {"merchant_id": "MERCH1"}}
+    body = client.post("/api/retention/sync",
+                       json={"actions": [action, action]}).json()
+    assert [r["status"] for r in body["results"]] == ["applied", "duplicate"]
+
+
+def test_overlong_client_id_is_rejected_up_front(client, session_factory):
+    action = {"client_id": "x" * 65, "type": "log_merchant_needs", "payload": {"merchant_id": "MERCH1"}}
+    assert client.post("/api/retention/sync", json={"actions": [action]}).status_code == 422
+    assert client.post("/api/retention/sync", json={"actions": [{**action, "client_id": ""}]}).status_code == 422
+
+    db = session_factory()
+    assert db.query(models.Activity).count() == 0
+    db.close()
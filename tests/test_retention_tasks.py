@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models, scheduler
+from app.database import Base
+
+# the endpoints read today's (UTC) rows
+NOW = datetime.utcnow().replace(hour=9, minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def activity(db, kind, merchant_id, days_ago, executor="EX1", **details):
+    db.add(models.Activity(name=kind, status="Done", assigned_to=executor, kind=kind, merchant_id=merchant_id,
+                           details=json.dumps({"merchant_id": merchant_id, **details}),
+                           created_at=NOW - timedelta(days=days_ago)))
+
+
+def test_refresh_precomputes_worklists(engine, client):
+    with sessionmaker(bind=engine)() as db:
+        activity(db, "activity_complete", "M1", 9)
+        activity(db, "activity_complete", "M2", 5)
+        activity(db, "health_update", "M3", 1, new_status="At Risk")
+        activity(db, "merchant_need", "M4", 1, need_type="POS issue", priority="High",
+                 estimated_resolution="24 hours")
+        activity(db, "merchant_need", "M5", 2, need_type="Paper rolls")
+        activity(db, "activity_complete", "M5", 0.2)
+        activity(db, "activity_complete", "M6", 0.5, executor="EX2")
+        activity(db, "summary_report", None, 0.1, executor="EX2")
+        db.commit()
+
+    assert client.get("/api/retention/my-notifications?executor_id=EX1").json()["data"] == []
+    assert scheduler.run_due(engine, NOW) == ["retention_tasks"]
+
+    tasks = client.get("/api/retention/my-notifications?executor_id=EX1").json()
+    assert [(t["task_id"], t["priority"]) for t in tasks["data"]] == [("followup:M1", "High"), ("visit:M3", "High")]
+    assert tasks["computed_at"] == NOW.isoformat()
+    reminders = client.get("/api/retention/followup-reminders?executor_id=EX1").json()["data"]
+    assert [(r["reminder_id"], r["when"]) for r in reminders] == [("followup:M2", (NOW + timedelta(days=2)).isoformat())]
+    actions = client.get("/api/retention/pending-actions?executor_id=EX1").json()["data"]
+    assert [(a["title"], a["priority"], a["due"]) for a in actions] == [
+        ("Check POS issue is resolved for M4", "High", NOW.isoformat()),
+        ("Submit daily report", "Medium", NOW.replace(hour=18).isoformat()),
+    ]
+    # EX2 has reported today and visited M6 just now
+    ex2 = client.get("/api/retention/pending-actions?executor_id=EX2").json()
+    assert ex2["data"] == [] and ex2["computed_at"] is not None
+
+    # not due again until the interval has passed
+    assert scheduler.run_due(engine, NOW + timedelta(minutes=1)) == []
+
+
+def test_job_runs_on_one_worker_only(engine, monkeypatch):
+    calls = []
+
+    def slow(bind, now):
+        calls.append(now)
+        time.sleep(0.3)
+
+    monkeypatch.setattr(scheduler, "_jobs", OrderedDict())
+    scheduler.job("slow", every=60)(slow)
+    ran = []
+    workers = [threading.Thread(target=lambda owner=owner: ran.append(scheduler.run_due(engine, NOW, owner=owner)))
+               for owner in ("a", "b", "c")]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert len(calls) == 1 and sorted(ran) == [[], [], ["slow"]]
+
+    with sessionmaker(bind=engine)() as db:
+        row = db.get(models.ScheduledJob, "slow")
+        assert (row.last_status, row.run_count, row.lease_owner) == ("completed", 1, None)
+        # a worker that died mid-run: its lease lapses and someone else takes over
+        row.next_run_at, row.lease_owner, row.lease_expires_at = NOW, "dead", NOW + timedelta(minutes=1)
+        db.commit()
+    assert scheduler.run_due(engine, NOW + timedelta(seconds=30), owner="a") == []
+    assert scheduler.run_due(engine, NOW + timedelta(minutes=2), owner="a") == ["slow"]
+
+
+def test_failures_are_recorded_and_jobs_can_be_triggered(engine, client, monkeypatch):
+    def broken(bind, now):
+        raise RuntimeError("no activities table")
+
+    monkeypatch.setattr(scheduler, "_jobs", OrderedDict())
+    scheduler.job("broken", every=3600)(broken)
+    assert scheduler.run_due(engine, NOW) == ["broken"]
+    job = client.get("/api/scheduler/jobs").json()["data"][0]
+    assert (job["last_status"], job["last_error"]) == ("failed", "no activities table")
+
+    resp = client.post("/api/scheduler/jobs/broken/run")
+    assert resp.status_code == 202 and resp.json()["data"]["next_run_at"] < datetime.utcnow().isoformat()
+    assert client.post("/api/scheduler/jobs/nope/run").status_code == 404
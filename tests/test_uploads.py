@@ -0,0 +1,196 @@
+import hashlib
+import io
+import time
+
+import pytest
+from PIL import Image
+
+from app import models, uploads
+
+
+@pytest.fixture
+def client(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(uploads, "THUMBNAIL_DIR", tmp_path / "thumbnails")
+    return client
+
+
+def png_bytes(size=(800, 600)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def stored_files(directory):
+    """Everything written under UPLOAD_DIR except thumbnails."""
+    return sorted(p.name for p in directory.rglob("*") if p.is_file() and p.parent.name != "thumbnails")
+
+
+def test_photo_is_streamed_hashed_and_thumbnailed(client, tmp_path):
+    content = png_bytes()
+    resp = client.post("/api/retention/attach-photo-proof", data={"merchant_id": "MERCH1001"},
+                       files={"file": ("shop front.PNG", content, "image/png")})
+    assert resp.status_code == 200, resp.text
+    data = resp.json()["data"]
+    assert data["attachment_id"].startswith("ATT")
+    assert data["sha256"] == hashlib.sha256(content).hexdigest()
+    assert data["size_bytes"] == len(content)
+    assert data["file_url"] == f"/api/downloads/{data['sha256']}.png"
+    assert stored_files(tmp_path) == [data["sha256"]]
+
+    served = client.get(data["file_url"])
+    assert served.status_code == 200
+    assert served.content == content
+    assert served.headers["content-type"] == "image/png"
+    assert served.headers["x-content-type-options"] == "nosniff"
+    assert "content-disposition" not in served.headers
+    assert "immutable" in served.headers["cache-control"]
+    assert served.headers["etag"] == f'"{data["sha256"]}"'
+    assert client.get(data["file_url"], headers={
+                      "If-None-Match": served.headers["etag"]}).status_code == 304
+
+    for _ in range(100):
+        thumb = client.get(data["thumbnail_url"])
+        if thumb.status_code == 200:
+            break
+        time.sleep(0.02)
+    assert thumb.status_code == 200
+    assert max(Image.open(io.BytesIO(thumb.content)).size) == uploads.THUMBNAIL_SIZE
+
+
+def test_oversized_upload_is_rejected_from_content_length(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_BYTES", 1024)
+    resp = client.post("/api/retention/attach-photo-proof", data={"merchant_id": "MERCH1001"},
+                       files={"file": ("big.bin", b"x" * (uploads.FORM_OVERHEAD + 4096), "application/octet-stream")})
+    assert resp.status_code == 413
+    assert stored_files(tmp_path) == []
+
+
+def test_oversized_chunked_upload_is_rejected_while_streaming(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_BYTES", 100_000)
+    boundary = "testboundary"
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"merchant_id\"\r\n\r\nMERCH1\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.bin\"\r\n"
+            "Content-Type: application/octet-stream\r\n\r\n").encode()
+
+    def body():
+        yield head
+        for _ in range(50):
+            yield b"y" * 10_000
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    resp = client.post("/api/retention/attach-photo-proof", content=body(),
+                       headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    assert resp.status_code == 413
+    assert stored_files(tmp_path) == []
+
+
+def test_document_upload_requires_merchant_and_keeps_no_orphans(client, tmp_path):
+    resp = client.post("/api/retention/onboarding/upload-missing-documents",
+                       files={"file": ("id.pdf", b"%PDF-1.4 test", "application/pdf")})
+    assert resp.status_code == 400
+    assert stored_files(tmp_path) == []
+
+    resp = client.post("/api/retention/onboarding/upload-missing-documents",
+                       data={"merchant_id": "MERCH1001", "document_type": "ID Proof"},
+                       files={"file": ("id.pdf", b"%PDF-1.4 test", "application/pdf")})
+    assert resp.status_code == 200, resp.text
+    doc = resp.json()["data"][0]
+    assert doc["document_id"].startswith("DOC")
+    assert doc["thumbnail_url"] is None
+    assert stored_files(tmp_path) == [doc["sha256"]]
+
+
+def test_json_attach_still_accepted_without_file(client):
+    resp = client.post("/api/retention/attach-photo-proof",
+                       json={"merchant_id": "MERCH1001", "filename": "later.jpg"})
+    assert resp.status_code == 200
+    assert resp.json()["data"]["file_url"] is None
+
+
+def test_duplicate_uploads_share_one_blob(client, tmp_path, session_factory):
+    content = png_bytes((40, 40))
+    sha256 = hashlib.sha256(content).hexdigest()
+    first = client.post("/api/retention/attach-photo-proof", data={"merchant_id": "MERCH1"},
+                        files={"file": ("a.png", content, "image/png")}).json()["data"]
+    assert first["deduplicated"] is False
+
+    again = client.post("/api/retention/attach-photo-proof", data={"merchant_id": "MERCH2"},
+                        files={"file": ("b.png", content, "image/png")}).json()["data"]
+    assert again["deduplicated"] is True
+    assert again["file_url"] == first["file_url"]
+    assert stored_files(tmp_path) == [sha256]
+
+    db = session_factory()
+    blob = db.query(models.StoredBlob).filter_by(sha256=sha256).one()
+    assert blob.ref_count == 2
+    db.close()
+
+
+def test_known_hash_skips_disk_writes_and_is_verified(client, tmp_path, monkeypatch):
+    content = b"id proof scan"
+    sha256 = hashlib.sha256(content).hexdigest()
+    client.post("/api/retention/onboarding/upload-missing-documents", data={"merchant_id": "MERCH1"},
+                files={"file": ("id.bin", content, "application/octet-stream")})
+
+    def no_writes(*args, **kwargs):
+        raise AssertionError("known content must not be written again")
+
+    monkeypatch.setattr(uploads.os, "replace", no_writes)
+    resp = client.post("/api/retention/onboarding/upload-missing-documents", data={"merchant_id": "MERCH1"},
+                       files={"file": ("id.bin", content, "application/octet-stream")},
+                       headers={uploads.CONTENT_HASH_HEADER: sha256})
+    assert resp.status_code == 200, resp.text
+    assert not (tmp_path / "tmp").exists() or not any((tmp_path / "tmp").iterdir())
+
+    resp = client.post("/api/retention/onboarding/upload-missing-documents", data={"merchant_id": "MERCH1"},
+                       files={"file": ("id.bin", b"something else", "application/octet-stream")},
+                       headers={uploads.CONTENT_HASH_HEADER: sha256})
+    assert resp.status_code == 400
+
+
+def test_failed_store_releases_the_reference(client, tmp_path, monkeypatch, session_factory):
+    content = png_bytes((20, 20))
+
+    def disk_full(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(uploads.os, "replace", disk_full)
+    resp = client.post("/api/retention/attach-photo-proof", data={"merchant_id": "MERCH1"},
+                       files={"file": ("a.png", content, "image/png")})
+    assert resp.status_code == 500
+    assert stored_files(tmp_path) == []
+
+    db = session_factory()
+    blob = db.query(models.StoredBlob).filter_by(sha256=hashlib.sha256(content).hexdigest()).one()
+    assert blob.ref_count == 0
+    db.close()
+
+
+def test_photo_proof_must_be_an_image(client, tmp_path):
+    resp = client.post("/api/retention/attach-photo-proof", data={"merchant_id": "MERCH1"},
+                       files={"file": ("shop.png", b"<script>alert(1)</script>", "image/png")})
+    assert resp.status_code == 400
+    assert stored_files(tmp_path) == []
+
+
+def test_downloads_use_the_sniffed_type_not_the_extension(client):
+    content = b"<html><script>alert(document.cookie)</script></html>"
+    doc = client.post("/api/retention/onboarding/upload-missing-documents",
+                      data={"merchant_id": "MERCH1", "document_type": "ID Proof"},
+                      files={"file": ("id.html", content, "text/html")}).json()["data"][0]
+    assert doc["content_type"] == "application/octet-stream"
+
+    for name in (f"{doc['sha256']}.html", f"{doc['sha256']}.svg", doc["sha256"]):
+        served = client.get(f"/api/downloads/{name}")
+        assert served.status_code == 200
+        assert served.headers["content-type"] == "application/octet-stream"
+        assert served.headers["content-disposition"].startswith("attachment")
+        assert served.headers["x-content-type-options"] == "nosniff"
+
+    pdf = client.post("/api/retention/onboarding/upload-missing-documents",
+                      data={"merchant_id": "MERCH1", "document_type": "ID Proof"},
+                      files={"file": ("id.bin", b"%PDF-1.4 test", "text/html")}).json()["data"][0]
+    served = client.get(f"/api/downloads/{pdf['sha256']}.html")
+    assert served.headers["content-type"] == "application/pdf"
+    assert served.headers["content-disposition"].startswith("attachment")
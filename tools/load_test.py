@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Load test for the chatbot menu endpoints.
+
+Endpoints are discovered from /api/menu/{company_type} the same way
+tools/frontend_click_through.py does, then driven concurrently with asyncio +
+httpx according to a weighted request mix. Per-route p50/p95/p99 latency,
+throughput and error rate are written as JSON so runs can be compared before
+each deploy.
+
+Examples:
+    # start the app on a throwaway SQLite database and run for 30 seconds
+    python tools/load_test.py --start-server --duration 30 --concurrency 50
+
+    # hit an already running server with a custom mix
+    python tools/load_test.py --base-url http://127.0.0.1:8000 --mix tools/load_mix.json
+
+A mix file maps api_endpoint -> weight; discovered endpoints missing from the
+file get --default-weight (0 excludes them). Endpoints in POST_EXAMPLES are
+posted that body; the rest are fetched with GET, except routes the server's
+/openapi.json only lists for POST, which are skipped rather than replayed as
+GETs that can only fail with 405.
+
+--start-server recreates --db-path from scratch on every run, so results do
+not depend on what earlier runs left behind.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+HEADERS = {'X-Merchant-Id': 'MERCH_TEST'}
+
+# menus whose submenus are exercised; same targets as the click-through tools
+DEFAULT_MENUS = [
+    '/api/menu/pos_youhr',
+    '/api/menu/icp_hr',
+    '/api/menu/icp_hr?role=retention_executor',
+    '/api/menu/merchant?role=merchant_manager',
+]
+
+# endpoints that need a POST body (mirrors tools/frontend_click_through.py)
+POST_EXAMPLES = {
+    '/api/merchant/staff/add-employee': {'name': 'Load Test', 'role': 'Cashier'},
+    '/api/merchant/staff/salary': {'employee_id': 'EMP001', 'amount': 1000},
+    '/api/merchant/marketing/create-campaign': {'campaign_name': 'LoadCamp', 'budget': 100},
+    '/api/merchant/notifications/settings': {'email': False, 'sms': True, 'in_app': True},
+    '/api/merchant/feedback-ideas': {'content': 'Load test feedback'},
+    '/api/retention/mark-activity-complete': {'merchant_id': 'MERCH1001', 'activity_type': 'Visit'},
+    '/api/retention/submit-summary-report': {'report_type': 'Daily Report', 'total_activities': 5, 'completed_activities': 4},
+    '/api/retention/add-notes-commitments': {'merchant_id': 'MERCH1001', 'content': 'Load test note'},
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct * len(sorted_values) / 100.0))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples, elapsed):
+    """Build the per-route report from (endpoint, latency_ms, error) samples.
+
+    error is None for a successful request, otherwise the HTTP status code or
+    exception class name.
+    """
+    per_route = {}
+    for endpoint, latency_ms, error in samples:
+        entry = per_route.setdefault(
+            endpoint, {'latencies': [], 'errors': 0, 'error_kinds': {}})
+        entry['latencies'].append(latency_ms)
+        if error is not None:
+            entry['errors'] += 1
+            entry['error_kinds'][str(error)] = entry['error_kinds'].get(
+                str(error), 0) + 1
+
+    routes = {}
+    for endpoint, entry in sorted(per_route.items()):
+        latencies = sorted(entry['latencies'])
+        count = len(latencies)
+        routes[endpoint] = {
+            'requests': count,
+            'errors': entry['errors'],
+            'error_rate': round(entry['errors'] / count, 4),
+            'error_kinds': entry['error_kinds'],
+            'throughput_rps': round(count / elapsed, 2) if elapsed else None,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+                'max': round(latencies[-1], 2),
+            },
+        }
+
+    total = len(samples)
+    errors = sum(r['errors'] for r in routes.values())
+    all_latencies = sorted(s[1] for s in samples)
+    return {
+        'generated_at': datetime.now().isoformat(),
+        'duration_s': round(elapsed, 2),
+        'total_requests': total,
+        'error_rate': round(errors / total, 4) if total else None,
+        'throughput_rps': round(total / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'p50': percentile(all_latencies, 50),
+            'p95': percentile(all_latencies, 95),
+            'p99': percentile(all_latencies, 99),
+        },
+        'routes': routes,
+    }
+
+
+async def discover_endpoints(client, menus):
+    endpoints = []
+    for menu_url in menus:
+        r = await client.get(menu_url)
+        menu_json = r.json()
+        menu_data = menu_json.get('data') if isinstance(
+            menu_json, dict) else menu_json
+        if not isinstance(menu_data, list):
+            print('Unexpected menu data shape for', menu_url, type(menu_data))
+            continue
+        for m in menu_data:
+            if not isinstance(m, dict):
+                continue
+            for s in m.get('submenus', []):
+                if isinstance(s, dict) and s.get('api_endpoint') and s['api_endpoint'] not in endpoints:
+                    endpoints.append(s['api_endpoint'])
+    return endpoints
+
+
+def route_methods(openapi):
+    """(path regex, HTTP methods) for every route in an OpenAPI document."""
+    routes = []
+    for path, operations in openapi.get('paths', {}).items():
+        pattern = '[^/]+'.join(re.escape(part) for part in re.split(r'\{[^}]+\}', path))
+        routes.append((re.compile(pattern + '$'), {m.upper() for m in operations}))
+    return routes
+
+
+def request_method(endpoint, routes):
+    """'POST' or 'GET' for driving endpoint, or None when it only takes a POST we have no body for."""
+    if endpoint in POST_EXAMPLES:
+        return 'POST'
+    path = endpoint.split('?', 1)[0]
+    methods = set()
+    for pattern, route in routes:
+        if pattern.match(path):
+            methods |= route
+    if methods and 'GET' not in methods:
+        return None
+    return 'GET'
+
+
+async def discover_routes(client):
+    """Routes from the server's OpenAPI document; empty when it is not served."""
+    try:
+        r = await client.get('/openapi.json')
+        return route_methods(r.json()) if r.status_code == 200 else []
+    except (httpx.HTTPError, ValueError):
+        return []
+
+
+def build_mix(endpoints, mix_file=None, default_weight=1.0):
+    weights = {}
+    if mix_file:
+        with open(mix_file, 'r', encoding='utf-8') as f:
+            weights = json.load(f)
+    mix = [(e, float(weights.get(e, default_weight))) for e in endpoints]
+    return [(e, w) for e, w in mix if w > 0]
+
+
+async def _worker(client, mix, methods, deadline, remaining, samples, rng):
+    endpoints = [e for e, _ in mix]
+    weights = [w for _, w in mix]
+    while time.perf_counter() < deadline:
+        if remaining is not None:
+            if remaining[0] <= 0:
+                return
+            remaining[0] -= 1
+        endpoint = rng.choices(endpoints, weights)[0]
+        start = time.perf_counter()
+        try:
+            if methods[endpoint] == 'POST':
+                r = await client.post(endpoint, json=POST_EXAMPLES[endpoint])
+            else:
+                r = await client.get(endpoint)
+            error = r.status_code if r.status_code >= 400 else None
+        except httpx.HTTPError as exc:
+            error = type(exc).__name__
+        samples.append(
+            (endpoint, (time.perf_counter() - start) * 1000, error))
+
+
+async def run_load(base_url, menus, concurrency, duration, total_requests, mix_file, default_weight, seed):
+    limits = httpx.Limits(max_connections=concurrency,
+                          max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=HEADERS, limits=limits, timeout=30) as client:
+        endpoints = await discover_endpoints(client, menus)
+        routes = await discover_routes(client)
+        methods = {e: request_method(e, routes) for e in endpoints}
+        skipped = [e for e in endpoints if methods[e] is None]
+        if skipped:
+            print(f'Skipping {len(skipped)} POST-only endpoints without a POST_EXAMPLES body:')
+            for endpoint in skipped:
+                print('  ' + endpoint)
+        mix = build_mix([e for e in endpoints if methods[e]], mix_file, default_weight)
+        if not mix:
+            raise SystemExit('No endpoints discovered / selected by the mix')
+        print(f'Driving {len(mix)} endpoints with concurrency={concurrency}')
+
+        samples = []
+        remaining = [total_requests] if total_requests else None
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*[
+            _worker(client, mix, methods, deadline, remaining,
+                    samples, random.Random(seed + i))
+            for i in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+
+    report = summarize(samples, elapsed)
+    report['config'] = {'base_url': base_url, 'concurrency': concurrency, 'duration': duration,
+                        'total_requests': total_requests, 'mix': dict(mix), 'skipped': skipped,
+                        'seed': seed}
+    return report
+
+
+def prepare_sqlite_db(db_path):
+    """Create all tables in a fresh SQLite file so the app serves DB-backed menus."""
+    for path in (db_path, f'{db_path}-wal', f'{db_path}-shm', f'{db_path}-journal'):
+        Path(path).unlink(missing_ok=True)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    sys.path.insert(0, str(ROOT))
+    from sqlalchemy import create_engine
+    from app.models import Base
+    engine = create_engine(os.environ['DATABASE_URL'])
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+
+def start_server(port, db_path):
+    prepare_sqlite_db(db_path)
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}',
+               LOG_LEVEL=os.getenv('LOG_LEVEL', 'WARNING'))
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app',
+            '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        cwd=str(ROOT), env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            if httpx.get(base_url + '/api/health', timeout=1).status_code == 200:
+                return proc, base_url
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            raise SystemExit('Server exited during startup')
+        time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit('Server did not become healthy in time')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Load test chatbot menu endpoints')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--start-server', action='store_true',
+                        help='start uvicorn locally on a throwaway SQLite database')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--db-path', default=str(ROOT / 'loadtest.db'))
+    parser.add_argument('--menu', action='append', dest='menus',
+                        help='menu URL to discover endpoints from (repeatable)')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30.0,
+                        help='seconds to run')
+    parser.add_argument('--requests', type=int, default=0,
+                        help='stop after this many requests (0 = duration only)')
+    parser.add_argument('--mix', help='JSON file of api_endpoint -> weight')
+    parser.add_argument('--default-weight', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--output', default=str(ROOT / 'tools' / 'load_test_results.json'))
+    args = parser.parse_args(argv)
+
+    proc = None
+    base_url = args.base_url
+    if args.start_server:
+        proc, base_url = start_server(args.port, args.db_path)
+    try:
+        report = asyncio.run(run_load(base_url, args.menus or DEFAULT_MENUS, args.concurrency,
+                                      args.duration, args.requests, args.mix, args.default_weight, args.seed))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"{report['total_requests']} requests in {report['duration_s']}s "
+          f"({report['throughput_rps']} req/s, error rate {report['error_rate']})")
+    for endpoint, r in report['routes'].items():
+        lat = r['latency_ms']
+        print(f"  {endpoint}: n={r['requests']} p50={lat['p50']} p95={lat['p95']} "
+              f"p99={lat['p99']} err={r['error_rate']}")
+    print(f'\nSaved results to {args.output}')
+
+
+if __name__ == '__main__':
+    main()